@@ -3,6 +3,9 @@ from __future__ import absolute_import
 # noinspection PyUnresolvedReferences
 from .ABuPickStockExecute import do_pick_stock_work
 # noinspection PyUnresolvedReferences
-from .ABuPickTimeExecute import do_symbols_with_same_factors, do_symbols_with_diff_factors
+from .ABuPickTimeExecute import do_symbols_with_same_factors, do_symbols_with_diff_factors, \
+    do_symbols_with_batch_factors
 # noinspection all
 from . import ABuPickTimeWorker as pick_time_worker
+# noinspection all
+from . import ABuPickTimeMaster as pick_time_master
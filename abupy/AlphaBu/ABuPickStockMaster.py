@@ -15,10 +15,10 @@ from .ABuPickStockExecute import do_pick_stock_work, do_pick_stock_thread_work
 from ..CoreBu import ABuEnv
 from ..CoreBu.ABuEnv import EMarketDataFetchMode
 from ..CoreBu.ABuEnvProcess import AbuEnvProcess
-from ..MarketBu.ABuMarket import split_k_market, all_symbol
+from ..MarketBu.ABuMarket import all_symbol
 from ..MarketBu import ABuMarket
 from ..CoreBu.ABuFixes import partial
-from ..CoreBu.ABuParallel import delayed, Parallel
+from ..CoreBu.ABuParallel import delayed, Parallel, split_parallel_task, parallel_jobs
 from ..CoreBu.ABuDeprecated import AbuDeprecated
 
 
@@ -58,11 +58,11 @@ class AbuPickStockMaster(object):
                 n_process_pick_stock = 1
 
             # 根据输入的choice_symbols和要并行的进程数，分配symbol到n_process_pick_stock进程中
-            process_symbols = split_k_market(n_process_pick_stock, market_symbols=choice_symbols)
+            process_symbols = split_parallel_task(n_process_pick_stock, choice_symbols)
 
-            # 因为切割会有余数，所以将原始设置的进程数切换为分割好的个数, 即32 -> 33 16 -> 17
+            # 根据切割好的子序列确定并行的进程数
             if n_process_pick_stock > 1:
-                n_process_pick_stock = len(process_symbols)
+                n_process_pick_stock = parallel_jobs(n_process_pick_stock, process_symbols)
 
             parallel = Parallel(
                 n_jobs=n_process_pick_stock, verbose=0, pre_dispatch='2*n_jobs')
@@ -10,13 +10,16 @@ from __future__ import print_function
 from __future__ import division
 
 import logging
+import time
 
 import numpy as np
 import pandas as pd
 from enum import Enum
 
+from . import ABuPickTimeWorker as pick_time_worker
 from .ABuPickTimeWorker import AbuPickTimeWorker
 from ..CoreBu.ABuEnvProcess import add_process_env_sig
+from ..MarketBu import ABuSymbolPd
 from ..TradeBu import ABuTradeExecute
 from ..TradeBu import ABuTradeProxy
 from ..TradeBu.ABuKLManager import AbuKLManager
@@ -77,6 +80,17 @@ def _do_pick_time_work(capital, buy_factors, sell_factors, kl_pd, benchmark, dra
     return [orders_pd, action_pd], EFitError.FIT_OK
 
 
+def _sort_pick_time_out(orders_pd, action_pd):
+    """内部方法：择时结果action_pd按照时间及行为排序，orders_pd按照买入时间排序"""
+    # 要sort'Date', 'action'两项，不然之后的行apply_action_to_capital后有问题
+    # noinspection PyUnresolvedReferences
+    action_pd = action_pd.sort_values(['Date', 'action'])
+    action_pd.index = np.arange(0, action_pd.shape[0])
+    # noinspection PyUnresolvedReferences
+    orders_pd = orders_pd.sort_values(['buy_date'])
+    return orders_pd, action_pd
+
+
 @add_process_env_sig
 def do_symbols_with_same_factors(target_symbols, benchmark, buy_factors, sell_factors, capital,
                                  apply_capital=True, kl_pd_manager=None,
@@ -99,8 +113,9 @@ def do_symbols_with_same_factors(target_symbols, benchmark, buy_factors, sell_fa
         kl_pd_manager = AbuKLManager(benchmark, capital)
 
     def _batch_symbols_with_same_factors(p_buy_factors, p_sell_factors):
-        r_orders_pd = None
-        r_action_pd = None
+        # 每一个交易对象生成的orders_pd和action_pd先收集起来，最后只进行一次concat
+        r_orders_pds = list()
+        r_action_pds = list()
         r_all_fit_symbols_cnt = 0
         # 启动多进程进度显示AbuMulPidProgress
         with AbuMulPidProgress(len(target_symbols), 'pick times complete', show_progress=show_progress) as progress:
@@ -142,20 +157,16 @@ def do_symbols_with_same_factors(target_symbols, benchmark, buy_factors, sell_fa
                 if ret is None:
                     continue
                 r_all_fit_symbols_cnt += 1
-                # 连接每一个交易对象生成的orders_pd和action_pd
-                r_orders_pd = ret[0] if r_orders_pd is None else pd.concat([r_orders_pd, ret[0]])
-                r_action_pd = ret[1] if r_action_pd is None else pd.concat([r_action_pd, ret[1]])
-        return r_orders_pd, r_action_pd, r_all_fit_symbols_cnt
+                r_orders_pds.append(ret[0])
+                r_action_pds.append(ret[1])
+        if len(r_orders_pds) == 0:
+            return None, None, r_all_fit_symbols_cnt
+        # 连接每一个交易对象生成的orders_pd和action_pd
+        return pd.concat(r_orders_pds), pd.concat(r_action_pds), r_all_fit_symbols_cnt
 
     orders_pd, action_pd, all_fit_symbols_cnt = _batch_symbols_with_same_factors(buy_factors, sell_factors)
     if orders_pd is not None and action_pd is not None:
-
-        # 要sort'Date', 'action'两项，不然之后的行apply_action_to_capital后有问题
-        # noinspection PyUnresolvedReferences
-        action_pd = action_pd.sort_values(['Date', 'action'])
-        action_pd.index = np.arange(0, action_pd.shape[0])
-        # noinspection PyUnresolvedReferences
-        orders_pd = orders_pd.sort_values(['buy_date'])
+        orders_pd, action_pd = _sort_pick_time_out(orders_pd, action_pd)
         if apply_capital:
             # 如果非多进程环境下开始融合资金对象
             ABuTradeExecute.apply_action_to_capital(capital, action_pd, kl_pd_manager, show_progress=show_progress)
@@ -163,6 +174,79 @@ def do_symbols_with_same_factors(target_symbols, benchmark, buy_factors, sell_fa
     return orders_pd, action_pd, all_fit_symbols_cnt
 
 
+def do_symbols_with_batch_factors(target_symbols, benchmark, factors_batch, capitals, kl_pd_manager=None,
+                                  show_progress=True):
+    """
+    输入为多个择时交易对象，以及多组择时买入，卖出因子序列，以交易对象为外层循环：每一个交易对象的金融时间序列，
+    以及合并之前1年数据的金融时间序列只准备一次，多组因子生成的择时对象通过batch_fit共用一次交易日递进，
+    每一组因子的择时结果与do_symbols_with_same_factors(apply_capital=False)的返回结果一致
+    :param target_symbols: 多个择时交易对象序列
+    :param benchmark: 交易基准对象，AbuBenchmark实例对象
+    :param factors_batch: 多组因子序列，序列中的对象为(buy_factors, sell_factors)
+    :param capitals: 每一组因子对应的AbuCapital实例对象序列
+    :param kl_pd_manager: 金融时间序列管理对象，AbuKLManager实例
+    :param show_progress: 进度条显示，默认True
+    :return: 每一组因子对应的(orders_pd, action_pd, all_fit_symbols_cnt)组成的序列
+    """
+    if kl_pd_manager is None:
+        kl_pd_manager = AbuKLManager(benchmark, capitals[0])
+
+    batch_orders_pd = [list() for _ in factors_batch]
+    batch_action_pd = [list() for _ in factors_batch]
+    batch_fit_symbols_cnt = [0] * len(factors_batch)
+
+    def _work_ret(ind, worker, kl_pd):
+        """一组因子的择时对象完成择时后，与_do_pick_time_work一样生成orders_pd，action_pd并记录"""
+        if len(worker.orders) == 0:
+            return
+        orders_pd, action_pd, _ = ABuTradeProxy.trade_summary(worker.orders, kl_pd, draw=False, show_info=False)
+        batch_orders_pd[ind].append(orders_pd)
+        batch_action_pd[ind].append(action_pd)
+        batch_fit_symbols_cnt[ind] += 1
+
+    with AbuMulPidProgress(len(target_symbols), 'pick times batch complete', show_progress=show_progress) as progress:
+        for epoch, target_symbol in enumerate(target_symbols):
+            progress.show(epoch + 1)
+            try:
+                kl_pd = kl_pd_manager.get_pick_time_kl_pd(target_symbol)
+            except Exception as e:
+                logging.exception(e)
+                continue
+            if kl_pd is None or kl_pd.shape[0] == 0:
+                continue
+
+            try:
+                combine_kl_pd = ABuSymbolPd.combine_pre_kl_pd(kl_pd, n_folds=1)
+                workers = [AbuPickTimeWorker(capital, kl_pd, benchmark, buy_factors, sell_factors,
+                                             combine_kl_pd=combine_kl_pd)
+                           for (buy_factors, sell_factors), capital in zip(factors_batch, capitals)]
+                pick_time_worker.batch_fit(workers)
+            except Exception as e:
+                logging.exception(e)
+                workers = None
+
+            for ind, ((buy_factors, sell_factors), capital) in enumerate(zip(factors_batch, capitals)):
+                try:
+                    if workers is None:
+                        # 批量择时失败，回退为每一组因子独立择时，与do_symbols_with_same_factors的错误处理保持一致
+                        worker = AbuPickTimeWorker(capital, kl_pd, benchmark, buy_factors, sell_factors)
+                        worker.fit()
+                    else:
+                        worker = workers[ind]
+                    _work_ret(ind, worker, kl_pd)
+                except Exception as e:
+                    logging.exception(e)
+
+    out = []
+    for orders_pds, action_pds, all_fit_symbols_cnt in zip(batch_orders_pd, batch_action_pd, batch_fit_symbols_cnt):
+        if len(orders_pds) == 0:
+            out.append((None, None, all_fit_symbols_cnt))
+            continue
+        orders_pd, action_pd = _sort_pick_time_out(pd.concat(orders_pds), pd.concat(action_pds))
+        out.append((orders_pd, action_pd, all_fit_symbols_cnt))
+    return out
+
+
 def do_symbols_with_diff_factors(target_symbols, benchmark, factor_dict, capital, apply_capital=True,
                                  kl_pd_manager=None,
                                  show=False,
@@ -187,3 +271,46 @@ def do_symbols_with_diff_factors(target_symbols, benchmark, factor_dict, capital
                                         show=show,
                                         back_target_symbols=back_target_symbols,
                                         func_factors=_func_factors)
+
+
+def bench_pick_time_loop(target_symbols, benchmark, buy_factors, sell_factors, capital, kl_pd_manager=None):
+    """
+    对比apply(axis=1)模式与bar循环模式下每一个交易对象的择时耗时，只计算AbuPickTimeWorker.fit的耗时，
+    且两种模式下生成的order数量一并返回，用来确认bar循环模式与apply模式的择时结果一致
+    :param target_symbols: 多个择时交易对象序列
+    :param benchmark: 交易基准对象，AbuBenchmark实例对象
+    :param buy_factors: 买入因子序列
+    :param sell_factors: 卖出因子序列
+    :param capital: AbuCapital实例对象
+    :param kl_pd_manager: 金融时间序列管理对象，AbuKLManager实例
+    :return: pd.DataFrame对象，index为symbol，columns为apply，bar，speed_up，apply_orders，bar_orders
+    """
+    if kl_pd_manager is None:
+        kl_pd_manager = AbuKLManager(benchmark, capital)
+
+    def _fit_consume(kl_pd, enable_bar_loop):
+        """使用指定模式进行一次择时，返回耗时以及生成的order数量"""
+        keep_mode = pick_time_worker.g_enable_bar_loop
+        pick_time_worker.g_enable_bar_loop = enable_bar_loop
+        try:
+            # 使用kl_pd的拷贝，避免两种模式之间相互影响，拷贝后需要重新赋予name
+            kl_pd_cp = kl_pd.copy()
+            kl_pd_cp.name = kl_pd.name
+            worker = AbuPickTimeWorker(capital, kl_pd_cp, benchmark, buy_factors, sell_factors)
+            start = time.time()
+            worker.fit()
+            return time.time() - start, len(worker.orders)
+        finally:
+            pick_time_worker.g_enable_bar_loop = keep_mode
+
+    bench = []
+    for target_symbol in target_symbols:
+        kl_pd = kl_pd_manager.get_pick_time_kl_pd(target_symbol)
+        if kl_pd is None or kl_pd.shape[0] == 0:
+            continue
+        apply_consume, apply_orders = _fit_consume(kl_pd, False)
+        bar_consume, bar_orders = _fit_consume(kl_pd, True)
+        bench.append([target_symbol, apply_consume, bar_consume, apply_consume / bar_consume, apply_orders,
+                      bar_orders])
+    return pd.DataFrame(bench, columns=['symbol', 'apply', 'bar', 'speed_up', 'apply_orders',
+                                        'bar_orders']).set_index('symbol')
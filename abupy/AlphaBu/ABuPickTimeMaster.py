@@ -14,14 +14,20 @@ from .ABuPickTimeExecute import do_symbols_with_same_factors
 from ..CoreBu.ABuEnvProcess import AbuEnvProcess
 from ..CoreBu import ABuEnv
 from ..CoreBu.ABuEnv import EMarketDataFetchMode
-from ..MarketBu.ABuMarket import split_k_market
 from ..TradeBu import ABuTradeExecute
 from ..TradeBu.ABuKLManager import AbuKLManager
-from ..CoreBu.ABuParallel import delayed, Parallel
+from ..CoreBu.ABuParallel import delayed, Parallel, split_parallel_task, parallel_jobs
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
 
+"""
+    是否开启择时金融时间序列memmap池，开启后主进程将所有择时金融时间序列一次性写入只读memmap池，
+    择时子进程只接收自己负责的symbol在池中的索引，不再pickle传递装载了所有数据的kl_pd_manager，
+    子进程中的金融时间序列copy-on-write方式读取，修改不会影响其它子进程，默认关闭
+"""
+g_enable_kl_pool = False
+
 
 class AbuPickTimeMaster(object):
     """择时并行多任务调度类"""
@@ -55,11 +61,12 @@ class AbuPickTimeMaster(object):
             # 因为下面要根据n_process_pick_time来split_k_market
             n_process_pick_time = ABuEnv.g_cpu_cnt
 
-        # 将target_symbols切割为n_process_pick_time个子序列，这样可以每个进程处理一个子序列
-        process_symbols = split_k_market(n_process_pick_time, market_symbols=target_symbols)
+        # 将target_symbols切割为子序列，这样可以每个进程处理一个子序列，动态调度模式下使用金融时间序列长度做为代价提示
+        process_symbols = split_parallel_task(n_process_pick_time, target_symbols,
+                                              costs=kl_pd_manager.pick_time_kl_costs(target_symbols))
 
-        # 因为切割会有余数，所以将原始设置的进程数切换为分割好的个数, 即32 -> 33 16 -> 17
-        n_process_pick_time = len(process_symbols)
+        # 根据切割好的子序列确定并行的进程数
+        n_process_pick_time = parallel_jobs(n_process_pick_time, process_symbols)
 
         parallel = Parallel(
             n_jobs=n_process_pick_time, verbose=0, pre_dispatch='2*n_jobs')
@@ -70,27 +77,59 @@ class AbuPickTimeMaster(object):
             # 因为上面已经并行或者单进程进行数据采集kl_pd_manager，之后的并行，为确保hdf5不会多进程读写设置LOCAL
             ABuEnv.g_data_fetch_mode == EMarketDataFetchMode.E_DATA_FETCH_FORCE_LOCAL
 
+        # 多进程择时情况下使用memmap池，单进程在主进程中运行，直接使用kl_pd_manager
+        use_kl_pool = g_enable_kl_pool and n_process_pick_time > 1
+        if use_kl_pool:
+            kl_pd_manager.dump_pick_time_pool()
+
+        def _sub_kl_pd_manager(choice_symbols):
+            """每个并行的进程使用的金融时间序列管理对象，使用memmap池时只携带choice_symbols的池索引"""
+            return kl_pd_manager.pool_sub_manager(choice_symbols) if use_kl_pool else kl_pd_manager
+
         # do_symbols_with_same_factors被装饰器add_process_env_sig装饰，需要进程间内存拷贝对象AbuEnvProcess
         p_nev = AbuEnvProcess()
-        # 每个并行的进程通过do_symbols_with_same_factors及自己独立的子序列独立工作，注意kl_pd_manager装载了所有需要的数据
-        out = parallel(delayed(do_symbols_with_same_factors)(choice_symbols, benchmark, buy_factors, sell_factors,
-                                                             capital, apply_capital=False,
-                                                             kl_pd_manager=kl_pd_manager, env=p_nev,
-                                                             show_progress=show_progress)
-                       for choice_symbols in process_symbols)
+        try:
+            # 每个并行的进程通过do_symbols_with_same_factors及自己独立的子序列独立工作
+            out = parallel(delayed(do_symbols_with_same_factors)(choice_symbols, benchmark, buy_factors, sell_factors,
+                                                                 capital, apply_capital=False,
+                                                                 kl_pd_manager=_sub_kl_pd_manager(choice_symbols),
+                                                                 env=p_nev, show_progress=show_progress)
+                           for choice_symbols in process_symbols)
+        finally:
+            if use_kl_pool:
+                kl_pd_manager.clear_pick_time_pool()
         # 择时并行结束后恢复之前的数据获取模式
         ABuEnv.g_data_fetch_mode = tmp_fetch_mode
-        orders_pd = None
-        action_pd = None
+        return cls.merge_pick_time_out(target_symbols, out, capital, kl_pd_manager, show_progress=show_progress)
+
+    @classmethod
+    def merge_pick_time_out(cls, target_symbols, out, capital, kl_pd_manager, show_progress=True):
+        """
+        合并多个择时任务子序列的结果，恢复target_symbols中的顺序后按照时间及行为排序，最后作用在资金上
+        :param target_symbols: 多个择时交易对象序列
+        :param out: 每一个子序列的择时结果序列，序列中的对象为(orders_pd, action_pd, all_fit_symbols_cnt)
+        :param capital: AbuCapital实例对象
+        :param kl_pd_manager: 金融时间序列管理对象，AbuKLManager实例
+        :param show_progress: 显示进度条，透传apply_action_to_capital，默认True
+        :return: (orders_pd, action_pd, all_fit_symbols_cnt)
+        """
+        orders_pds = list()
+        action_pds = list()
         all_fit_symbols_cnt = 0
-        for sub_out in out:
-            # 将每个子序列进程的处理结果进行合并
-            sub_orders_pd, sub_action_pd, sub_all_fit_symbols_cnt = sub_out
-            orders_pd = sub_orders_pd if orders_pd is None else pd.concat([orders_pd, sub_orders_pd])
-            action_pd = sub_action_pd if action_pd is None else pd.concat([action_pd, sub_action_pd])
+        for sub_orders_pd, sub_action_pd, sub_all_fit_symbols_cnt in out:
+            if sub_orders_pd is not None and sub_action_pd is not None:
+                orders_pds.append(sub_orders_pd)
+                action_pds.append(sub_action_pd)
             all_fit_symbols_cnt += sub_all_fit_symbols_cnt
+        # 将每个子序列进程的处理结果一次进行合并
+        orders_pd = pd.concat(orders_pds) if len(orders_pds) > 0 else None
+        action_pd = pd.concat(action_pds) if len(action_pds) > 0 else None
 
         if orders_pd is not None and action_pd is not None:
+            # 子进程的结果按照任务块的顺序合并，首先恢复为target_symbols中的顺序，使同一交易日的行为顺序与单进程择时一致
+            symbol_order = {target_symbol: ind for ind, target_symbol in enumerate(target_symbols)}
+            action_pd = action_pd.iloc[np.argsort(action_pd['symbol'].map(symbol_order).values, kind='mergesort')]
+            orders_pd = orders_pd.iloc[np.argsort(orders_pd['symbol'].map(symbol_order).values, kind='mergesort')]
             # 将合并后的结果按照时间及行为进行排序
             # noinspection PyUnresolvedReferences
             action_pd = action_pd.sort_values(['Date', 'action'])
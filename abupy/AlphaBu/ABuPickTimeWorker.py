@@ -11,6 +11,7 @@ from __future__ import print_function
 import copy
 
 import numpy as np
+import pandas as pd
 
 from ..MarketBu import ABuSymbolPd
 from ..FactorBuyBu.ABuFactorBuyBase import AbuFactorBuyBase
@@ -29,24 +30,82 @@ __weixin__ = 'abu_quant'
 """
 g_natural_long_task = True
 
+"""
+    是否使用bar循环模式进行交易日递进择时，默认关闭即使用kl_pd.apply(axis=1)的方式，如需开启使用下面代码：
+    abupy.alpha.pick_time_worker.g_enable_bar_loop = True
+    bar循环模式预先抽取kl_pd每一列的序列，每一个交易日只构造轻量的AbuKLBar对象传递给因子，
+    避免了apply中每一个交易日构造完整pd.Series的开销，因子中通过today.close，today['atr21']等方式
+    访问当日数据不受影响，但today不再是pd.Series对象，如因子中需要pd.Series的方法使用today.to_series()
+"""
+g_enable_bar_loop = False
+
+
+class AbuKLBar(object):
+    """bar循环模式下的今日交易数据视图，只持有预先抽取的列序列以及当日序号，按需读取列中当日的值"""
+
+    __slots__ = ('_columns', '_index', '_ind', 'exec_week', 'exec_month')
+
+    def __init__(self, columns, index, ind):
+        """
+        :param columns: dict对象，key为kl_pd列名，value为对应列的np.array序列
+        :param index: kl_pd.index，today.name即index中对应当日的值
+        :param ind: 当日在kl_pd中的序号
+        """
+        self._columns = columns
+        self._index = index
+        self._ind = ind
+
+    def __getattr__(self, item):
+        """today.close等属性访问，映射为对应列序列中当日的值"""
+        try:
+            return self._columns[item][self._ind]
+        except KeyError:
+            raise AttributeError('AbuKLBar has no attribute {}'.format(item))
+
+    def __getitem__(self, item):
+        """today['atr21']等key访问，映射为对应列序列中当日的值"""
+        return self._columns[item][self._ind]
+
+    def __contains__(self, item):
+        return item in self._columns
+
+    @property
+    def name(self):
+        """与apply(axis=1)中pd.Series的name保持一致，即当日的index"""
+        return self._index[self._ind]
+
+    def to_series(self):
+        """转换为apply(axis=1)模式下的pd.Series对象，供需要pd.Series方法的因子使用"""
+        return pd.Series([col[self._ind] for col in self._columns.values()], index=list(self._columns.keys()),
+                         name=self.name)
+
+    def __str__(self):
+        """打印对象显示：与pd.Series一致"""
+        return str(self.to_series())
+
+    __repr__ = __str__
+
 
 # noinspection PyAttributeOutsideInit
 class AbuPickTimeWorker(AbuPickTimeWorkBase):
     """择时类"""
 
-    def __init__(self, cap, kl_pd, benchmark, buy_factors, sell_factors):
+    def __init__(self, cap, kl_pd, benchmark, buy_factors, sell_factors, combine_kl_pd=None):
         """
         :param cap: 资金类AbuCapital实例化对象
         :param kl_pd: 择时时间段交易数据
         :param benchmark: 交易基准对象，AbuBenchmark实例对象
         :param buy_factors: 买入因子序列，序列中的对象为dict，每一个dict针对一个具体因子
         :param sell_factors: 卖出因子序列，序列中的对象为dict，每一个dict针对一个具体因子
+        :param combine_kl_pd: 合并回测之前1年数据的交易数据，默认None即内部通过kl_pd生成，
+                              多个择时对象共用同一个kl_pd时可传入一次生成的结果
         """
         self.capital = cap
         # 回测阶段kl
         self.kl_pd = kl_pd
         # 合并加上回测之前1年的数据，为了生成特征数据
-        self.combine_kl_pd = ABuSymbolPd.combine_pre_kl_pd(self.kl_pd, n_folds=1)
+        self.combine_kl_pd = ABuSymbolPd.combine_pre_kl_pd(self.kl_pd, n_folds=1) \
+            if combine_kl_pd is None else combine_kl_pd
         # 如特别在乎效率性能，打开下面注释的方式，只在g_enable_ml_feature模式下开启, 注释上一行
         # self.combine_kl_pd = ABuSymbolPd.combine_pre_kl_pd(self.kl_pd,
         #                                                    n_folds=1) if ABuEnv.g_enable_ml_feature else None
@@ -176,7 +235,7 @@ class AbuPickTimeWorker(AbuPickTimeWorkBase):
         自然月在每个月末最后一天进行择时，否则就以
         天数作为触发条件，这个时候定性任务本身的性质
         只是以时间跨度作为阀值，触发条件
-        :param today: 对self.kl_pd apply操作，且axis＝1结果为一天的交易数据
+        :param today: 对self.kl_pd apply操作，且axis＝1结果为一天的交易数据，bar循环模式下为AbuKLBar对象
         :return:
         """
         if self.task_pg is not None:
@@ -209,10 +268,24 @@ class AbuPickTimeWorker(AbuPickTimeWorkBase):
         """
             根据交易数据，因子等输入数据，拟合择时
         """
+        self.mark_long_task(self.kl_pd)
+        if g_enable_bar_loop:
+            # 通过预先抽取的列序列进行交易日递进择时
+            self._bar_loop()
+        else:
+            # 通过pandas apply进行交易日递进择时
+            self.kl_pd.apply(self._task_loop, axis=1)
+
+        if self.task_pg is not None:
+            self.task_pg.close_ui_progress()
+
+    @staticmethod
+    def mark_long_task(kl_pd):
+        """在kl_pd中添加自然周，自然月任务标记列week_task，month_task"""
         if g_natural_long_task:
             """如果要进行自然周，自然月择时任务，需要在kl_pd中添加自然周，自然月标记"""
             # 自然周: 每个周五进行标记
-            self.kl_pd['week_task'] = np.where(self.kl_pd.date_week == 4, 1, 0)
+            kl_pd['week_task'] = np.where(kl_pd.date_week == 4, 1, 0)
             """
                 自然月: 即前后两个日期，相互减，得到的数 > 60 必然为月末，20140801 - 20140731
                 没有使用时间api，因为这样做运行效率快
@@ -237,12 +310,17 @@ class AbuPickTimeWorker(AbuPickTimeWorkBase):
                 2014-09-03     1.0
                 >>>>
             """
-            self.kl_pd['month_task'] = np.where(self.kl_pd.shift(-1)['date'] - self.kl_pd['date'] > 60, 1, 0)
-        # 通过pandas apply进行交易日递进择时
-        self.kl_pd.apply(self._task_loop, axis=1)
+            kl_pd['month_task'] = np.where(kl_pd.shift(-1)['date'] - kl_pd['date'] > 60, 1, 0)
 
-        if self.task_pg is not None:
-            self.task_pg.close_ui_progress()
+    def _bar_loop(self):
+        """
+            bar循环模式：一次性抽取kl_pd每一列的np.array序列，按交易日序号构造AbuKLBar
+            做为today传递给_task_loop，与apply(axis=1)的执行顺序，因子调用方式一致
+        """
+        columns = {col: self.kl_pd[col].values for col in self.kl_pd.columns}
+        index = self.kl_pd.index
+        for ind in range(self.kl_pd.shape[0]):
+            self._task_loop(AbuKLBar(columns, index, ind))
 
     def init_sell_factors(self, sell_factors):
         """
@@ -321,3 +399,31 @@ class AbuPickTimeWorker(AbuPickTimeWorkBase):
                                              self.sell_factors))
         self.month_sell_factors = list(filter(lambda sell_factor: hasattr(sell_factor, 'fit_month'),
                                               self.sell_factors))
+
+
+def batch_fit(workers):
+    """
+    多个择时对象共用同一个kl_pd时，批量进行择时：只添加一次自然周，自然月任务标记，只进行一次交易日递进，
+    每一个交易日的today（apply中的pd.Series或者bar循环模式下的AbuKLBar）只构造一次，依次交给每一个择时对象的
+    _task_loop，每一个择时对象内部的因子，资金，orders相互独立，择时结果与逐个fit一致
+    :param workers: AbuPickTimeWorker对象序列，序列中所有对象的kl_pd必须为同一个对象
+    """
+    if len(workers) == 0:
+        return
+    kl_pd = workers[0].kl_pd
+    if any(worker.kl_pd is not kl_pd for worker in workers):
+        raise ValueError('batch_fit workers must share the same kl_pd!')
+
+    AbuPickTimeWorker.mark_long_task(kl_pd)
+
+    def _task_loop(today):
+        for worker in workers:
+            worker._task_loop(today)
+
+    if g_enable_bar_loop:
+        columns = {col: kl_pd[col].values for col in kl_pd.columns}
+        index = kl_pd.index
+        for ind in range(kl_pd.shape[0]):
+            _task_loop(AbuKLBar(columns, index, ind))
+    else:
+        kl_pd.apply(_task_loop, axis=1)
@@ -423,6 +423,8 @@ class EDataCacheType(Enum):
     E_DATA_CACHE_CSV = 1
     """适合分布式扩展，存贮空间需要大"""
     E_DATA_CACHE_MONGODB = 2
+    """按列存储定长类型的npy文件，读取最快，多进程只读memmap读取，不拷贝数据，存贮空间需要大"""
+    E_DATA_CACHE_NPY = 3
 
 
 # """默认金融时间序列数据缓存类型为HDF5，单机固态硬盘推荐HDF5，非固态硬盘使用CSV，否则量大后hdf5写入速度无法接受"""
@@ -432,6 +434,8 @@ g_data_cache_type = EDataCacheType.E_DATA_CACHE_CSV
 
 """csv模式下的存储路径"""
 g_project_kl_df_data_csv = path.join(g_project_data_dir, 'csv')
+"""npy模式下的存储路径"""
+g_project_kl_df_data_npy = path.join(g_project_data_dir, 'npy')
 
 # ＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊ 数据源 end   ＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊＊
 
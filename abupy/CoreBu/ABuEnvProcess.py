@@ -8,14 +8,18 @@ from __future__ import print_function
 from __future__ import division
 
 import functools
+import hashlib
 
 # noinspection PyUnresolvedReferences
-from ..CoreBu.ABuFixes import filter
+from ..CoreBu.ABuFixes import filter, pickle
 from ..CoreBu.ABuFixes import signature, Parameter
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
 
+"""子进程中最后一次拷贝的主进程设置的md5，常驻进程池中的子进程在主进程设置没有改变时不再重复拷贝"""
+_copied_env_md5 = None
+
 
 def add_process_env_sig(func):
     """
@@ -73,6 +77,12 @@ class AbuEnvProcess(object):
             for sig in sig_env:
                 # 模块中的属性拷贝为类属性变量，key＝module_name_sig
                 setattr(self, '{}_{}'.format(module_name, sig), module.__dict__[sig])
+        # 所有拷贝的设置的md5，子进程通过比较md5确定主进程设置是否发生了改变，无法计算的情况下每次都进行拷贝
+        env_items = sorted(self.__dict__.items(), key=lambda item: item[0])
+        try:
+            self.env_md5 = hashlib.md5(pickle.dumps(env_items, protocol=2)).hexdigest()
+        except Exception:
+            self.env_md5 = None
 
     # noinspection PyMethodMayBeStatic
     def register_module(self):
@@ -100,7 +110,15 @@ class AbuEnvProcess(object):
                 ABuFactorCloseAtrNStop, ABuMarket, ABuFactorPreAtrNStop, ABuPickSimilarNTop]
 
     def copy_process_env(self):
-        """为子进程拷贝主进程中的设置执行，在add_process_env_sig装饰器中调用，外部不应主动使用"""
+        """
+        为子进程拷贝主进程中的设置执行，在add_process_env_sig装饰器中调用，外部不应主动使用，
+        常驻进程池中的子进程已经拷贝过相同的设置时直接返回
+        """
+        global _copied_env_md5
+        env_md5 = getattr(self, 'env_md5', None)
+        if env_md5 is not None and env_md5 == _copied_env_md5:
+            return
+
         for module in self.register_module():
             # 迭代注册了的需要拷贝内存设置的模块, 筛选模块中以g_或者_g_开头的, 且不能callable，即不是方法
             sig_env = list(filter(
@@ -114,6 +132,7 @@ class AbuEnvProcess(object):
                 # 为子模块内存变量进行值拷贝
                 module.__dict__[_sig] = val
                 # print(name, val)
+        _copied_env_md5 = env_md5
 
     def __str__(self):
         """打印对象显示：注册需要拷贝内存的模块中在AbuEnvProcess对象属性的映射key值，以及value值"""
@@ -11,13 +11,92 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import atexit
 import functools
+import hashlib
+import heapq
+import inspect
+import os
+import sys
 
 from ..CoreBu import ABuEnv
+# noinspection PyUnresolvedReferences
+from ..CoreBu.ABuFixes import pickle
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
 
+"""
+    是否开启动态任务调度：开启后并行任务切分为多于进程数的小粒度任务块，按照任务代价从大到小提交到进程池的共享队列，
+    空闲的进程从队列中获取下一个任务块，避免静态均分时代价大的任务集中在某个进程中，其它进程在最后空闲等待，
+    默认关闭，即与之前一样按照进程数静态均分任务
+"""
+g_enable_dynamic_schedule = False
+"""动态任务调度模式下平均每个进程分配的任务块数量"""
+g_dynamic_chunks_per_job = 4
+
+"""
+    是否开启常驻进程池：开启后Parallel不再每次创建及销毁ProcessPoolExecutor，多次run_loop_back，GridSearch，
+    AbuCrossVal之间复用同一组子进程，子进程中已经import的模块，CachedUmpManager中缓存的裁判数据等一直保留，
+    适合在notebook或者服务中反复回测的场景，默认关闭，使用shutdown_warm_pool主动关闭常驻进程池，
+    注意子进程中不保留已经加载的金融时间序列，每次回测仍然由主进程传递
+"""
+g_enable_warm_pool = False
+"""常驻进程池：(创建进程池的进程pid，进程数，同步标识，ProcessPoolExecutor对象)"""
+_warm_pool = None
+
+
+def split_parallel_task(n_jobs, tasks, costs=None):
+    """
+    将tasks序列切分为并行任务块序列，静态调度模式下使用split_k_market均分为n_jobs份，
+    动态调度模式下按照costs代价，贪心的将代价大的任务优先分配到当前代价最小的任务块中，
+    共切分n_jobs * g_dynamic_chunks_per_job个代价相近的任务块，任务块按照代价从大到小排列，
+    即代价大的任务块先提交，每个任务块内部保持tasks中的原始顺序
+    :param n_jobs: 并行进程数
+    :param tasks: 待切分的任务序列，eg：symbol序列，因子组合序列
+    :param costs: 每一个任务的代价提示序列，eg：金融时间序列长度，默认None即所有任务代价相同
+    :return: 任务块序列，序列中的每一个元素都是切分好的子任务序列
+    """
+    if not g_enable_dynamic_schedule:
+        # 不在模块中import，避免CoreBu与MarketBu之间的循环引用
+        from ..MarketBu.ABuMarket import split_k_market
+        return split_k_market(n_jobs, market_symbols=tasks)
+
+    tasks = list(tasks)
+    if len(tasks) == 0:
+        return []
+    if costs is None:
+        costs = [1] * len(tasks)
+    n_chunks = min(len(tasks), max(n_jobs, 1) * g_dynamic_chunks_per_job)
+
+    # 任务按照代价从大到小排序，代价相同的保持原始顺序
+    task_order = sorted(range(len(tasks)), key=lambda ind: -costs[ind])
+    # 小顶堆元素：(任务块当前总代价，任务块序号)
+    chunk_heap = [(0, chunk_ind) for chunk_ind in range(n_chunks)]
+    chunk_tasks = [[] for _ in range(n_chunks)]
+    chunk_costs = [0] * n_chunks
+    for task_ind in task_order:
+        chunk_cost, chunk_ind = heapq.heappop(chunk_heap)
+        chunk_tasks[chunk_ind].append(task_ind)
+        chunk_costs[chunk_ind] = chunk_cost + costs[task_ind]
+        heapq.heappush(chunk_heap, (chunk_costs[chunk_ind], chunk_ind))
+
+    chunk_order = sorted(range(n_chunks), key=lambda ind: -chunk_costs[ind])
+    return [[tasks[task_ind] for task_ind in sorted(chunk_tasks[chunk_ind])] for chunk_ind in chunk_order]
+
+
+def parallel_jobs(n_jobs, task_chunks):
+    """
+    根据split_parallel_task切分好的任务块序列确定并行启动的进程数，静态调度模式下切割会有余数，
+    进程数为切分好的任务块个数, 即32 -> 33 16 -> 17，动态调度模式下进程数不超过n_jobs
+    :param n_jobs: 原始设置的并行进程数
+    :param task_chunks: split_parallel_task切分好的任务块序列
+    :return: 并行启动的进程数
+    """
+    if not g_enable_dynamic_schedule:
+        return len(task_chunks)
+    return max(1, min(n_jobs, len(task_chunks)))
+
 # if ABuEnv.g_is_mac_os:
 if False:
     """
@@ -73,14 +152,13 @@ else:
             self.n_jobs = n_jobs
 
         def __call__(self, iterable):
-            """为与joblib并行保持一致，内部使用ProcessPoolExecutor开始工作"""
+            """
+            为与joblib并行保持一致，内部使用ProcessPoolExecutor开始工作，任务数量多于进程数时，
+            空闲的进程从进程池的共享队列中获取下一个任务，返回结果的顺序与任务的提交顺序一致，与完成顺序无关
+            """
 
             result = []
 
-            def when_done(r):
-                """ProcessPoolExecutor每一个进程结束后结果append到result中"""
-                result.append(r.result())
-
             if self.n_jobs <= 0:
                 # 主要为了适配 n_jobs = -1，joblib中启动cpu个数个进程并行执行
                 self.n_jobs = ABuEnv.g_cpu_cnt
@@ -90,14 +168,91 @@ else:
                 for jb in iterable:
                     result.append(jb[0](*jb[1], **jb[2]))
             else:
-                with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
-                    for jb in iterable:
+                pool = _get_warm_pool(self.n_jobs) if g_enable_warm_pool else None
+                if pool is not None:
+                    # 常驻进程池只提交任务，不shutdown
+                    futures = [pool.submit(jb[0], *jb[1], **jb[2]) for jb in iterable]
+                else:
+                    with ProcessPoolExecutor(max_workers=self.n_jobs) as pool:
                         # 这里iterable里每一个元素是delayed.delayed_function保留的tuple
-                        future_result = pool.submit(jb[0], *jb[1], **jb[2])
-                        future_result.add_done_callback(when_done)
+                        futures = [pool.submit(jb[0], *jb[1], **jb[2]) for jb in iterable]
+                for future in futures:
+                    # 按照提交顺序收集结果，出错的任务直接抛出异常，避免调用者拿到不完整的结果
+                    result.append(future.result())
             return result
 
 
+def _warm_pool_token():
+    """
+    常驻进程池的同步标识，由以下几部分计算md5：
+        1. AbuEnvProcess拷贝的设置的md5以及注册的模块集合
+        2. 已经import的abupy模块中所有g_开头的设置，包括没有在AbuEnvProcess中注册的模块，
+           eg：ABuRegUtil.g_enable_regress_deg_kernel，这些设置子进程只能在fork时继承
+        3. __main__中定义的函数及类，进程池创建后在__main__中新定义的函数子进程中无法反序列化
+    任何一项改变后都需要重新创建常驻进程池
+    :return: str对象，md5
+    """
+    from ..CoreBu.ABuEnvProcess import AbuEnvProcess
+    p_nev = AbuEnvProcess()
+    token = hashlib.md5()
+    token.update(str(p_nev.env_md5).encode('utf-8'))
+    token.update(str(sorted(module.__name__ for module in p_nev.register_module())).encode('utf-8'))
+
+    package_name = __name__.split('.')[0]
+    for module_name in sorted(name for name in list(sys.modules.keys()) if name.startswith(package_name)):
+        module = sys.modules[module_name]
+        if module is None:
+            continue
+        for sig, val in sorted(list(vars(module).items()), key=lambda item: item[0]):
+            if not sig.startswith('g_') or callable(val) or inspect.ismodule(val):
+                continue
+            try:
+                val_bytes = pickle.dumps(val, protocol=2)
+            except Exception:
+                val_bytes = repr(val).encode('utf-8')
+            token.update('{}.{}'.format(module_name, sig).encode('utf-8'))
+            token.update(val_bytes)
+
+    main_module = sys.modules.get('__main__')
+    if main_module is not None:
+        # 重新定义的同名函数是新的对象，使用id区分
+        main_defs = sorted('{}:{}'.format(name, id(val)) for name, val in list(vars(main_module).items())
+                           if (inspect.isfunction(val) or inspect.isclass(val))
+                           and getattr(val, '__module__', None) == '__main__')
+        token.update(str(main_defs).encode('utf-8'))
+    return token.hexdigest()
+
+
+def _get_warm_pool(n_jobs):
+    """
+    获取常驻进程池，常驻进程池的进程数不足n_jobs，进程池已经损坏或者同步标识改变的情况下重新创建，
+    fork出的子进程中继承的常驻进程池不属于子进程，子进程中返回None，即子进程中的并行不使用常驻进程池
+    :param n_jobs: 并行启动的进程数
+    :return: ProcessPoolExecutor对象或者None
+    """
+    global _warm_pool
+    if _warm_pool is not None and _warm_pool[0] != os.getpid():
+        return None
+    token = _warm_pool_token()
+    # noinspection PyProtectedMember
+    if _warm_pool is None or _warm_pool[1] < n_jobs or _warm_pool[2] != token \
+            or getattr(_warm_pool[3], '_broken', False):
+        shutdown_warm_pool()
+        _warm_pool = (os.getpid(), n_jobs, token, ProcessPoolExecutor(max_workers=n_jobs))
+    return _warm_pool[3]
+
+
+def shutdown_warm_pool():
+    """关闭常驻进程池，进程退出时自动调用"""
+    global _warm_pool
+    if _warm_pool is not None and _warm_pool[0] == os.getpid():
+        _warm_pool[3].shutdown(wait=True)
+    _warm_pool = None
+
+
+atexit.register(shutdown_warm_pool)
+
+
 def run_in_thread(func, *args, **kwargs):
     """
     多线程工具函数，不涉及返回值等细节处理时使用
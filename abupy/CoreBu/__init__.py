@@ -9,6 +9,7 @@ from .ABuEnv import EMarketSourceType, EMarketTargetType, EMarketSubType, \
     EMarketDataSplitMode, EMarketDataFetchMode, EDataCacheType
 from .ABuBase import AbuParamBase, FreezeAttrMixin, PickleStateMixin
 from .ABuParallel import Parallel, delayed
+from . import ABuParallel as parallel
 from .ABuStore import AbuResultTuple, EStoreAbu
 
 __all__ = [
@@ -21,6 +22,7 @@ __all__ = [
     'PickleStateMixin',
     'Parallel',
     'delayed',
+    'parallel',
     'EMarketSourceType',
     'EMarketTargetType',
     'EMarketSubType',
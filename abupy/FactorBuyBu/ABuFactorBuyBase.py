@@ -423,6 +423,19 @@ class AbuFactorBuyTD(AbuFactorBuyBase):
 class AbuFactorBuyXD(AbuFactorBuyBase):
     """以周期为重要参数的策略，xd代表参数'多少天'如已周期为参数可直接继承使用"""
 
+    _xd_kl = None
+
+    @property
+    def xd_kl(self):
+        """fit_day中使用的周期金融时间序列切片，第一次访问时才进行切片，不使用xd_kl的因子不再每天构造切片"""
+        if self._xd_kl is None:
+            self._xd_kl = self.kl_pd[self.today_ind - self.xd + 1:self.today_ind + 1]
+        return self._xd_kl
+
+    @xd_kl.setter
+    def xd_kl(self, xd_kl):
+        self._xd_kl = xd_kl
+
     def read_fit_day(self, today):
         """
         覆盖base函数完成过滤统计周期内前xd天以及为fit_day中切片周期金融时间序列数据
@@ -443,8 +456,8 @@ class AbuFactorBuyXD(AbuFactorBuyBase):
         if self.today_ind < self.xd - 1:
             return None
 
-        # 完成为fit_day中切片周期金融时间序列数据
-        self.xd_kl = self.kl_pd[self.today_ind - self.xd + 1:self.today_ind + 1]
+        # 为fit_day中切片周期金融时间序列数据，访问xd_kl时才进行切片
+        self.xd_kl = None
 
         return self.fit_day(today)
 
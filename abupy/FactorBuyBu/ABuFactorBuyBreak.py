@@ -8,6 +8,7 @@ from __future__ import print_function
 from __future__ import division
 
 from .ABuFactorBuyBase import AbuFactorBuyBase, AbuFactorBuyXD, BuyCallMixin, BuyPutMixin
+from ..UtilBu.ABuKLUtil import rolling_extremum
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
@@ -34,8 +35,8 @@ class AbuFactorBuyBreak(AbuFactorBuyBase, BuyCallMixin):
         if self.today_ind < self.xd - 1:
             return None
 
-        # 今天的收盘价格达到xd天内最高价格则符合买入条件
-        if today.close == self.kl_pd.close[self.today_ind - self.xd + 1:self.today_ind + 1].max():
+        # 今天的收盘价格达到xd天内最高价格则符合买入条件，xd天内最高价格使用kl_pd上共享的滚动最值序列
+        if today.close == rolling_extremum(self.kl_pd, self.xd, 'max')[self.today_ind]:
             # 把突破新高参数赋值skip_days，这里也可以考虑make_buy_order确定是否买单成立，但是如果停盘太长时间等也不好
             self.skip_days = self.xd
             # 生成买入订单, 由于使用了今天的收盘价格做为策略信号判断，所以信号发出后，只能明天买
@@ -52,8 +53,8 @@ class AbuFactorBuyXDBK(AbuFactorBuyXD, BuyCallMixin):
         :param today: 当前驱动的交易日金融时间序列数据
         :return:
         """
-        # 今天的收盘价格达到xd天内最高价格则符合买入条件
-        if today.close == self.xd_kl.close.max():
+        # 今天的收盘价格达到xd天内最高价格则符合买入条件，read_fit_day中保证today_ind >= xd - 1，与xd_kl.close.max()一致
+        if today.close == rolling_extremum(self.kl_pd, self.xd, 'max')[self.today_ind]:
             return self.buy_tomorrow()
         return None
 
@@ -81,7 +82,7 @@ class AbuFactorBuyPutBreak(AbuFactorBuyBase, BuyPutMixin):
         """
             与AbuFactorBuyBreak区别就是买向下突破的，即min()
         """
-        if today.close == self.kl_pd.close[self.today_ind - self.xd + 1:self.today_ind + 1].min():
+        if today.close == rolling_extremum(self.kl_pd, self.xd, 'min')[self.today_ind]:
             self.skip_days = self.xd
             return self.buy_tomorrow()
         return None
@@ -97,6 +98,6 @@ class AbuFactorBuyPutXDBK(AbuFactorBuyXD, BuyPutMixin):
         :return:
         """
         # 与AbuFactorBuyBreak区别就是买向下突破的，即min()
-        if today.close == self.xd_kl.close.min():
+        if today.close == rolling_extremum(self.kl_pd, self.xd, 'min')[self.today_ind]:
             return self.buy_tomorrow()
         return None
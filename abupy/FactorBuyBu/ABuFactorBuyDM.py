@@ -12,7 +12,7 @@ import math
 import numpy as np
 
 from .ABuFactorBuyBase import AbuFactorBuyXD, BuyCallMixin
-from ..IndicatorBu.ABuNDMa import calc_ma_from_prices
+from ..IndicatorBu.ABuNDMa import calc_ma_from_prices, calc_ma_from_kl
 from ..CoreBu.ABuPdHelper import pd_resample
 from ..TLineBu.ABuTL import AbuTLine
 
@@ -196,10 +196,16 @@ class AbuDoubleMaBuy(AbuFactorBuyXD, BuyCallMixin):
 
     def fit_day(self, today):
         """双均线买入择时因子，信号快线上穿慢行形成金叉做为买入信号"""
-        # 计算快线
-        fast_line = calc_ma_from_prices(self.xd_kl.close, int(self.ma_fast), min_periods=1)
-        # 计算慢线
-        slow_line = calc_ma_from_prices(self.xd_kl.close, int(self.ma_slow), min_periods=1)
+        if max(self.ma_fast, self.ma_slow) <= self.xd - 1:
+            # 均线周期都在xd周期内时，完整金融时间序列上今天，昨天的ma与xd_kl上计算的一致，使用技术指标缓存
+            two_days = slice(self.today_ind - 1, self.today_ind + 1)
+            fast_line = calc_ma_from_kl(self.kl_pd, int(self.ma_fast), min_periods=1)[two_days]
+            slow_line = calc_ma_from_kl(self.kl_pd, int(self.ma_slow), min_periods=1)[two_days]
+        else:
+            # 动态慢线周期超过xd周期，计算快线
+            fast_line = calc_ma_from_prices(self.xd_kl.close, int(self.ma_fast), min_periods=1)
+            # 计算慢线
+            slow_line = calc_ma_from_prices(self.xd_kl.close, int(self.ma_slow), min_periods=1)
 
         if len(fast_line) >= 2 and len(slow_line) >= 2:
             # 今天的快线值
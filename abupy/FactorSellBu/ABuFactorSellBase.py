@@ -177,6 +177,19 @@ class AbuFactorSellBase(six.with_metaclass(ABCMeta, AbuParamBase)):
 class AbuFactorSellXD(AbuFactorSellBase):
     """以周期为重要参数的策略，xd代表参数'多少天'如已周期为参数可直接继承使用 """
 
+    _xd_kl = None
+
+    @property
+    def xd_kl(self):
+        """fit_day中使用的周期金融时间序列切片，第一次访问时才进行切片，不使用xd_kl的因子不再每天构造切片"""
+        if self._xd_kl is None:
+            self._xd_kl = self.kl_pd[self.today_ind - self.xd + 1:self.today_ind + 1]
+        return self._xd_kl
+
+    @xd_kl.setter
+    def xd_kl(self, xd_kl):
+        self._xd_kl = xd_kl
+
     def _init_self(self, **kwargs):
         """kwargs中必须包含: 突破参数xd 比如20，30，40天...突破"""
         # 向下突破参数 xd， 比如20，30，40天...突破
@@ -198,8 +211,8 @@ class AbuFactorSellXD(AbuFactorSellBase):
             return
         orders = list(filter(lambda order: order.expect_direction in self.support_direction(), orders))
 
-        # 完成为fit_day中切片周期金融时间序列数据
-        self.xd_kl = self.kl_pd[self.today_ind - self.xd + 1:self.today_ind + 1]
+        # 为fit_day中切片周期金融时间序列数据，访问xd_kl时才进行切片
+        self.xd_kl = None
 
         return self.fit_day(today, orders)
 
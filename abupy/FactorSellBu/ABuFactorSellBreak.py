@@ -8,6 +8,7 @@ from __future__ import print_function
 from __future__ import division
 
 from .ABuFactorSellBase import AbuFactorSellBase, AbuFactorSellXD, ESupportDirection
+from ..UtilBu.ABuKLUtil import rolling_extremum
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
@@ -34,8 +35,14 @@ class AbuFactorSellBreak(AbuFactorSellBase):
         :param today: 当前驱动的交易日金融时间序列数据
         :param orders: 买入择时策略中生成的订单序列
         """
+        if self.today_ind < self.xd - 1:
+            # 不足xd天时保持原有的切片方式
+            xd_min = self.kl_pd.close[self.today_ind - self.xd + 1:self.today_ind + 1].min()
+        else:
+            # xd天内最低价格使用kl_pd上共享的滚动最值序列
+            xd_min = rolling_extremum(self.kl_pd, self.xd, 'min')[self.today_ind]
         # 今天的收盘价格达到xd天内最低价格则符合条件
-        if today.close == self.kl_pd.close[self.today_ind - self.xd + 1:self.today_ind + 1].min():
+        if today.close == xd_min:
             for order in orders:
                 self.sell_tomorrow(order)
 
@@ -53,7 +60,10 @@ class AbuFactorSellXDBK(AbuFactorSellXD):
         :param today: 当前驱动的交易日金融时间序列数据
         :param orders: 买入择时策略中生成的订单序列
         """
+        # 不足xd天时保持原有的xd_kl切片方式，否则使用kl_pd上共享的滚动最值序列
+        xd_min = self.xd_kl.close.min() if self.today_ind < self.xd - 1 else \
+            rolling_extremum(self.kl_pd, self.xd, 'min')[self.today_ind]
         # 今天的收盘价格达到xd天内最低价格则符合条件
-        if today.close == self.xd_kl.close.min():
+        if today.close == xd_min:
             for order in orders:
                 self.sell_tomorrow(order)
@@ -8,7 +8,7 @@ from __future__ import print_function
 from __future__ import division
 
 from .ABuFactorSellBase import AbuFactorSellXD, ESupportDirection
-from ..IndicatorBu.ABuNDMa import calc_ma_from_prices
+from ..IndicatorBu.ABuNDMa import calc_ma_from_prices, calc_ma_from_kl
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
@@ -48,10 +48,16 @@ class AbuDoubleMaSell(AbuFactorSellXD):
             call方向：快线下穿慢线形成死叉，做为卖出信号
             put方向： 快线上穿慢线做为卖出信号
         """
-        # 计算快线
-        fast_line = calc_ma_from_prices(self.xd_kl.close, self.ma_fast, min_periods=1)
-        # 计算慢线
-        slow_line = calc_ma_from_prices(self.xd_kl.close, self.ma_slow, min_periods=1)
+        if self.today_ind >= self.xd - 1 and max(self.ma_fast, self.ma_slow) <= self.xd - 1:
+            # 均线周期都在xd周期内时，完整金融时间序列上今天，昨天的ma与xd_kl上计算的一致，使用技术指标缓存
+            two_days = slice(self.today_ind - 1, self.today_ind + 1)
+            fast_line = calc_ma_from_kl(self.kl_pd, self.ma_fast, min_periods=1)[two_days]
+            slow_line = calc_ma_from_kl(self.kl_pd, self.ma_slow, min_periods=1)[two_days]
+        else:
+            # 计算快线
+            fast_line = calc_ma_from_prices(self.xd_kl.close, self.ma_fast, min_periods=1)
+            # 计算慢线
+            slow_line = calc_ma_from_prices(self.xd_kl.close, self.ma_slow, min_periods=1)
 
         if len(fast_line) >= 2 and len(slow_line) >= 2:
             # 今天的快线值
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 from . import ABuNDAtr as atr
 from . import ABuNDBoll as boll
+from . import ABuNDCache as cache
 from . import ABuNDMa as ma
 from . import ABuNDMacd as macd
 from . import ABuNDRsi as rsi
@@ -9,6 +10,7 @@ from . import ABuNDRsi as rsi
 __all__ = [
     'atr',
     'boll',
+    'cache',
     'ma',
     'macd',
     'rsi'
@@ -21,6 +21,7 @@ import numpy as np
 from ..CoreBu.ABuPdHelper import pd_ewm_mean
 from ..UtilBu import ABuScalerUtil
 from .ABuNDBase import plot_from_order, g_calc_type, ECalcType
+from .ABuNDCache import calc_nd_cache
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
@@ -88,6 +89,17 @@ def _calc_atr_from_pd(high, low, close, time_period=14):
 calc_atr = _calc_atr_from_pd if g_calc_type == ECalcType.E_FROM_PD else _calc_atr_from_ta
 
 
+def calc_atr_from_kl(kl_pd, time_period=14):
+    """
+    使用金融时间序列上附加的技术指标缓存计算atr，相同(symbol，时间范围，参数)只计算一次
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param time_period: atr的N值默认值14，int
+    :return: atr值序列，np.array对象，不要修改返回的序列
+    """
+    return calc_nd_cache(kl_pd, 'atr', (time_period,),
+                         lambda: calc_atr(kl_pd.high, kl_pd.low, kl_pd.close, time_period=time_period))
+
+
 def atr14(high, low, close):
     """
     通过high, low, close计算atr14序列值
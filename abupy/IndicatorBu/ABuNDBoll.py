@@ -20,6 +20,7 @@ import numpy as np
 import pandas as pd
 
 from .ABuNDBase import plot_from_order, g_calc_type, ECalcType
+from .ABuNDCache import calc_nd_cache
 from ..CoreBu.ABuPdHelper import pd_rolling_mean, pd_rolling_std
 
 __author__ = '阿布'
@@ -74,6 +75,19 @@ def _calc_boll_from_pd(prices, time_period=20, nb_dev=2):
 calc_boll = _calc_boll_from_pd if g_calc_type == ECalcType.E_FROM_PD else _calc_boll_from_ta
 
 
+def calc_boll_from_kl(kl_pd, time_period=20, nb_dev=2):
+    """
+    使用金融时间序列上附加的技术指标缓存计算boll，相同(symbol，时间范围，参数)只计算一次
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param time_period: boll的N值默认值20，int
+    :param nb_dev: boll的nb_dev值默认值2，int
+    :return: (upper, middle, lower)，np.array对象，不要修改返回的序列
+    """
+    upper, middle, lower = calc_nd_cache(kl_pd, 'boll', (time_period, nb_dev),
+                                         lambda: calc_boll(kl_pd.close, time_period, nb_dev))
+    return upper, middle, lower
+
+
 def plot_boll_from_klpd(kl_pd, with_points=None, with_points_ext=None, **kwargs):
     """
     封装plot_boll，绘制收盘价格，boll（upper, middle, lower）曲线
@@ -0,0 +1,154 @@
+# -*- encoding:utf-8 -*-
+"""
+    技术指标缓存模块：技术指标缓存附加在金融时间序列上，由(symbol，时间范围)确定，
+    同一个金融时间序列上的每一个(指标，参数)只计算一次，买入因子，卖出因子等共享计算结果，
+    可选择持久化保存在金融时间序列缓存旁，下次相同symbol，相同时间范围的回测直接读取
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import division
+
+import os
+
+import numpy as np
+
+from ..CoreBu import ABuEnv
+from ..UtilBu import ABuFileUtil
+
+__author__ = '阿布'
+__weixin__ = 'abu_quant'
+
+"""是否使用技术指标缓存，关闭后calc_xxx_from_kl每次都重新计算"""
+g_enable_nd_cache = True
+"""是否将技术指标缓存持久化保存在金融时间序列缓存旁，默认关闭，本地金融时间序列数据更新后需要clear_nd_cache"""
+g_enable_nd_cache_persist = False
+
+"""技术指标缓存持久化文件夹，每一个(symbol，时间范围)一个子文件夹，每一个(指标，参数)一个npy文件"""
+ND_CACHE_DIR = os.path.join(ABuEnv.g_project_data_dir, 'nd_cache')
+
+"""金融时间序列上附加技术指标缓存的属性名称"""
+K_ND_CACHE_ATTR = 'nd_cache'
+
+"""当前进程中所有技术指标缓存累计的命中，未命中（即实际计算），持久化读取次数"""
+_g_nd_cache_stats = {'hit': 0, 'miss': 0, 'load': 0}
+
+
+class AbuNDCache(object):
+    """技术指标缓存类，由(symbol，时间范围)确定，保存(指标，参数)对应的指标序列"""
+
+    def __init__(self, symbol, start, end):
+        """
+        :param symbol: 金融时间序列的symbol，str对象
+        :param start: 金融时间序列的开始日期，int对象，eg: 20140725
+        :param end: 金融时间序列的结束日期，int对象，eg: 20160725
+        """
+        self.symbol = symbol
+        self.start = start
+        self.end = end
+        # 命中，未命中（即实际计算），持久化读取次数
+        self.hit_cnt = 0
+        self.miss_cnt = 0
+        self.load_cnt = 0
+        self.nd_dict = dict()
+
+    def __str__(self):
+        """打印对象显示：symbol，时间范围，缓存的指标，命中，未命中次数"""
+        return '{}_{}_{}: nd:{}, hit:{}, miss:{}, load:{}'.format(self.symbol, self.start, self.end,
+                                                                  sorted(self.nd_dict.keys()), self.hit_cnt,
+                                                                  self.miss_cnt, self.load_cnt)
+
+    __repr__ = __str__
+
+    @property
+    def cache_key(self):
+        """(symbol，时间范围)组成的缓存key，持久化时做为子文件夹名称"""
+        return '{}_{}_{}'.format(self.symbol, self.start, self.end)
+
+    def _persist_fn(self, nd_key):
+        """(指标，参数)对应的持久化npy文件路径"""
+        return os.path.join(ND_CACHE_DIR, self.cache_key, '{}.npy'.format(nd_key))
+
+    def get(self, indicator, params, calc_func):
+        """
+        获取(指标，参数)对应的指标序列，缓存中没有时先尝试读取持久化的指标序列，都没有使用calc_func计算后缓存
+        :param indicator: 指标名称，str对象，eg: 'ma'
+        :param params: 指标参数序列，eg: (5, 1, 0)
+        :param calc_func: 计算指标序列的函数，无参数，返回np.array对象
+        :return: np.array对象，不要修改返回的序列
+        """
+        nd_key = '_'.join([indicator] + [str(param) for param in params])
+        nd = self.nd_dict.get(nd_key)
+        if nd is not None:
+            self.hit_cnt += 1
+            _g_nd_cache_stats['hit'] += 1
+            return nd
+
+        persist_fn = self._persist_fn(nd_key) if g_enable_nd_cache_persist else None
+        if persist_fn is not None and ABuFileUtil.file_exist(persist_fn):
+            nd = np.load(persist_fn)
+            self.load_cnt += 1
+            _g_nd_cache_stats['load'] += 1
+        else:
+            nd = np.asarray(calc_func())
+            self.miss_cnt += 1
+            _g_nd_cache_stats['miss'] += 1
+            if persist_fn is not None:
+                # 先写入临时文件，写入完成后rename，其它进程不会读取到写入一半的数据
+                ABuFileUtil.ensure_dir(persist_fn)
+                tmp_fn = '{}.tmp{}.npy'.format(persist_fn[:-len('.npy')], os.getpid())
+                np.save(tmp_fn, nd)
+                os.rename(tmp_fn, persist_fn)
+        self.nd_dict[nd_key] = nd
+        return nd
+
+
+def nd_cache(kl_pd):
+    """
+    获取金融时间序列上附加的技术指标缓存，没有附加或者附加的缓存与金融时间序列的(symbol，时间范围)不一致时，
+    构造新的AbuNDCache附加在金融时间序列上，AbuKLManager对外提供金融时间序列时即进行附加
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :return: AbuNDCache对象
+    """
+    symbol = getattr(kl_pd, 'name', None)
+    start, end = (int(kl_pd.date.iloc[0]), int(kl_pd.date.iloc[-1])) if kl_pd.shape[0] > 0 else (None, None)
+    cache = kl_pd.__dict__.get(K_ND_CACHE_ATTR)
+    if cache is None or cache.symbol != symbol or cache.start != start or cache.end != end:
+        cache = AbuNDCache(symbol, start, end)
+        # 不使用setattr，避免与列名称冲突，切片，拷贝后的金融时间序列不会携带缓存
+        kl_pd.__dict__[K_ND_CACHE_ATTR] = cache
+    return cache
+
+
+def calc_nd_cache(kl_pd, indicator, params, calc_func):
+    """
+    在金融时间序列附加的技术指标缓存中获取(指标，参数)对应的指标序列，g_enable_nd_cache关闭时直接计算
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param indicator: 指标名称，str对象，eg: 'ma'
+    :param params: 指标参数序列，eg: (5, 1, 0)
+    :param calc_func: 计算指标序列的函数，无参数，返回np.array对象
+    :return: np.array对象，不要修改返回的序列
+    """
+    if not g_enable_nd_cache:
+        return np.asarray(calc_func())
+    return nd_cache(kl_pd).get(indicator, params, calc_func)
+
+
+def nd_cache_stats():
+    """
+    当前进程中所有技术指标缓存累计的命中，未命中（即实际计算），持久化读取次数，
+    hit即节省的重复指标计算次数
+    :return: dict对象，eg: {'hit': 12000, 'miss': 16, 'load': 0}
+    """
+    return dict(_g_nd_cache_stats)
+
+
+def reset_nd_cache_stats():
+    """重置当前进程中技术指标缓存累计的命中，未命中，持久化读取次数"""
+    for key in _g_nd_cache_stats:
+        _g_nd_cache_stats[key] = 0
+
+
+def clear_nd_cache():
+    """删除持久化的技术指标缓存"""
+    ABuFileUtil.del_file(ND_CACHE_DIR)
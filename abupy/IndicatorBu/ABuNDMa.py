@@ -17,6 +17,7 @@ import pandas as pd
 from enum import Enum
 
 from .ABuNDBase import plot_from_order, g_calc_type, ECalcType
+from .ABuNDCache import calc_nd_cache
 from ..CoreBu.ABuPdHelper import pd_rolling_mean, pd_ewm_mean
 from ..CoreBu.ABuFixes import six
 from ..UtilBu.ABuDTUtil import catch_error
@@ -95,6 +96,20 @@ def calc_ma_from_prices(prices, time_period=10, min_periods=None, from_calc=EMAC
 calc_ma = _calc_ma_from_pd if g_calc_type == ECalcType.E_FROM_PD else _calc_ma_from_ta
 
 
+def calc_ma_from_kl(kl_pd, time_period=10, min_periods=None, from_calc=EMACalcType.E_MA_MA):
+    """
+    使用金融时间序列上附加的技术指标缓存计算ma或者ema，相同(symbol，时间范围，参数)只计算一次
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param time_period: 移动平均的N值，int
+    :param min_periods: int，默认None则使用time_period
+    :param from_calc: EMACalcType enum对象，移动移动平均使用的方法
+    :return: 完整金融时间序列对应的ma值序列，np.array对象，不要修改返回的序列
+    """
+    min_periods = time_period if min_periods is None else min_periods
+    return calc_nd_cache(kl_pd, 'ma', (time_period, min_periods, from_calc.value),
+                         lambda: calc_ma_from_prices(kl_pd.close, time_period, min_periods, from_calc))
+
+
 def plot_ma_from_order(order, date_ext=120, **kwargs):
     """
     封装ABuNDBase中的plot_from_order与模块中绘制技术指标的函数，完成技术指标可视化及标注买入卖出点位
@@ -18,6 +18,7 @@ import numpy as np
 import pandas as pd
 
 from .ABuNDBase import plot_from_order, g_calc_type, ECalcType
+from .ABuNDCache import calc_nd_cache
 from ..UtilBu import ABuScalerUtil
 from ..UtilBu.ABuDTUtil import catch_error
 from ..CoreBu.ABuPdHelper import pd_ewm_mean
@@ -75,6 +76,20 @@ def _calc_macd_from_pd(price, fast_period=12, slow_period=26, signal_period=9):
 calc_macd = _calc_macd_from_pd if g_calc_type == ECalcType.E_FROM_PD else _calc_macd_from_ta
 
 
+def calc_macd_from_kl(kl_pd, fast_period=12, slow_period=26, signal_period=9):
+    """
+    使用金融时间序列上附加的技术指标缓存计算macd，相同(symbol，时间范围，参数)只计算一次
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param fast_period: 快的加权移动均线线, 默认12，即EMA12
+    :param slow_period: 慢的加权移动均线, 默认26，即EMA26
+    :param signal_period: dif的指数移动平均线，默认9
+    :return: (dif, dea, bar)，np.array对象，不要修改返回的序列
+    """
+    dif, dea, bar = calc_nd_cache(kl_pd, 'macd', (fast_period, slow_period, signal_period),
+                                  lambda: calc_macd(kl_pd.close, fast_period, slow_period, signal_period))
+    return dif, dea, bar
+
+
 def plot_macd_from_klpd(kl_pd, with_points=None, with_points_ext=None, **kwargs):
     """
     封装plot_macd，绘制收盘价格，macd（dif, dea, bar）曲线
@@ -22,6 +22,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from .ABuNDBase import plot_from_order, g_calc_type, ECalcType
+from .ABuNDCache import calc_nd_cache
 from ..UtilBu import ABuScalerUtil
 from ..CoreBu.ABuPdHelper import pd_rolling_mean
 
@@ -83,6 +84,16 @@ def _calc_rsi_from_pd(prices, time_period=14):
 calc_rsi = _calc_rsi_from_pd if g_calc_type == ECalcType.E_FROM_PD else _calc_rsi_from_ta
 
 
+def calc_rsi_from_kl(kl_pd, time_period=14):
+    """
+    使用金融时间序列上附加的技术指标缓存计算rsi，相同(symbol，时间范围，参数)只计算一次
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param time_period: rsi的N日参数, 默认14
+    :return: rsi值序列，np.array对象，不要修改返回的序列
+    """
+    return calc_nd_cache(kl_pd, 'rsi', (time_period,), lambda: calc_rsi(kl_pd.close, time_period=time_period))
+
+
 def plot_rsi_from_order(order, date_ext=120, **kwargs):
     """
     封装ABuNDBase中的plot_from_order与模块中绘制技术指标的函数，完成技术指标可视化及标注买入卖出点位
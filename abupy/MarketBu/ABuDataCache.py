@@ -7,16 +7,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import logging
 import os
+import re
+import sqlite3 as sqlite
 
 import pandas as pd
 
 from ..CoreBu.ABuEnv import EDataCacheType, EMarketTargetType, EMarketSubType
 from ..CoreBu import ABuEnv
 from ..UtilBu.ABuFileUtil import load_df_csv, load_hdf5, ensure_dir, file_exist, del_file, dump_df_csv, \
-    dump_del_hdf5
+    dump_del_hdf5, dump_df_npy, load_df_npy, load_npy_columns
 # noinspection PyUnresolvedReferences
-from ..CoreBu.ABuFixes import xrange, range, filter
+from ..CoreBu.ABuFixes import xrange, range, filter, partial
 from ..UtilBu.ABuProgress import AbuProgress
 
 try:
@@ -29,6 +32,19 @@ except ImportError:
 # 模块加载时统一确保文件夹存在，不在函数内部ensure_dir
 ensure_dir(ABuEnv.g_project_kl_df_data)
 
+"""缓存文件或者文件夹名称匹配，eg：usTSLA_20100214_20170214，group(1)即symbol_key"""
+K_CACHE_KEY_RE = re.compile(r'^(.+)_\d{8}_\d{8}$')
+"""索引数据库中symbol_key->date_key的表名称"""
+K_KEY_INDEX_TABLE = 'csv_key'
+"""索引数据库中记录索引对应的缓存文件夹修改时间的表名称"""
+K_KEY_INDEX_META = 'csv_meta'
+
+"""
+    csv，npy存储模式下的symbol_key->date_key内存索引，key为缓存文件夹路径，value为(文件夹修改时间，索引dict)，
+    文件夹修改时间与当前缓存文件夹修改时间一致的情况下直接使用，否则从索引数据库或者缓存文件夹重建
+"""
+_g_cache_key_index = dict()
+
 
 def _kl_unique_key(symbol, start, end):
     """
@@ -108,26 +124,50 @@ def load_all_kline(want_df=True, market=None, all_market=False):
         return [(key, h5s[key]) for key in keys]
 
 
+def _covert_kline(dfs, cache_type, pg_name):
+    """
+    将(symbol_key, date_key, df)序列使用cache_type存贮模式保存
+    :param dfs: 序列元素由(symbol_key, date_key, df)构成，df可以是pd.DataFrame对象或者读取df的函数
+    :param cache_type: 目标存贮模式，EDataCacheType对象
+    :param pg_name: 进度条显示名称
+    """
+    # 临时保存存贮模式
+    tmp_cache = ABuEnv.g_data_cache_type
+    ABuEnv.g_data_cache_type = cache_type
+    try:
+        with AbuProgress(len(dfs), 0, pg_name) as pg:
+            for symbol_key, date_key, dump_df in dfs:
+                pg.show()
+                dump_kline_df(dump_df() if callable(dump_df) else dump_df, symbol_key, date_key)
+    finally:
+        # 还原之前的存贮模式
+        ABuEnv.g_data_cache_type = tmp_cache
+
+
+def _hdf_kline_items():
+    """hdf5下所有数据转换为(symbol_key, date_key, df)序列"""
+    # eg: symbol: /usTSLA_20110808_20170808, symbol_key: usTSLA, date_key: usTSLA_20110808_20170808
+    return [(symbol.split('_')[0][1:], symbol[1:], dump_df) for symbol, dump_df in load_all_kline(all_market=True)]
+
+
 def covert_hdf_to_csv():
     """转换hdf5下的所有cache缓存至csv文件存贮格式"""
+    _covert_kline(_hdf_kline_items(), EDataCacheType.E_DATA_CACHE_CSV, 'csv covert')
 
-    # 获取hdf5下所有数据
-    dfs = load_all_kline(all_market=True)
 
-    # 临时保存存贮模式
-    tmp_cache = ABuEnv.g_data_cache_type
-    ABuEnv.g_data_cache_type = EDataCacheType.E_DATA_CACHE_CSV
-    with AbuProgress(len(dfs), 0, 'csv covert') as pg:
-        for symbol, dump_df in dfs:
-            pg.show()
-            # eg: usTSLA
-            symbol_key = symbol.split('_')[0][1:]
-            # eg: usTSLA_20110808_20170808
-            date_key = symbol[1:]
-            # 将df转换为csv格式
-            dump_kline_df(dump_df, symbol_key, date_key)
-    # 还原之前的存贮模式
-    ABuEnv.g_data_cache_type = tmp_cache
+def covert_hdf_to_npy():
+    """转换hdf5下的所有cache缓存至npy列存贮格式"""
+    _covert_kline(_hdf_kline_items(), EDataCacheType.E_DATA_CACHE_NPY, 'npy covert')
+
+
+def covert_csv_to_npy():
+    """转换csv缓存文件夹下的所有cache缓存至npy列存贮格式，csv文件在保存时才逐个读取"""
+    key_index = _cache_key_index(_csv_cache_dir())
+    if key_index is None:
+        return
+    dfs = [(symbol_key, date_key, partial(_load_kline_csv, date_key))
+           for symbol_key, date_key in key_index.items()]
+    _covert_kline(dfs, EDataCacheType.E_DATA_CACHE_NPY, 'npy covert')
 
 
 def load_kline_df(symbol_key):
@@ -148,6 +188,12 @@ def load_kline_df(symbol_key):
         # 读取方式是HDF5，并且不是沙盒数据模式，切换load_kline_func，load_kline_key为HDF5读取函数
         load_kline_func = _load_kline_hdf5
         load_kline_key = _load_hdf5_key
+    # noinspection PyProtectedMember
+    elif ABuEnv.g_data_cache_type == EDataCacheType.E_DATA_CACHE_NPY and \
+            not ABuEnv._g_enable_example_env_ipython:
+        # 读取方式是NPY，并且不是沙盒数据模式，切换load_kline_func，load_kline_key为NPY读取函数
+        load_kline_func = _load_kline_npy
+        load_kline_key = _load_npy_key
 
     # noinspection PyUnusedLocal
     date_key = None
@@ -177,9 +223,7 @@ def _load_kline_csv(date_key):
     针对csv存储模式，读取本地cache金融时间序列
     :param date_key: 金融时间序列索引key，针对对csv存储模式为目标csv的具体文件名
     """
-    # noinspection PyProtectedMember
-    csv_dir = ABuEnv.g_project_kl_df_data_example if ABuEnv._g_enable_example_env_ipython \
-        else ABuEnv.g_project_kl_df_data_csv
+    csv_dir = _csv_cache_dir()
 
     # 通过连接date_key和csv存储根目录，得到目标csv文件路径
     csv_fn = os.path.join(csv_dir, date_key)
@@ -198,6 +242,27 @@ def _load_kline_hdf5(date_key):
     return load_hdf5(target_hdf5, date_key)
 
 
+def _load_kline_npy(date_key):
+    """
+    针对npy存储模式，读取本地cache金融时间序列
+    :param date_key: 金融时间序列索引key，针对对npy存储模式为目标npy文件夹名称
+    """
+    return load_df_npy(os.path.join(ABuEnv.g_project_kl_df_data_npy, date_key))
+
+
+def load_kline_columns(symbol_key):
+    """
+    针对npy存储模式，根据symbol_key读取本地缓存金融时间序列的index以及每一列数据，
+    数据为只读memmap，不构造pd.DataFrame，即不进行拷贝，多个进程读取同一个symbol时共享系统页缓存
+    :param symbol_key: str对象symbol
+    :return: (index序列，列名称序列，列数据序列)，本地没有缓存返回None
+    """
+    date_key = _load_npy_key(symbol_key)
+    if date_key is None:
+        return None
+    return load_npy_columns(os.path.join(ABuEnv.g_project_kl_df_data_npy, date_key[0]))
+
+
 def check_csv_local(symbol_key):
     """
     套结_load_csv_key，但不返回key具体值，只返回对应的symbol是否
@@ -208,27 +273,188 @@ def check_csv_local(symbol_key):
     return _load_csv_key(symbol_key) is not None
 
 
+def _csv_cache_dir():
+    """csv存储模式下当前读取使用的csv文件夹，沙盒数据模式下为RomDataBu/csv"""
+    # noinspection PyProtectedMember
+    return ABuEnv.g_project_kl_df_data_example if ABuEnv._g_enable_example_env_ipython \
+        else ABuEnv.g_project_kl_df_data_csv
+
+
+def _key_index_db(cache_dir):
+    """
+    缓存文件夹对应的索引数据库路径，索引数据库存放在缓存文件夹的同级目录，eg：~/abu/data/csv_index.db，
+    不存放在缓存文件夹内部，避免索引数据库的写入改变缓存文件夹的修改时间，
+    沙盒数据文件夹只读，不使用索引数据库，只使用内存索引
+    :param cache_dir: 缓存文件夹路径
+    :return: 索引数据库路径，不使用索引数据库的返回None
+    """
+    if cache_dir == ABuEnv.g_project_kl_df_data_example:
+        return None
+    return '{}_index.db'.format(os.path.normpath(cache_dir))
+
+
+def _cache_dir_mtime(cache_dir):
+    """缓存文件夹的修改时间，缓存文件的添加，删除都会改变文件夹的修改时间，文件夹不存在返回None"""
+    try:
+        return os.stat(cache_dir).st_mtime
+    except OSError:
+        return None
+
+
+def _connect_key_index(db_path):
+    """连接索引数据库，确保索引表存在"""
+    conn = sqlite.connect(db_path, timeout=30)
+    conn.execute('create table if not exists {} (symbol_key text primary key, date_key text)'.format(
+        K_KEY_INDEX_TABLE))
+    conn.execute('create table if not exists {} (cache_dir text primary key, mtime real)'.format(K_KEY_INDEX_META))
+    return conn
+
+
+def _load_key_index_db(cache_dir, mtime):
+    """
+    从索引数据库读取symbol_key->date_key索引，只有索引数据库中记录的缓存文件夹修改时间与
+    当前一致的情况下才可以使用，否则返回None，即需要从缓存文件夹重建索引
+    :param cache_dir: 缓存文件夹路径
+    :param mtime: 当前缓存文件夹的修改时间
+    :return: 索引dict或者None
+    """
+    db_path = _key_index_db(cache_dir)
+    if db_path is None or not file_exist(db_path):
+        return None
+    try:
+        conn = _connect_key_index(db_path)
+        try:
+            meta = conn.execute('select mtime from {} where cache_dir=?'.format(K_KEY_INDEX_META),
+                                (cache_dir,)).fetchone()
+            if meta is None or meta[0] != mtime:
+                return None
+            return dict(conn.execute('select symbol_key, date_key from {}'.format(K_KEY_INDEX_TABLE)).fetchall())
+        finally:
+            conn.close()
+    except sqlite.Error as e:
+        logging.info('load cache index error: {}'.format(e))
+        return None
+
+
+def _rebuild_key_index(cache_dir, mtime):
+    """
+    扫描缓存文件夹重建symbol_key->date_key索引，缓存文件夹中的文件或者文件夹名称即date_key，
+    并在一个事务中整体替换索引数据库中的内容
+    :param cache_dir: 缓存文件夹路径
+    :param mtime: 扫描前缓存文件夹的修改时间
+    :return: 索引dict
+    """
+    key_index = dict()
+    for name in os.listdir(cache_dir):
+        match = K_CACHE_KEY_RE.match(name)
+        # 同一个symbol_key存在多个文件的异常情况，和之前的扫描方式一样使用先扫描到的
+        if match is not None and match.group(1) not in key_index:
+            key_index[match.group(1)] = name
+
+    db_path = _key_index_db(cache_dir)
+    if db_path is not None:
+        try:
+            conn = _connect_key_index(db_path)
+            try:
+                with conn:
+                    conn.execute('delete from {}'.format(K_KEY_INDEX_TABLE))
+                    conn.executemany('insert into {} values (?, ?)'.format(K_KEY_INDEX_TABLE),
+                                     list(key_index.items()))
+                    conn.execute('replace into {} values (?, ?)'.format(K_KEY_INDEX_META), (cache_dir, mtime))
+            finally:
+                conn.close()
+        except sqlite.Error as e:
+            # 索引数据库写入失败只影响下次启动的重建，不影响这次的内存索引
+            logging.info('rebuild cache index error: {}'.format(e))
+    return key_index
+
+
+def _cache_key_index(cache_dir):
+    """
+    获取缓存文件夹对应的symbol_key->date_key索引，顺序：内存索引->索引数据库->扫描缓存文件夹重建，
+    通过缓存文件夹的修改时间判断索引是否有效，即外部直接对缓存文件夹进行的文件添加，删除也会触发重建
+    :param cache_dir: 缓存文件夹路径
+    :return: 索引dict，缓存文件夹不存在返回None
+    """
+    mtime = _cache_dir_mtime(cache_dir)
+    if mtime is None:
+        return None
+    if cache_dir in _g_cache_key_index and _g_cache_key_index[cache_dir][0] == mtime:
+        return _g_cache_key_index[cache_dir][1]
+
+    key_index = _load_key_index_db(cache_dir, mtime)
+    if key_index is None:
+        key_index = _rebuild_key_index(cache_dir, mtime)
+    _g_cache_key_index[cache_dir] = (mtime, key_index)
+    return key_index
+
+
+def _update_key_index(cache_dir, key_index, symbol_key, date_key, pre_mtime):
+    """
+    _dump_kline_csv，_dump_kline_npy写入缓存后更新索引，symbol_key->date_key的替换以及文件夹修改时间的更新
+    在索引数据库的一个事务中完成，只有写入前缓存文件夹的修改时间与索引记录的修改时间一致，即写入前索引是完整的，
+    才使用写入后的修改时间更新索引，否则其它进程在这之间写入的symbol_key不在索引中，丢弃内存索引，
+    且不更新索引数据库中的修改时间，下次_cache_key_index重新读取或者扫描重建
+    :param cache_dir: 缓存文件夹路径
+    :param key_index: 写入缓存前通过_cache_key_index获取的索引dict
+    :param symbol_key: str对象，eg. usTSLA
+    :param date_key: str对象，eg. usTSLA_20100214_20170214，即写入的缓存文件或者文件夹名称
+    :param pre_mtime: 写入缓存前缓存文件夹的修改时间
+    """
+    if key_index is None:
+        return
+    mtime = _cache_dir_mtime(cache_dir)
+    index_mtime = _g_cache_key_index[cache_dir][0] if cache_dir in _g_cache_key_index else None
+    fresh = mtime is not None and pre_mtime is not None and pre_mtime == index_mtime
+    if fresh:
+        key_index[symbol_key] = date_key
+        _g_cache_key_index[cache_dir] = (mtime, key_index)
+    else:
+        _g_cache_key_index.pop(cache_dir, None)
+
+    db_path = _key_index_db(cache_dir)
+    if db_path is None:
+        return
+    try:
+        conn = _connect_key_index(db_path)
+        try:
+            with conn:
+                conn.execute('replace into {} values (?, ?)'.format(K_KEY_INDEX_TABLE), (symbol_key, date_key))
+                if fresh:
+                    conn.execute('replace into {} values (?, ?)'.format(K_KEY_INDEX_META), (cache_dir, mtime))
+        finally:
+            conn.close()
+    except sqlite.Error as e:
+        logging.info('update cache index error: {}'.format(e))
+
+
 def _load_csv_key(symbol_key):
     """
     针对csv存储模式，通过symbol_key字符串找到对应的csv具体文件名称，
-    如从usTSLA->找到usTSLA_2014-7-26_2016_7_26这个具体csv文件路径
+    如从usTSLA->找到usTSLA_2014-7-26_2016_7_26这个具体csv文件路径，
+    通过symbol_key->date_key索引查询，不再每次都扫描csv文件夹
     :param symbol_key: str对象，eg. usTSLA
     """
-    # noinspection PyProtectedMember
-    csv_dir = ABuEnv.g_project_kl_df_data_example if ABuEnv._g_enable_example_env_ipython \
-        else ABuEnv.g_project_kl_df_data_csv
+    key_index = _cache_key_index(_csv_cache_dir())
+    """
+        索引中的symbol_key即文件名去掉'_start_end'的部分，所以是精确匹配，
+        不会因为TSL匹配上TSLA导致删除原有的symbol
+    """
+    if key_index is not None and symbol_key in key_index:
+        # []只是为了配合外面针对不同store统一使用key[0]
+        return [key_index[symbol_key]]
+    return None
 
-    if file_exist(csv_dir):
-        for name in os.listdir(csv_dir):
-            # 从csv缓存文件夹下进行模糊查询通过fnmatch匹配具体csv文件路径，eg. usTSLA->usTSLA_2014-7-26_2016_7_26
-            # if fnmatch(name, '{}*'.format(symbol_key)):
-            """
-                这里不能模糊匹配，否则会因为TSL匹配上TSLA导致删除原有的symbol
-                而且必须要加'_'做为symbol结束匹配标记
-            """
-            if name.startswith(symbol_key + '_'):
-                # []只是为了配合外面针对不同store统一使用key[0]
-                return [name]
+
+def _load_npy_key(symbol_key):
+    """
+    针对npy存储模式，通过symbol_key字符串找到对应的npy文件夹名称，eg：usTSLA->usTSLA_20140726_20160726
+    :param symbol_key: str对象，eg. usTSLA
+    """
+    key_index = _cache_key_index(ABuEnv.g_project_kl_df_data_npy)
+    if key_index is not None and symbol_key in key_index:
+        # []只是为了配合外面针对不同store统一使用key[0]
+        return [key_index[symbol_key]]
     return None
 
 
@@ -264,6 +490,11 @@ def dump_kline_df(dump_df, symbol_key, date_key):
         load_kline_key = _load_hdf5_key
         dump_kline_func = _dump_kline_hdf5
         load_kline_func = _load_kline_hdf5
+    # npy模式分配工作函数
+    elif ABuEnv.g_data_cache_type == EDataCacheType.E_DATA_CACHE_NPY:
+        load_kline_key = _load_npy_key
+        dump_kline_func = _dump_kline_npy
+        load_kline_func = _load_kline_npy
 
     _start = int(date_key[-17: -9])
     _end = int(date_key[-8:])
@@ -339,16 +570,19 @@ def dump_kline_df(dump_df, symbol_key, date_key):
         dump_kline_func(symbol_key, date_key, dump_df)
 
 
-# noinspection PyUnusedLocal
 def _dump_kline_csv(symbol_key, date_key, dump_df, delete_key=None):
     """
     针对csv存储模式，根据symbol_key，date_key存储dump_df金融时间序列
-    :param symbol_key: str对象，eg. usTSLA，对于csv模式不需要，只为保持接口统一
+    :param symbol_key: str对象，eg. usTSLA，csv模式下用来更新symbol_key->date_key索引
     :param date_key: str对象，eg. usTSLA_20100214_20170214，csv模式下为对应的文件名
     :param dump_df: 需要存储的金融时间序列实体pd.DataFrame对象
     :param delete_key: 是否有需要删除的csv文件
     :return:
     """
+    # 写入前获取索引，写入后csv文件夹的修改时间改变，直接在写入前的索引上更新，不需要重建
+    key_index = _cache_key_index(ABuEnv.g_project_kl_df_data_csv)
+    # 写入前csv文件夹的修改时间，用来确定写入前的索引是否完整
+    pre_mtime = _cache_dir_mtime(ABuEnv.g_project_kl_df_data_csv)
     # 先删后后写入
     if delete_key is not None:
         delete_key = delete_key[0]
@@ -358,6 +592,30 @@ def _dump_kline_csv(symbol_key, date_key, dump_df, delete_key=None):
 
     csv_fn = os.path.join(ABuEnv.g_project_kl_df_data_csv, date_key)
     dump_df_csv(csv_fn, dump_df)
+    # 写入完成后更新symbol_key->date_key索引
+    _update_key_index(ABuEnv.g_project_kl_df_data_csv, key_index, symbol_key, date_key, pre_mtime)
+
+
+def _dump_kline_npy(symbol_key, date_key, dump_df, delete_key=None):
+    """
+    针对npy存储模式，根据symbol_key，date_key存储dump_df金融时间序列
+    :param symbol_key: str对象，eg. usTSLA，npy模式下用来更新symbol_key->date_key索引
+    :param date_key: str对象，eg. usTSLA_20100214_20170214，npy模式下为对应的文件夹名
+    :param dump_df: 需要存储的金融时间序列实体pd.DataFrame对象
+    :param delete_key: 是否有需要删除的npy文件夹
+    :return:
+    """
+    ensure_dir(ABuEnv.g_project_kl_df_data_npy)
+    # 写入前获取索引，作用同_dump_kline_csv
+    key_index = _cache_key_index(ABuEnv.g_project_kl_df_data_npy)
+    pre_mtime = _cache_dir_mtime(ABuEnv.g_project_kl_df_data_npy)
+
+    npy_dir = os.path.join(ABuEnv.g_project_kl_df_data_npy, date_key)
+    # 完整写入后rename为npy_dir，其它进程不会读取到写入一半的数据
+    dump_df_npy(npy_dir, dump_df)
+    if delete_key is not None and delete_key[0] != date_key:
+        del_file(os.path.join(ABuEnv.g_project_kl_df_data_npy, delete_key[0]))
+    _update_key_index(ABuEnv.g_project_kl_df_data_npy, key_index, symbol_key, date_key, pre_mtime)
 
 
 def _dump_kline_hdf5(symbol_key, date_key, dump_df, delete_key=None):
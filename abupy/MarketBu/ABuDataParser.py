@@ -95,8 +95,7 @@ class AbuDataParseWrap(object):
             # 添加日期int列
             warp_self.df['date'] = warp_self.df['date'].apply(lambda x: ABuDateUtil.date_str_to_int(str(x)))
             # 添加周几列date_week，值为0-4，分别代表周一到周五
-            warp_self.df['date_week'] = warp_self.df['date'].apply(
-                lambda x: ABuDateUtil.week_of_date(str(x), '%Y%m%d'))
+            warp_self.df['date_week'] = ABuDateUtil.week_of_date_int(warp_self.df['date'].values)
 
             # 类型转换
             warp_self.df['close'] = warp_self.df['close'].astype(float)
@@ -325,7 +324,7 @@ class BDParser(object):
 
                 self.df = pd.DataFrame(klines, index=dates_pd)
                 self.df['date'] = dates
-                self.df['date_week'] = self.df['date'].apply(lambda x: ABuDateUtil.week_of_date(str(x), '%Y%m%d'))
+                self.df['date_week'] = ABuDateUtil.week_of_date_int(self.df['date'].values)
 
                 self.df['close'] = self.df['close'].astype(float)
                 self.df['high'] = self.df['high'].astype(float)
@@ -44,6 +44,8 @@ class AbuHkUnit(FreezeAttrMixin):
         """
         # 读取本地csv到内存，由于AbuHkUnit单例只进行一次
         self.hk_unit_df = pd.read_csv(_hk_unit_csv, index_col=0)
+        # symbol到每一手股数的dict索引，query_unit，成员测试不再使用loc查询
+        self.hk_unit_dict = dict(zip(self.hk_unit_df.index, self.hk_unit_df.values[:, 0]))
         # __init__中使用FreezeAttrMixin._freeze冻结了接口
         self._freeze()
 
@@ -59,13 +61,8 @@ class AbuHkUnit(FreezeAttrMixin):
             # symbol字符串, 但是没有hk，则加上
             symbol = 'hk{}'.format(symbol)
 
-        # noinspection PyBroadException
-        try:
-            unit = self.hk_unit_df.loc[symbol].values[0]
-        except:
-            # 查询失败赋予默认值
-            unit = K_DEFAULT_UNIT
-        return unit
+        # 查询失败赋予默认值
+        return self.hk_unit_dict.get(symbol, K_DEFAULT_UNIT)
 
     def __str__(self):
         """打印对象显示：hk_unit_df.info， hk_unit_df.describe"""
@@ -88,7 +85,7 @@ class AbuHkUnit(FreezeAttrMixin):
         elif isinstance(item, six.string_types) and item.isdigit():
             item = 'hk{}'.format(item)
 
-        return item in self.hk_unit_df.index
+        return item in self.hk_unit_dict
 
     def __getitem__(self, key):
         """索引获取：套接self.query_unit(key)"""
@@ -16,6 +16,19 @@ from ..UtilBu.ABuStrUtil import to_unicode
 from ..UtilBu.ABuLazyUtil import LazyFunc
 
 
+def rows_index(keys):
+    """
+    构建key到行序号list的dict索引，供symbol，期货合约等csv表格查询使用，相同key的行序号按照出现的顺序保存，
+    使用df.iloc[rows]即得到与df[df.key == key]一致的行切片
+    :param keys: 可迭代的key序列，eg: df.symbol.values
+    :return: dict对象，eg: {'000001': [0, 3121]}
+    """
+    index = dict()
+    for row, key in enumerate(keys):
+        index.setdefault(key, []).append(row)
+    return index
+
+
 # noinspection PyProtectedMember
 def code_to_symbol(code, rs=True):
     """
@@ -115,6 +128,22 @@ def code_to_symbol(code, rs=True):
         raise ValueError('arg code :{} format dt support'.format(code))
 
 
+def code_to_symbols(codes, rs=True):
+    """
+    code_to_symbol的批量版本，一次解析整个市场的symbol序列，重复的code只解析一次
+    :param codes: 可迭代的code序列，eg: ['usTSLA', '300104', 'hk00700']
+    :param rs: 没有匹配上是否对外抛异常，默认True，False时没有匹配上的位置为None
+    :return: 与codes顺序一致的Symbol对象list
+    """
+    symbol_dict = dict()
+    symbols = list()
+    for code in codes:
+        if code not in symbol_dict:
+            symbol_dict[code] = code_to_symbol(code, rs=rs)
+        symbols.append(symbol_dict[code])
+    return symbols
+
+
 def __search(market_df, search_match, search_code, search_result, match_key='co_name'):
     """具体搜索执行接口"""
 
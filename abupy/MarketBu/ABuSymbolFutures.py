@@ -15,7 +15,7 @@ from ..CoreBu.ABuBase import FreezeAttrMixin
 from ..CoreBu import ABuEnv
 from ..UtilBu.ABuLazyUtil import LazyFunc
 from ..UtilBu.ABuDTUtil import singleton
-from ..MarketBu.ABuSymbol import Symbol
+from ..MarketBu.ABuSymbol import Symbol, rows_index
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
@@ -54,6 +54,13 @@ class AbuFuturesCn(FreezeAttrMixin):
         """
         # 读取本地csv到内存
         self.futures_cn_df = pd.read_csv(_stock_code_futures_cn, index_col=0)
+        # 合约symbol到行序号的dict索引
+        self.symbol_rows = rows_index(self.futures_cn_df.symbol.values)
+        # 合约symbol的1位，2位字母头到第一个匹配合约symbol的dict索引，eg: {'J': 'JD0', 'JD': 'JD0', 'JM': 'JM0'}
+        self.head_symbol = dict()
+        for fs in self.futures_cn_df.symbol.values:
+            for head_len in (1, 2):
+                self.head_symbol.setdefault(fs[:head_len], fs)
         # __init__中使用FreezeAttrMixin._freeze冻结了接口
         self._freeze()
 
@@ -76,21 +83,21 @@ class AbuFuturesCn(FreezeAttrMixin):
         """索引获取：套接self.futures_cn_df[key]"""
         if key in self:
             return self.futures_cn_df[key]
-        # 不在的话，返回整个表格futures_cn_df
 
-        symbol_df = self.futures_cn_df[self.futures_cn_df.symbol == key]
-        if not symbol_df.empty:
-            return symbol_df
+        if key in self.symbol_rows:
+            return self.futures_cn_df.iloc[self.symbol_rows[key]]
+        # 不在的话，返回整个表格futures_cn_df
         return self.futures_cn_df
 
     def __setitem__(self, key, value):
         """索引设置：对外抛出错误， 即不准许外部设置"""
         raise AttributeError("AbuFuturesCn set value!!!")
 
-    def query_symbol(self, symbol):
+    def _query_symbol_rows(self, symbol):
         """
-        对外查询接口
+        通过合约symbol的字母头查询对应连续合约在futures_cn_df中的行序号list
         :param symbol: 可以是Symbol对象，也可以是symbol字符串对象
+        :return: 行序号list，没有匹配的合约返回None
         """
         if isinstance(symbol, Symbol):
             symbol = symbol.value
@@ -102,10 +109,16 @@ class AbuFuturesCn(FreezeAttrMixin):
         else:
             return None
 
-        for fs in self.symbol:
-            if head == fs[:len(head)]:
-                return self.futures_cn_df[self.futures_cn_df.symbol == fs]
-        return None
+        fs = self.head_symbol.get(head)
+        return None if fs is None else self.symbol_rows[fs]
+
+    def query_symbol(self, symbol):
+        """
+        对外查询接口
+        :param symbol: 可以是Symbol对象，也可以是symbol字符串对象
+        """
+        rows = self._query_symbol_rows(symbol)
+        return None if rows is None else self.futures_cn_df.iloc[rows]
 
     def query_min_unit(self, symbol):
         """
@@ -113,10 +126,10 @@ class AbuFuturesCn(FreezeAttrMixin):
         :param symbol: 可以是Symbol对象，也可以是symbol字符串对象
         """
         min_cnt = 10
-        # 查询最少一手单位
-        q_df = self.query_symbol(symbol)
-        if q_df is not None:
-            min_cnt = q_df.min_unit.values[0]
+        # 查询最少一手单位，不构造行切片
+        rows = self._query_symbol_rows(symbol)
+        if rows is not None:
+            min_cnt = self.futures_cn_df.min_unit.values[rows[0]]
         return min_cnt
 
     @LazyFunc
@@ -169,6 +182,8 @@ class AbuFuturesGB(FreezeAttrMixin):
         """
         # 读取本地csv到内存
         self.futures_gb_df = pd.read_csv(_stock_code_futures_gb, index_col=0)
+        # 合约symbol到行序号的dict索引
+        self.symbol_rows = rows_index(self.futures_gb_df.symbol.values)
         # __init__中使用FreezeAttrMixin._freeze冻结了接口
         self._freeze()
 
@@ -192,9 +207,8 @@ class AbuFuturesGB(FreezeAttrMixin):
         if key in self:
             return self.futures_gb_df[key]
 
-        symbol_df = self.futures_gb_df[self.futures_gb_df.symbol == key]
-        if not symbol_df.empty:
-            return symbol_df
+        if key in self.symbol_rows:
+            return self.futures_gb_df.iloc[self.symbol_rows[key]]
 
         # 不在的话，返回整个表格futures_cn_df
         return self.futures_gb_df
@@ -210,8 +224,8 @@ class AbuFuturesGB(FreezeAttrMixin):
         """
         if isinstance(symbol, Symbol):
             symbol = symbol.value
-        if symbol in self.symbol.values:
-            return self.futures_gb_df[self.futures_gb_df.symbol.values == symbol]
+        if symbol in self.symbol_rows:
+            return self.futures_gb_df.iloc[self.symbol_rows[symbol]]
         return None
 
     def query_min_unit(self, symbol):
@@ -220,10 +234,11 @@ class AbuFuturesGB(FreezeAttrMixin):
         :param symbol: 可以是Symbol对象，也可以是symbol字符串对象
         """
         min_cnt = 10
-        # 查询最少一手单位
-        q_df = self.query_symbol(symbol)
-        if q_df is not None:
-            min_cnt = q_df.min_unit.values[0]
+        # 查询最少一手单位，不构造行切片
+        if isinstance(symbol, Symbol):
+            symbol = symbol.value
+        if symbol in self.symbol_rows:
+            min_cnt = self.futures_gb_df.min_unit.values[self.symbol_rows[symbol][0]]
         return min_cnt
 
     @LazyFunc
@@ -10,6 +10,7 @@ from __future__ import print_function
 import logging
 from collections import Iterable
 
+import numpy as np
 import pandas as pd
 
 from .ABuDataSource import kline_pd
@@ -45,14 +46,15 @@ def _benchmark(df, benchmark, symbol):
     :param symbol: Symbol对象
     :return: 使用基准的时间范围切割返回的金融时间序列
     """
-    if len(df.index & benchmark.kl_pd.index) <= 0:
+    bench_index = benchmark.kl_pd.index
+    if len(df.index & bench_index) <= 0:
         # 如果基准benchmark时间范围和输入的df没有交集，直接返回None
         return None
 
-    # 两个金融时间序列通过loc寻找交集
-    kl_pd = df.loc[benchmark.kl_pd.index]
+    # 两个金融时间序列对齐，index没有重复时使用reindex，与loc结果一致，且不需要处理缺失标签的警告
+    kl_pd = df.reindex(bench_index) if df.index.is_unique else df.loc[bench_index]
     # nan的date个数即为不相交的个数
-    nan_cnt = kl_pd['date'].isnull().value_counts()
+    nan_cnt = int(kl_pd['date'].isnull().sum())
     # 两个金融序列是否相同的结束日期
     same_end = df.index[-1] == benchmark.kl_pd.index[-1]
     # 两个金融序列是否相同的开始日期
@@ -71,36 +73,30 @@ def _benchmark(df, benchmark, symbol):
         # 如果是A股市场的目标，由于停盘频率和周期都会长与其它市场所以再放宽一些
         base_keep_div *= 0.7
 
-    if nan_cnt.index.shape[0] > 0 and nan_cnt.index.tolist().count(True) > 0 \
-            and nan_cnt.loc[True] > benchmark.kl_pd.shape[0] / base_keep_div:
+    if nan_cnt > bench_index.shape[0] / base_keep_div:
         # nan 个数 > 基准base_keep_div分之一放弃
         return None
 
+    if nan_cnt == 0 and 'date_week' in kl_pd.columns and not kl_pd.isnull().values.any():
+        # 与基准完全对齐且没有nan，不需要填充，缓存中的date，date_week与time index一致，不需要重新计算
+        return kl_pd
+
     # 来到这里说明没有放弃，那么就填充nan
-    # 首先nan的交易量是0
-    kl_pd.volume.fillna(value=0, inplace=True)
-    # nan的p_change是0
-    kl_pd.p_change.fillna(value=0, inplace=True)
-    # 先把close填充了，然后用close填充其它的
-    kl_pd.close.fillna(method='pad', inplace=True)
-    kl_pd.close.fillna(method='bfill', inplace=True)
-    # 用close填充open
-    kl_pd.open.fillna(value=kl_pd.close, inplace=True)
-    # 用close填充high
-    kl_pd.high.fillna(value=kl_pd.close, inplace=True)
-    # 用close填充low
-    kl_pd.low.fillna(value=kl_pd.close, inplace=True)
-    # 用close填充pre_close
-    kl_pd.pre_close.fillna(value=kl_pd.close, inplace=True)
-
-    # 细节nan处理完成后，把剩下的nan都填充了
-    kl_pd = kl_pd.fillna(method='pad')
-    # bfill再来一遍只是为了填充最前面的nan
+    # 首先nan的交易量，p_change是0，先把close填充了，然后用close填充open，high，low，pre_close
+    close = kl_pd['close'].fillna(method='pad').fillna(method='bfill').values
+    for col, fill in (('volume', 0), ('p_change', 0), ('close', close), ('open', close), ('high', close),
+                      ('low', close), ('pre_close', close)):
+        values = kl_pd[col].values
+        nan_mask = np.isnan(values)
+        if nan_mask.any():
+            kl_pd[col] = np.where(nan_mask, fill, values)
+    # 细节nan处理完成后，把剩下的nan都填充了，bfill再来一遍只是为了填充最前面的nan
+    kl_pd.fillna(method='pad', inplace=True)
     kl_pd.fillna(method='bfill', inplace=True)
 
-    # pad了数据所以，交易日期date的值需要根据time index重新来一遍
-    kl_pd['date'] = [int(ts.date().strftime("%Y%m%d")) for ts in kl_pd.index]
-    kl_pd['date_week'] = kl_pd['date'].apply(lambda x: ABuDateUtil.week_of_date(str(x), '%Y%m%d'))
+    # pad了数据所以，交易日期date的值需要根据time index重新来一遍，使用整数日期运算批量计算
+    kl_pd['date'] = ABuDateUtil.datetime64_to_date_int(kl_pd.index.values)
+    kl_pd['date_week'] = ABuDateUtil.week_of_date_int(kl_pd['date'].values)
 
     return kl_pd
 
@@ -128,8 +124,9 @@ def _make_kl_df(symbol, data_mode, n_folds, start, end, benchmark, save):
         df = _benchmark(df, benchmark, temp_symbol)
 
     if df is not None:
-        # 规避重复交易日数据风险，subset只设置date做为滤除重复
-        df.drop_duplicates(subset=['date'], inplace=True)
+        if df['date'].duplicated().any():
+            # 规避重复交易日数据风险，subset只设置date做为滤除重复
+            df.drop_duplicates(subset=['date'], inplace=True)
         # noinspection PyProtectedMember
         if not ABuEnv._g_enable_example_env_ipython or 'atr14' not in df.columns or 'atr21' not in df.columns:
             # 非沙盒环境计算, 或者是沙盒但数据本身没有atr14，atr21
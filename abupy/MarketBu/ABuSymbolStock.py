@@ -16,7 +16,7 @@ from ..CoreBu import ABuEnv
 from ..CoreBu.ABuEnv import EMarketTargetType, EMarketSubType
 from ..UtilBu.ABuDTUtil import singleton
 from ..UtilBu.ABuStrUtil import digit_str
-from ..MarketBu.ABuSymbol import Symbol, code_to_symbol
+from ..MarketBu.ABuSymbol import Symbol, code_to_symbol, rows_index
 from ..CrawlBu.ABuXqConsts import columns_map
 
 __author__ = '阿布'
@@ -52,6 +52,10 @@ class AbuStockBaseWrap(object):
                     pd.factorize(warp_self.df.industry)
                 # 用Series包装一下离散后的行业信息，以便方便对应行业索引
                 warp_self.industry_factorize_name_series = pd.Series(industry_factorize_name)
+                # 构建symbol，(exchange, symbol)到df行序号的dict索引，成员测试，行查询不再扫描df
+                warp_self.symbol_rows = rows_index(warp_self.df['symbol'].values)
+                warp_self.exchange_symbol_rows = rows_index(zip(warp_self.df['exchange'].values,
+                                                                warp_self.df['symbol'].values))
 
                 # 将映射中key和value进行互换，columns_map中中文的key和英文的value（详ABuXqConsts），即形成本地语言列名
                 local_columns_map = {columns_map[col_key]: col_key for col_key in columns_map}
@@ -90,6 +94,26 @@ class AbuSymbolStockBase(FreezeAttrMixin):
         """索引设置：对外抛出错误， 即不准许外部设置"""
         raise AttributeError("AbuFuturesCn set value!!!")
 
+    def query_symbol_rows(self, symbol):
+        """
+        通过symbol_rows索引获取symbol对应的df行，即self.df[self.df.symbol == symbol]
+        :param symbol: 不带市场信息的symbol str对象
+        :return: pd.DataFrame对象，没有对应的行返回None
+        """
+        rows = self.symbol_rows.get(symbol)
+        return None if rows is None else self.df.iloc[rows]
+
+    def query_symbol_value(self, symbol, col):
+        """
+        通过symbol_rows索引获取symbol对应的第一行col列的值，即self.df[self.df.symbol == symbol][col].values[0]，
+        不构造行切片
+        :param symbol: 不带市场信息的symbol str对象
+        :param col: df的列名称
+        :return: 对应的值，没有对应的行返回None
+        """
+        rows = self.symbol_rows.get(symbol)
+        return None if rows is None else self.df[col].values[rows[0]]
+
     def query_industry_symbols(self, query_symbol, local_df=True):
         """
         为ABuIndustries模块，提供查询股票所在的行业industry_df子集
@@ -154,8 +178,8 @@ class AbuSymbolCN(AbuSymbolStockBase):
         self.df = pd.read_csv(_stock_code_cn, index_col=0, dtype=str)
 
     def __contains__(self, item):
-        """成员测试：是否item在self.df.symbol.values中"""
-        return digit_str(item) in self.df.symbol.values
+        """成员测试：是否item在self.df.symbol.values中，使用symbol_rows索引"""
+        return digit_str(item) in self.symbol_rows
 
     def __getitem__(self, key):
         """
@@ -171,16 +195,13 @@ class AbuSymbolCN(AbuSymbolStockBase):
         if len(key) > 2:
             head = key[:2].upper()
             if head.isalpha():
-                # 头两位是字面，即认为是exchange信息，直接截取df_filter
-                df_filter = self.df[self.df['exchange'] == head]
-                if not df_filter.empty:
-                    if key[2:] in df_filter.symbol.values:
-                        # get df的行信息，即对应股票的所有信息
-                        return df_filter[df_filter.symbol == key[2:]]
+                # 头两位是字面，即认为是exchange信息，通过(exchange, symbol)索引get df的行信息，即对应股票的所有信息
+                rows = self.exchange_symbol_rows.get((head, key[2:]))
+                if rows is not None:
+                    return self.df.iloc[rows]
             else:
-                if key in self.df.symbol.values:
-                    # get df的行
-                    return self.df[self.df.symbol == key]
+                # get df的行
+                return self.query_symbol_rows(key)
 
     def symbol_func(self, df):
         """
@@ -216,8 +237,13 @@ class AbuSymbolCN(AbuSymbolStockBase):
         :return: 返回EMarketSubType.value值，即子市场（交易所）字符串对象
         """
 
-        if code in self:
+        if code.isdigit():
+            # 纯数字code直接通过symbol_rows索引查询，不构造行切片
             # 忽略一个问题，如果只使用000001不带子市场标识去查询，结果只取第一个，准确查询需要完整标示
+            market = self.query_symbol_value(code, 'market')
+            if market is not None:
+                return market.lower()
+        elif code in self:
             return self[code].market.values[0].lower()
 
         # 如果没查到如果首symbol为6，9为判定为sh
@@ -245,8 +271,8 @@ class AbuSymbolUS(AbuSymbolStockBase):
         self.df = pd.read_csv(_stock_code_us, index_col=0, dtype=str)
 
     def __contains__(self, item):
-        """成员测试：是否item或item[2:]在self.df.symbol.values中"""
-        return item in self.df.symbol.values or (len(item) > 2 and item[2:] in self.df.symbol.values)
+        """成员测试：是否item或item[2:]在self.df.symbol.values中，使用symbol_rows索引"""
+        return item in self.symbol_rows or (len(item) > 2 and item[2:] in self.symbol_rows)
 
     def __getitem__(self, key):
         """
@@ -260,10 +286,10 @@ class AbuSymbolUS(AbuSymbolStockBase):
             return self.df[key]
 
         # get df的行, 即对于股票的详细信息
-        if key in self.df.symbol.values:
-            return self.df[self.df.symbol == key]
-        if len(key) > 2 and key[2:] in self.df.symbol.values:
-            return self.df[self.df.symbol == key[2:]]
+        if key in self.symbol_rows:
+            return self.query_symbol_rows(key)
+        if len(key) > 2:
+            return self.query_symbol_rows(key[2:])
 
     def symbol_func(self, df):
         """
@@ -299,8 +325,10 @@ class AbuSymbolUS(AbuSymbolStockBase):
         :return: 返回EMarketSubType.value值，即子市场（交易所）字符串对象
         """
 
-        if code in self:
-            return self[code].exchange.values[0].upper()
+        if code in self.symbol_rows:
+            return self.query_symbol_value(code, 'exchange').upper()
+        if len(code) > 2 and code[2:] in self.symbol_rows:
+            return self.query_symbol_value(code[2:], 'exchange').upper()
         return default
 
 
@@ -314,8 +342,8 @@ class AbuSymbolHK(AbuSymbolStockBase):
         self.df = pd.read_csv(_stock_code_hk, index_col=0, dtype=str)
 
     def __contains__(self, item):
-        """成员测试：是否item在self.df.symbol.values中"""
-        return digit_str(item) in self.df.symbol.values
+        """成员测试：是否item在self.df.symbol.values中，使用symbol_rows索引"""
+        return digit_str(item) in self.symbol_rows
 
     def __getitem__(self, key):
         """
@@ -329,9 +357,7 @@ class AbuSymbolHK(AbuSymbolStockBase):
             return self.df[key]
 
         # 参数key为股票代码名称，标准化后查询
-        ds = digit_str(key)
-        if ds in self.df.symbol.values:
-            return self.df[self.df.symbol == ds]
+        return self.query_symbol_rows(digit_str(key))
 
     def symbol_func(self, df):
         """
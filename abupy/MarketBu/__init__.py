@@ -4,7 +4,7 @@ from .ABuDataBase import BaseMarket, FuturesBaseMarket, StockBaseMarket, TCBaseM
 from .ABuDataParser import AbuDataParseWrap
 from . import ABuSymbolPd
 from .ABuSymbolPd import get_price
-from .ABuSymbol import IndexSymbol, Symbol, code_to_symbol, search_to_symbol_dict
+from .ABuSymbol import IndexSymbol, Symbol, code_to_symbol, code_to_symbols, search_to_symbol_dict
 from . import ABuSymbol
 from ..MarketBu.ABuSymbolStock import AbuSymbolCN, AbuSymbolUS, AbuSymbolHK, query_stock_info
 from .ABuSymbolFutures import AbuFuturesCn, AbuFuturesGB
@@ -37,6 +37,7 @@ __all__ = [
     'IndexSymbol',
     'Symbol',
     'code_to_symbol',
+    'code_to_symbols',
     'search_to_symbol_dict',
     'ABuIndustries',
     'ABuMarketDrawing',
@@ -19,6 +19,7 @@ from ..MarketBu.ABuDataCheck import all_market_env_check
 from ..CoreBu.ABuEnvProcess import add_process_env_sig, AbuEnvProcess
 from ..UtilBu.ABuProgress import AbuMulPidProgress, AbuProgress
 from ..CoreBu.ABuParallel import delayed, Parallel
+from ..CoreBu import ABuParallel
 from ..UtilBu import ABuProgress
 from ..TradeBu.ABuBenchmark import AbuBenchmark
 from ..TradeBu.ABuCapital import AbuCapital
@@ -146,8 +147,10 @@ class AbuCrossVal(object):
         """
         # 回测历史时间周期设置只依赖标尺AbuBenchmark的构造时间长度
         benchmark = AbuBenchmark(benchmark, n_folds=n_folds)
+        # 每一个相关范围段是一个任务，动态调度模式下进程数不超过cpu数量，相关范围段通过进程池的共享队列分配
+        n_jobs = ABuEnv.g_cpu_cnt if ABuParallel.g_enable_dynamic_schedule else cv
         parallel = Parallel(
-            n_jobs=cv, verbose=0, pre_dispatch='2*n_jobs')
+            n_jobs=min(n_jobs, cv), verbose=0, pre_dispatch='2*n_jobs')
         # 多任务环境下的内存环境拷贝对象AbuEnvProcess
         p_nev = AbuEnvProcess()
 
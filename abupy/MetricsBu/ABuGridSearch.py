@@ -12,25 +12,35 @@ from itertools import product, chain
 
 import logging
 import numpy as np
+import pandas as pd
 
 from ..TradeBu.ABuBenchmark import AbuBenchmark
 from ..TradeBu.ABuCapital import AbuCapital
 from ..TradeBu.ABuKLManager import AbuKLManager
 from .ABuMetricsScore import AbuScoreTuple, WrsmScorer, make_scorer
+from .ABuMetricsBase import AbuMetricsBase
 from ..AlphaBu.ABuPickStockMaster import AbuPickStockMaster
 from ..AlphaBu.ABuPickTimeMaster import AbuPickTimeMaster
+from ..AlphaBu import ABuPickTimeMaster
+from ..AlphaBu.ABuPickTimeExecute import do_symbols_with_batch_factors
 from ..CoreBu.ABuEnvProcess import add_process_env_sig, AbuEnvProcess
-from ..CoreBu.ABuParallel import delayed, Parallel
+from ..CoreBu.ABuParallel import delayed, Parallel, split_parallel_task, parallel_jobs
 from ..CoreBu import ABuEnv
 from ..CoreBu.ABuEnv import EMarketDataFetchMode
 from ..UtilBu.ABuProgress import AbuMulPidProgress
-from ..MarketBu.ABuMarket import split_k_market
 from ..MarketBu.ABuDataCheck import check_symbol_data
 from ..UtilBu import ABuProgress
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
 
+"""
+    是否开启grid search批量择时，默认开启，开启后没有选股因子的因子组合在每一个任务进程中以交易对象为外层循环，
+    每一个交易对象的金融时间序列只准备一次，进程中所有的因子组合共用一次交易日递进，如需关闭使用下面代码：
+    abupy.metrics.grid_search.g_enable_grid_batch = False
+"""
+g_enable_grid_batch = True
+
 
 class ParameterGrid(object):
     """参数进行product辅助生成类"""
@@ -125,6 +135,10 @@ def grid_search_mul_process(read_cash, benchmark, factors, choice_symbols, kl_pd
     :param kl_pd_manager: 金融时间序列管理对象，AbuKLManager实例
     :return: AbuScoreTuple对象
     """
+    if g_enable_grid_batch and all(factor['stock_pickers'] is None for factor in factors):
+        # 没有选股因子的因子组合使用批量择时
+        return _grid_search_batch(read_cash, benchmark, factors, choice_symbols, kl_pd_manager=kl_pd_manager)
+
     # 由于grid_search_mul_process以处于多任务运行环境，所以不内部不再启动多任务，使用1个进程选股
     n_process_pick_stock = 1
     # 由于grid_search_mul_process以处于多任务运行环境，所以不内部不再启动多任务，使用1个进程择时
@@ -173,6 +187,34 @@ def grid_search_mul_process(read_cash, benchmark, factors, choice_symbols, kl_pd
     return result_tuple_array
 
 
+def _grid_search_batch(read_cash, benchmark, factors, choice_symbols, kl_pd_manager=None):
+    """
+    grid_search_mul_process中没有选股因子时使用的批量择时：所有因子组合通过do_symbols_with_batch_factors
+    以交易对象为外层循环一次完成择时，之后每一个因子组合的择时结果独立合并，作用在自己的资金对象上，
+    返回的AbuScoreTuple对象序列与逐个因子组合回测的结果一致
+    """
+    # 每一个因子组合独立的资金管理对象
+    capitals = [AbuCapital(read_cash, benchmark) for _ in factors]
+    if choice_symbols is None or len(choice_symbols) == 0:
+        logging.info('pick stock result is zero!')
+        return [AbuScoreTuple(None, None, capital, benchmark, factor['buy_factors'], factor['sell_factors'], None)
+                for factor, capital in zip(factors, capitals)]
+
+    if kl_pd_manager is None:
+        kl_pd_manager = AbuKLManager(benchmark, capitals[0])
+    factors_batch = [(factor['buy_factors'], factor['sell_factors']) for factor in factors]
+    batch_out = do_symbols_with_batch_factors(choice_symbols, benchmark, factors_batch, capitals,
+                                              kl_pd_manager=kl_pd_manager)
+
+    result_tuple_array = []
+    for factor, capital, sub_out in zip(factors, capitals, batch_out):
+        orders_pd, action_pd, _ = AbuPickTimeMaster.merge_pick_time_out(choice_symbols, [sub_out], capital,
+                                                                        kl_pd_manager, show_progress=False)
+        result_tuple_array.append(AbuScoreTuple(orders_pd, action_pd, capital, benchmark, factor['buy_factors'],
+                                                factor['sell_factors'], None))
+    return result_tuple_array
+
+
 # noinspection PyAttributeOutsideInit
 class GridSearch(object):
     """最优grid search对外接口类"""
@@ -390,6 +432,109 @@ class GridSearch(object):
         :return: (scores: 评分结果dict， score_tuple_array: 因子组合序列)
         """
 
+        n_jobs, pass_kl_pd_manager = self._prepare_fit(n_jobs)
+        factors_product = self._factors_product()
+        score_tuple_array = self._fit_factors(factors_product, self.choice_symbols, n_jobs, pass_kl_pd_manager)
+        # 使用ABuMetricsScore中make_scorer对多个参数组合的交易结果进行评分，详情阅读ABuMetricsScore模块
+        scores = make_scorer(score_tuple_array, score_class, weights=self.score_weights,
+                             metrics_class=self.metrics_class)
+        # 评分结果最好的赋予best_score_tuple_grid
+        self.best_score_tuple_grid = score_tuple_array[scores.index[-1]]
+        return scores, score_tuple_array
+
+    def fit_halving(self, score_class=WrsmScorer, n_jobs=-1, eta=3, min_symbols=4, random_state=0):
+        """
+        successive halving模式寻找最优因子参数组合：首先在choice_symbols的子样本上回测所有因子组合并评分，
+        只保留评分最好的1/eta因子组合晋级，晋级的因子组合使用eta倍的交易对象继续回测，直到最后一轮使用
+        全部choice_symbols回测，每一轮的交易对象都包含上一轮的交易对象，返回最后一轮的评分结果，
+        回测代价（因子组合数 × 交易对象数）与穷举fit的对比结果保存在self.halving_report中，
+        需要明确设置choice_symbols，choice_symbols为None的全市场选股模式无法确定每一轮的交易对象子样本
+        :param score_class: 对回测结果进行评分的评分类，AbuBaseScorer类型，非对象，只传递类信息
+        :param n_jobs: 默认回测并行的任务数，默认-1, 即启动与cpu数量相同的进程数
+        :param eta: 每一轮保留1/eta的因子组合，且交易对象数量扩大eta倍，默认3
+        :param min_symbols: 第一轮最少使用的交易对象数量，默认4
+        :param random_state: 交易对象子样本抽取的随机种子，默认0
+        :return: (scores: 最后一轮评分结果， score_tuple_array: 最后一轮因子组合序列)
+        """
+        if eta < 2:
+            raise ValueError('eta must >= 2, not {}'.format(eta))
+        if self.choice_symbols is None or len(self.choice_symbols) == 0:
+            raise ValueError('fit_halving need explicit choice_symbols, use fit for all market stock pickers!')
+
+        n_jobs, pass_kl_pd_manager = self._prepare_fit(n_jobs)
+        factors_product = self._factors_product()
+        n_symbols = len(self.choice_symbols)
+        # 轮数由因子组合数量与交易对象数量共同决定：因子组合不能淘汰到少于1个，第一轮交易对象不能少于min_symbols
+        rungs = 0
+        while len(factors_product) // (eta ** (rungs + 1)) >= 1 and \
+                n_symbols // (eta ** (rungs + 1)) >= max(min_symbols, 1):
+            rungs += 1
+        # 打乱交易对象顺序，每一轮都使用打乱后序列的前n个交易对象，保证晋级后的交易对象包含之前的交易对象
+        shuffle_ind = np.random.RandomState(random_state).permutation(n_symbols)
+
+        report = []
+        scores = score_tuple_array = None
+        # 所有轮次共享一次写入的memmap池，每一轮只生成自己交易对象的池索引
+        own_kl_pool = ABuPickTimeMaster.g_enable_kl_pool and n_jobs > 1 and pass_kl_pd_manager is not None
+        if own_kl_pool:
+            self.kl_pd_manager.dump_pick_time_pool()
+        try:
+            for rung in np.arange(0, rungs + 1):
+                if rung == rungs:
+                    # 最后一轮使用全部的choice_symbols，保持原始顺序
+                    rung_symbols = self.choice_symbols
+                else:
+                    rung_symbols = [self.choice_symbols[ind] for ind in
+                                    np.sort(shuffle_ind[:n_symbols // (eta ** (rungs - rung))])]
+                score_tuple_array = self._fit_factors(factors_product, rung_symbols, n_jobs, pass_kl_pd_manager)
+                scores = self._halving_scores(score_tuple_array, score_class)
+                report.append([rung, len(factors_product), len(rung_symbols),
+                               len(factors_product) * len(rung_symbols)])
+                logging.info(u'halving第{}轮: 因子组合{}种, 交易对象{}个, 有效评分{}个'.format(
+                    rung, len(factors_product), len(rung_symbols), scores.shape[0]))
+                if rung == rungs:
+                    if scores.shape[0] == 0:
+                        raise ValueError('fit_halving all factors gen no valid orders with all choice_symbols!')
+                    break
+                if scores.shape[0] == 0:
+                    # 子样本上所有因子组合都没有可度量的交易结果，无法淘汰，全部晋级
+                    continue
+                # 评分从小->大排序，有效评分的因子组合从好到坏，没有有效评分的因子组合排在最后
+                keep_cnt = max(1, len(factors_product) // eta)
+                rank_ind = list(scores.index[::-1]) + [ind for ind in np.arange(0, len(factors_product))
+                                                       if ind not in scores.index]
+                # 晋级的因子组合保持在factors_product中原有的顺序
+                factors_product = [factors_product[ind] for ind in sorted(rank_ind[:keep_cnt])]
+        finally:
+            if own_kl_pool:
+                self.kl_pd_manager.clear_pick_time_pool()
+
+        self.halving_report = pd.DataFrame(report, columns=['rung', 'factors', 'symbols', 'cost']).set_index('rung')
+        exhaustive_cost = len(self._factors_product()) * n_symbols
+        halving_cost = self.halving_report['cost'].sum()
+        logging.info(u'halving回测代价{}, 穷举回测代价{}, 节省{:.2%}'.format(
+            halving_cost, exhaustive_cost, 1 - halving_cost / exhaustive_cost))
+        self.best_score_tuple_grid = score_tuple_array[scores.index[-1]]
+        return scores, score_tuple_array
+
+    def _halving_scores(self, score_tuple_array, score_class):
+        """
+        fit_halving中每一轮的评分，子样本交易对象上所有因子组合都没有可度量的交易结果时，
+        make_scorer无法评分，返回空的评分序列
+        """
+        metrics_class = self.metrics_class if self.metrics_class is not None and issubclass(
+            self.metrics_class, AbuMetricsBase) else AbuMetricsBase
+        if not any(metrics_class(score_tuple.orders_pd, score_tuple.action_pd, score_tuple.capital,
+                                 score_tuple.benchmark).valid for score_tuple in score_tuple_array):
+            return pd.Series([], name='score')
+        return make_scorer(score_tuple_array, score_class, weights=self.score_weights,
+                           metrics_class=self.metrics_class)
+
+    def _prepare_fit(self, n_jobs):
+        """
+        回测前的准备工作：没有选股因子时外层统一进行交易数据收集，确定并行的任务数
+        :return: (n_jobs, 传递给grid_search_mul_process的金融时间序列管理对象)
+        """
         pass_kl_pd_manager = None
         if len(self.stock_pickers_product) == 1 and self.stock_pickers_product[0] is None:
             # 如果没有设置选股因子，外层统一进行交易数据收集，之所以是1，以为在__init__中[None]的设置
@@ -400,7 +545,7 @@ class GridSearch(object):
             pass_kl_pd_manager = self.kl_pd_manager
 
         if n_jobs <= 0:
-            # 因为下面要根据n_jobs来split_k_market
+            # 因为下面要根据n_jobs来split_parallel_task
             n_jobs = ABuEnv.g_cpu_cnt
 
         # 只有E_DATA_FETCH_FORCE_LOCAL才进行多任务模式，否则回滚到单进程模式n_jobs = 1
@@ -409,31 +554,48 @@ class GridSearch(object):
             # 2. MAC OS 10.9 之后并行联网＋numpy 系统bug crash，卡死等问题
             logging.info('batch get only support E_DATA_FETCH_FORCE_LOCAL for Parallel!')
             n_jobs = 1
+        return n_jobs, pass_kl_pd_manager
 
-        factors_product = [{'buy_factors': item[0], 'sell_factors': item[1], 'stock_pickers': item[2]} for item in
-                           product(self.buy_factors_product, self.sell_factors_product, self.stock_pickers_product)]
+    def _factors_product(self):
+        """选股因子，买入因子，卖出因子product后的所有因子组合"""
+        return [{'buy_factors': item[0], 'sell_factors': item[1], 'stock_pickers': item[2]} for item in
+                product(self.buy_factors_product, self.sell_factors_product, self.stock_pickers_product)]
 
-        # 将factors切割为n_jobs个子序列，这样可以每个进程处理一个子序列
-        process_factors = split_k_market(n_jobs, market_symbols=factors_product)
-        # 因为切割会有余数，所以将原始设置的进程数切换为分割好的个数, 即32 -> 33 16 -> 17
-        n_jobs = len(process_factors)
+    def _fit_factors(self, factors_product, choice_symbols, n_jobs, pass_kl_pd_manager):
+        """
+        使用choice_symbols对factors_product中的所有因子组合进行回测
+        :return: 与factors_product顺序一致的AbuScoreTuple对象序列
+        """
+        # 动态调度模式下使用因子组合中的因子数量做为代价提示
+        factors_costs = [sum(len(factors[factors_key]) for factors_key in factors if factors[factors_key] is not None)
+                         for factors in factors_product]
+        # 将factors切割为子序列，这样可以每个进程处理一个子序列
+        process_factors = split_parallel_task(n_jobs, factors_product, costs=factors_costs)
+        # 根据切割好的子序列确定并行的进程数
+        n_jobs = parallel_jobs(n_jobs, process_factors)
         parallel = Parallel(
             n_jobs=n_jobs, verbose=0, pre_dispatch='2*n_jobs')
         # 多任务环境下的内存环境拷贝对象AbuEnvProcess
         p_nev = AbuEnvProcess()
-        # 多层迭代各种类型因子，没一种因子组合作为参数启动一个新进程，运行grid_search_mul_process
-        out_abu_score_tuple = parallel(
-            delayed(grid_search_mul_process)(self.read_cash, self.benchmark, factors,
-                                             self.choice_symbols, pass_kl_pd_manager, env=p_nev)
-            for factors in process_factors)
+        # 多进程下使用memmap池，所有进程共享一份金融时间序列，不再pickle传递装载了所有数据的kl_pd_manager
+        use_kl_pool = ABuPickTimeMaster.g_enable_kl_pool and n_jobs > 1 and pass_kl_pd_manager is not None
+        # 已经写入的memmap池（eg：fit_halving中所有轮次共享）直接使用，由写入者负责删除
+        own_kl_pool = use_kl_pool and self.kl_pd_manager.pick_time_pool is None
+        if own_kl_pool:
+            self.kl_pd_manager.dump_pick_time_pool()
+        if use_kl_pool:
+            pass_kl_pd_manager = self.kl_pd_manager.pool_sub_manager(choice_symbols)
+        try:
+            # 多层迭代各种类型因子，没一种因子组合作为参数启动一个新进程，运行grid_search_mul_process
+            out_abu_score_tuple = parallel(
+                delayed(grid_search_mul_process)(self.read_cash, self.benchmark, factors,
+                                                 choice_symbols, pass_kl_pd_manager, env=p_nev)
+                for factors in process_factors)
+        finally:
+            if own_kl_pool:
+                self.kl_pd_manager.clear_pick_time_pool()
 
         # 都完事时检测一下还有没有ui进度条
         ABuProgress.do_check_process_is_dead()
         # 返回的AbuScoreTuple序列转换score_tuple_array, 即摊开多个子结果序列eg: ([], [], [], [])->[]
-        score_tuple_array = list(chain.from_iterable(out_abu_score_tuple))
-        # 使用ABuMetricsScore中make_scorer对多个参数组合的交易结果进行评分，详情阅读ABuMetricsScore模块
-        scores = make_scorer(score_tuple_array, score_class, weights=self.score_weights,
-                             metrics_class=self.metrics_class)
-        # 评分结果最好的赋予best_score_tuple_grid
-        self.best_score_tuple_grid = score_tuple_array[scores.index[-1]]
-        return scores, score_tuple_array
+        return list(chain.from_iterable(out_abu_score_tuple))
@@ -1 +1,4 @@
 from __future__ import absolute_import
+
+# noinspection all
+from . import ABuGridSearch as grid_search
@@ -41,6 +41,23 @@ def valid_check(func):
     return wrapper
 
 
+def calc_max_draw_down(values):
+    """
+    计算序列上的最大回撤：每一个位置之前（不包括当前位置）的最大值减去当前位置的值，取最大的一次，
+    通过累计最大值一次计算，起始位置为之前最大值最后一次出现的位置，结束位置为最早达到最大回撤的位置
+    :param values: np.array序列，如资金序列
+    :return: (起始位置，结束位置，回撤值)，序列长度不足2时返回(0, 0, -np.inf)
+    """
+    if values.shape[0] < 2:
+        return 0, 0, -np.inf
+    cum_max = np.maximum.accumulate(values)
+    # 累计最大值最后一次出现的位置
+    cum_max_pos = np.maximum.accumulate(np.where(values == cum_max, np.arange(values.shape[0]), 0))
+    diff = cum_max[:-1] - values[1:]
+    end_pos = diff.argmax()
+    return cum_max_pos[end_pos], end_pos + 1, diff[end_pos]
+
+
 class AbuMetricsBase(object):
     """主要适配股票类型交易对象的回测结果度量"""
 
@@ -201,13 +218,10 @@ class AbuMetricsBase(object):
 
         self.orders_pd['buy_date'] = self.orders_pd['buy_date'].astype(int)
         self.orders_pd[self.orders_pd['result'] != 0]['sell_date'].astype(int, copy=False)
-        # 因子的单子的持股时间长度计算
-        self.orders_pd['keep_days'] = self.orders_pd.apply(lambda x:
-                                                           ABuDateUtil.diff(x['buy_date'],
-                                                                            ABuDateUtil.current_date_int()
-                                                                            if x['result'] == 0 else x[
-                                                                                'sell_date']),
-                                                           axis=1)
+        # 因子的单子的持股时间长度计算，还没有卖出的单子使用当前日期计算
+        keep_end_date = np.where(self.orders_pd['result'].values == 0, ABuDateUtil.current_date_int(),
+                                 self.orders_pd['sell_date'].values)
+        self.orders_pd['keep_days'] = ABuDateUtil.diff_days(self.orders_pd['buy_date'].values, keep_end_date)
         # 筛出已经成交了的单子
         self.order_has_ret = self.orders_pd[self.orders_pd['result'] != 0]
 
@@ -282,8 +296,10 @@ class AbuMetricsBase(object):
             66     20150715
             67     20150717
         """
-        dt_fmt = cp_date.apply(lambda order: ABuDateUtil.str_to_datetime(str(order), '%Y%m%d'))
-        dt_fmt = dt_fmt.apply(lambda order: (order - dt_fmt.iloc[0]).days)
+        # int日期序列批量转换为datetime64[D]，计算与第一个生效日期间隔的天数
+        dt_fmt = ABuDateUtil.date_int_to_datetime64(cp_date.values)
+        dt_fmt = pd.Series((dt_fmt - dt_fmt[0]).astype(np.int64) if dt_fmt.shape[0] > 0 else dt_fmt.astype(np.int64),
+                           index=cp_date.index)
         # 前后两两生效交易时间相减
         self.diff_dt = dt_fmt - dt_fmt.shift(1)
         # 计算平均生效间隔时间
@@ -294,7 +310,7 @@ class AbuMetricsBase(object):
             self.cost_stats = 0
             self.buy_deal_rate = 0
         else:
-            self.act_buy['cost'] = self.act_buy.apply(lambda order: order.Price * order.Cnt, axis=1)
+            self.act_buy['cost'] = self.act_buy['Price'] * self.act_buy['Cnt']
             # 计算cost各种统计度量值
             self.cost_stats = ABuStatsUtil.stats_namedtuple(self.act_buy['cost'])
 
@@ -455,22 +471,10 @@ class AbuMetricsBase(object):
         """可视化最大回撤"""
 
         cb_earn = self.capital.capital_pd['capital_blance'] - self.capital.read_cash
-        shift = cb_earn.shape[0]
         max_draw_down = {-1: -1}
-        cap_pd_index = cb_earn.index.tolist()
-
-        for sf in np.arange(1, shift):
-            sub_val = cb_earn.iloc[sf]
-            sf_val = cb_earn[:sf]
-            sf_val = sf_val.drop_duplicates(keep='last')
-
-            diff = sf_val.values - sub_val
-
-            if diff.max() > list(six.itervalues(max_draw_down))[0]:
-                st_ind = diff.argmax()
-                st_ind = sf_val.index[st_ind]
-                end_ind = cap_pd_index[sf]
-                max_draw_down = {(st_ind, end_ind): diff.max()}
+        st_pos, end_pos, max_diff = calc_max_draw_down(cb_earn.values)
+        if end_pos > 0 and max_diff > list(six.itervalues(max_draw_down))[0]:
+            max_draw_down = {(cb_earn.index[st_pos], cb_earn.index[end_pos]): max_diff}
 
         down_rate = list(six.itervalues(max_draw_down))[0] / self.capital.capital_pd['capital_blance'].loc[
             list(six.iterkeys(max_draw_down))[0][0]]
@@ -0,0 +1,247 @@
+# -*- encoding:utf-8 -*-
+"""
+    流式度量模块：与AbuMetricsBase的度量项含义一致，不需要持有完整的orders_pd，action_pd，
+    每一次只接收新产生的交易单，资金结算后的交易行为，累计计数以及矩，随时读取当前的度量结果
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+from ..ExtBu.empyrical import stats
+from ..CoreBu import ABuEnv
+from ..UtilBu import ABuDateUtil
+from ..UtilBu.ABuStatsUtil import AbuMomentsTuple
+
+__author__ = '阿布'
+__weixin__ = 'abu_quant'
+
+
+def _merge_moments(moments, arr):
+    """
+    将arr的中心矩合并到已有的(count, min, max, mean, m2, m3, m4)中，m2，m3，m4为中心矩的和，
+    分块合并避免大数值幂和相减带来的精度损失
+    """
+    count_a, min_a, max_a, mean_a, m2_a, m3_a, m4_a = moments
+    count_b = arr.shape[0]
+    if count_b == 0:
+        return moments
+    mean_b = arr.mean()
+    dev = arr - mean_b
+    m2_b, m3_b, m4_b = (dev ** 2).sum(), (dev ** 3).sum(), (dev ** 4).sum()
+    if count_a == 0:
+        return count_b, arr.min(), arr.max(), mean_b, m2_b, m3_b, m4_b
+
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / count
+    m3 = m3_a + m3_b + delta ** 3 * count_a * count_b * (count_a - count_b) / count ** 2 + \
+        3 * delta * (count_a * m2_b - count_b * m2_a) / count
+    m4 = m4_a + m4_b + delta ** 4 * count_a * count_b * (count_a ** 2 - count_a * count_b + count_b ** 2) / count ** 3 \
+        + 6 * delta ** 2 * (count_a ** 2 * m2_b + count_b ** 2 * m2_a) / count ** 2 \
+        + 4 * delta * (count_a * m3_b - count_b * m3_a) / count
+    return count, min(min_a, arr.min()), max(max_a, arr.max()), mean, m2, m3, m4
+
+
+class AbuMetricsStream(object):
+    """
+        流式度量类，通过update_orders，update_actions，update_capital分批累计，
+        度量项与AbuMetricsBase中同名度量项的计算方式一致，eg：
+            metrics_stream = AbuMetricsStream(benchmark)
+            metrics_stream.update_orders(orders_pd)
+            ABuTradeExecute.apply_action_to_capital(capital, action_pd, kl_pd_manager, metrics_stream=metrics_stream)
+            metrics_stream.win_rate, metrics_stream.buy_deal_rate, metrics_stream.algorithm_sharpe
+    """
+
+    def __init__(self, benchmark):
+        """
+        :param benchmark: 交易基准对象，AbuBenchmark实例对象
+        """
+        self.benchmark = benchmark
+
+        # 交易单累计：交易单数量，已经有结果的交易单中盈利，亏损的数量
+        self.order_cnt = 0
+        self.win_cnt = 0
+        self.loss_cnt = 0
+        # 有结果的交易单中盈利，亏损交易单的数量，profit_cg和，profit和
+        self.gains_cnt = 0
+        self.losses_cnt = 0
+        self.gains_cg_sum = 0.
+        self.losses_cg_sum = 0.
+        self.profit_win_sum = 0.
+        self.profit_loss_sum = 0.
+        self.profit_cg_sum = 0.
+        self.all_profit = 0.
+        # 持股天数需要计算中位数，分块保存
+        self._keep_days = list()
+
+        # 交易行为累计：买入行为数量，成交了的买入行为数量，成交了的买入行为的交易日集合
+        self.buy_cnt = 0
+        self.buy_deal_cnt = 0
+        self._effect_dates = set()
+        # 成交了的买入行为花费的(count, min, max, mean, m2, m3, m4)
+        self._cost_moments = (0, np.inf, -np.inf, 0., 0., 0., 0.)
+
+    def __str__(self):
+        """打印对象显示：交易单数量，胜率，买入成交比例"""
+        return 'order_cnt:{}, win_rate:{}, buy_deal_rate:{}'.format(self.order_cnt, self.win_rate,
+                                                                     self.buy_deal_rate)
+
+    __repr__ = __str__
+
+    def update_orders(self, orders_pd):
+        """
+        累计新产生的交易单，对应AbuMetricsBase._metrics_sell_stats
+        :param orders_pd: 新产生的交易单构成的pd.DataFrame对象
+        """
+        if orders_pd is None or orders_pd.empty:
+            return
+        result = orders_pd['result'].values
+        profit = orders_pd['profit'].values
+        profit_cg = profit / (orders_pd['buy_price'].values * orders_pd['buy_cnt'].values)
+        has_ret = result != 0
+
+        self.order_cnt += orders_pd.shape[0]
+        self.win_cnt += int((result == 1).sum())
+        self.loss_cnt += int((result == -1).sum())
+
+        with np.errstate(invalid='ignore'):
+            # 还没有卖出的单子profit为nan
+            win = has_ret & (profit_cg > 0)
+            loss = has_ret & (profit_cg < 0)
+        self.gains_cg_sum += profit_cg[win].sum()
+        self.losses_cg_sum += profit_cg[loss].sum()
+        self.profit_win_sum += profit[win].sum()
+        self.profit_loss_sum += profit[loss].sum()
+        self.profit_cg_sum += profit_cg[has_ret].sum()
+        self.all_profit += profit[has_ret].sum()
+        self.gains_cnt += int(win.sum())
+        self.losses_cnt += int(loss.sum())
+
+        # 还没有卖出的单子使用当前日期计算持股天数
+        keep_end_date = np.where(~has_ret, ABuDateUtil.current_date_int(), orders_pd['sell_date'].values)
+        self._keep_days.append(ABuDateUtil.diff_days(orders_pd['buy_date'].values, keep_end_date))
+
+    def update_actions(self, action_pd):
+        """
+        累计资金结算后的交易行为，即apply_action_to_capital后有deal列的action_pd，对应AbuMetricsBase._metrics_action_stats
+        :param action_pd: 资金结算后的交易行为构成的pd.DataFrame对象
+        """
+        if action_pd is None or action_pd.empty:
+            return
+        is_buy = (action_pd['action'] == 'buy').values
+        deal = action_pd['deal'].values.astype(bool)
+        act_buy = is_buy & deal
+
+        self.buy_cnt += int(is_buy.sum())
+        self.buy_deal_cnt += int(act_buy.sum())
+        self._effect_dates.update(action_pd['Date'].values[act_buy].astype(int).tolist())
+        cost = (action_pd['Price'].values[act_buy] * action_pd['Cnt'].values[act_buy]).astype(np.float64)
+        self._cost_moments = _merge_moments(self._cost_moments, cost)
+
+    def update_capital(self, capital):
+        """
+        资金结算完成后更新涉及资金的度量，对应AbuMetricsBase._metrics_base_stats，
+        资金时间序列长度为基准的交易日数量，与交易单，交易行为的数量无关
+        :param capital: 资金类AbuCapital实例化对象，需要已经完成结算
+        """
+        capital_pd = capital.capital_pd
+        if 'capital_blance' not in capital_pd:
+            return
+        self.cash_utilization = 1 - (capital_pd.cash_blance / capital_pd.capital_blance).mean()
+        benchmark_returns = np.round(self.benchmark.kl_pd.close.pct_change(), 3)
+        algorithm_returns = np.round(capital_pd['capital_blance'].pct_change(), 3)
+        self.num_trading_days = len(benchmark_returns)
+        self.benchmark_period_returns = stats.cum_returns(benchmark_returns)[-1]
+        self.algorithm_period_returns = stats.cum_returns(algorithm_returns)[-1]
+        self.algorithm_annualized_returns = \
+            (ABuEnv.g_market_trade_year / self.num_trading_days) * self.algorithm_period_returns
+        self.algorithm_volatility = stats.annual_volatility(algorithm_returns)
+        self.algorithm_sharpe = stats.sharpe_ratio(algorithm_returns)
+        self.max_drawdown = stats.max_drawdown(algorithm_returns.values)
+
+    @property
+    def win_rate(self):
+        """胜率，与AbuMetricsBase一致，只有盈利或者只有亏损的交易单时为对应的result值"""
+        has_ret_cnt = self.win_cnt + self.loss_cnt
+        if self.win_cnt > 0 and self.loss_cnt > 0:
+            return self.win_cnt / has_ret_cnt
+        elif has_ret_cnt > 0:
+            return 1 if self.win_cnt > 0 else -1
+        return 0
+
+    @property
+    def gains_mean(self):
+        """策略期望收益"""
+        return self.gains_cg_sum / self.gains_cnt if self.gains_cnt > 0 else 0.0
+
+    @property
+    def losses_mean(self):
+        """策略期望亏损"""
+        return self.losses_cg_sum / self.losses_cnt if self.losses_cnt > 0 else 0.0
+
+    @property
+    def win_loss_profit_rate(self):
+        """忽略仓位控的前提下的盈亏比"""
+        profit_cg_win_sum = self.profit_win_sum
+        profit_cg_loss_sum = self.profit_loss_sum
+        if profit_cg_win_sum * profit_cg_loss_sum == 0 and profit_cg_win_sum + profit_cg_loss_sum > 0:
+            # 其中有一个是0的，要转换成一个最小统计单位计算盈亏比，与AbuMetricsBase一致
+            if profit_cg_win_sum == 0:
+                profit_cg_win_sum = 0.01
+            if profit_cg_loss_sum == 0:
+                profit_cg_win_sum = 0.01
+        return 0 if profit_cg_loss_sum == 0 else -round(profit_cg_win_sum / profit_cg_loss_sum, 4)
+
+    @property
+    def keep_days(self):
+        """所有交易单的持股天数序列"""
+        return np.concatenate(self._keep_days) if len(self._keep_days) > 0 else np.zeros(0, dtype=np.int64)
+
+    @property
+    def keep_days_mean(self):
+        """策略持股天数平均值"""
+        keep_days = self.keep_days
+        return keep_days.mean() if keep_days.shape[0] > 0 else np.nan
+
+    @property
+    def keep_days_median(self):
+        """策略持股天数中位数"""
+        keep_days = self.keep_days
+        return np.median(keep_days) if keep_days.shape[0] > 0 else np.nan
+
+    @property
+    def effect_mean_day(self):
+        """因子平均生效间隔时间，即成交了的买入交易日去除重复后前后两两间隔天数的平均值"""
+        if len(self._effect_dates) < 2:
+            return np.nan
+        effect_dates = ABuDateUtil.date_int_to_datetime64([min(self._effect_dates), max(self._effect_dates)])
+        return (effect_dates[1] - effect_dates[0]).astype(np.int64) / (len(self._effect_dates) - 1)
+
+    @property
+    def buy_deal_rate(self):
+        """资金对应的买入成交比例"""
+        return self.buy_deal_cnt / self.buy_cnt if self.buy_cnt > 0 else 0
+
+    @property
+    def cost_stats(self):
+        """成交了的买入行为花费的统计度量值，与ABuStatsUtil.stats_namedtuple一致"""
+        count, cost_min, cost_max, mean, m2, m3, m4 = self._cost_moments
+        if count == 0:
+            return 0
+        var = m2 / count
+        skewness = 0 if var == 0 else (m3 / count) / var ** 1.5
+        kurtosis = -3 if var == 0 else (m4 / count) / var ** 2 - 3
+        return AbuMomentsTuple(count, cost_max, cost_min, mean, np.sqrt(var), skewness, kurtosis)
+
+    def to_series(self):
+        """当前累计的主要度量结果转换为pd.Series对象"""
+        items = ['order_cnt', 'win_rate', 'gains_mean', 'losses_mean', 'win_loss_profit_rate', 'all_profit',
+                 'keep_days_mean', 'keep_days_median', 'effect_mean_day', 'buy_deal_rate']
+        items.extend([item for item in ('algorithm_period_returns', 'algorithm_sharpe', 'max_drawdown')
+                      if hasattr(self, item)])
+        return pd.Series([getattr(self, item) for item in items], index=items)
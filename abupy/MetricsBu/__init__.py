@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from .ABuGridSearch import ParameterGrid, GridSearch
 from .ABuCrossVal import AbuCrossVal
 from .ABuMetricsBase import AbuMetricsBase, MetricsDemo
+from .ABuMetricsStream import AbuMetricsStream
 from .ABuMetricsFutures import AbuMetricsFutures
 from .ABuMetricsTC import AbuMetricsTC
 from .ABuMetricsScore import AbuBaseScorer, WrsmScorer, AbuScoreTuple, make_scorer
@@ -18,6 +19,7 @@ __all__ = [
     'AbuMetricsFutures',
     'AbuMetricsTC',
     'MetricsDemo',
+    'AbuMetricsStream',
     'AbuBaseScorer',
     'WrsmScorer',
     'make_scorer',
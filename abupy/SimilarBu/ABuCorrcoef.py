@@ -7,6 +7,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
@@ -15,7 +18,6 @@ from enum import Enum
 
 from ..UtilBu import ABuDTUtil
 from ..CoreBu.ABuFixes import rankdata
-from ..CoreBu.ABuPdHelper import pd_rolling_corr
 # noinspection PyUnresolvedReferences
 from ..CoreBu.ABuFixes import zip
 
@@ -42,6 +44,20 @@ class ECoreCorrType(Enum):
 """加权移动相关系数计算默认使用60d"""
 g_rolling_corr_window = 60
 
+"""一对多加权移动相关系数计算时，每一批计算的列数，控制窗口累计和中间矩阵的内存占用"""
+g_rolling_corr_batch_cols = 512
+
+"""是否缓存斯皮尔曼相关系数计算使用的秩矩阵，同一个涨跌幅矩阵重复进行斯皮尔曼相关计算时不再重新计算秩"""
+g_enable_rank_cache = True
+"""秩矩阵缓存最多保存的矩阵个数，超出后淘汰最久没有使用的"""
+g_rank_cache_cnt = 4
+
+"""
+    秩矩阵缓存，key为涨跌幅矩阵的标识以及时间范围，即(列名称，开始日期，结束日期，矩阵形状，每一列数值和)，
+    value为列方向的秩矩阵，使用OrderedDict按照使用顺序淘汰
+"""
+_g_rank_cache = OrderedDict()
+
 
 def corr_xy(x, y, similar_type=ECoreCorrType.E_CORE_TYPE_PEARS, **kwargs):
     """
@@ -101,8 +117,8 @@ def corr_matrix(df, similar_type=ECoreCorrType.E_CORE_TYPE_PEARS, **kwargs):
         # 皮尔逊相关系数计算
         corr = np.corrcoef(df.T)
     elif similar_type == ECoreCorrType.E_CORE_TYPE_SPERM or similar_type == ECoreCorrType.E_CORE_TYPE_SPERM.value:
-        # 斯皮尔曼相关系数计算, 使用自定义spearmanr，不计算p_value
-        corr = spearmanr(df)
+        # 斯皮尔曼相关系数计算, 即秩矩阵的皮尔逊相关系数，秩矩阵使用rank_df_cache缓存
+        corr = np.corrcoef(rank_df_cache(df), rowvar=0)
     elif similar_type == ECoreCorrType.E_CORE_TYPE_SIGN or similar_type == ECoreCorrType.E_CORE_TYPE_SIGN.value:
         # 序列＋－符号相关系数, 使用np.sign取符号后，再np.corrcoef计算
         corr = np.corrcoef(np.sign(df.T))
@@ -118,6 +134,45 @@ def corr_matrix(df, similar_type=ECoreCorrType.E_CORE_TYPE_PEARS, **kwargs):
     return corr
 
 
+def corr_vector(df, ss, similar_type=ECoreCorrType.E_CORE_TYPE_PEARS, **kwargs):
+    """
+    与corr_matrix的区别是只计算df中所有列与一个目标序列ss的相关系数，即只计算1×N的相关系数向量，
+    不需要计算N×N的相关系数方阵后再取出目标序列对应的列，结果与corr_matrix(df)[ss.name]一致
+    :param df: pd.DataFrame对象
+    :param ss: pd.Series对象，ss的大小需要与df.shape[0]一样
+    :param similar_type: ECoreCorrType, 默认值ECoreCorrType.E_CORE_TYPE_PEARS
+    :return: pd.Series对象, index为df.columns，name为ss.name
+    """
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError('df must pd.DataFrame object!!!')
+
+    if similar_type == ECoreCorrType.E_CORE_TYPE_ROLLING or similar_type == ECoreCorrType.E_CORE_TYPE_ROLLING.value:
+        # pop参数window，默认使用g_rolling_corr_window
+        window = kwargs.pop('window', g_rolling_corr_window)
+        corr = rolling_corr(df, ss, window=window)
+        return pd.Series(corr, index=df.columns, name=ss.name)
+
+    x = df.values.astype(np.float64)
+    y = np.asarray(ss, dtype=np.float64)
+    if similar_type == ECoreCorrType.E_CORE_TYPE_SPERM or similar_type == ECoreCorrType.E_CORE_TYPE_SPERM.value:
+        # 斯皮尔曼相关系数即秩序列的皮尔逊相关系数，df的秩矩阵使用rank_df_cache缓存
+        x = rank_df_cache(df)
+        y = rankdata(y)
+    elif similar_type == ECoreCorrType.E_CORE_TYPE_SIGN or similar_type == ECoreCorrType.E_CORE_TYPE_SIGN.value:
+        # 序列＋－符号相关系数, 使用np.sign取符号后，再计算皮尔逊相关系数
+        x = np.sign(x)
+        y = np.sign(y)
+
+    # 皮尔逊相关系数计算，即中心化后的内积除以各自的模，与np.corrcoef一样，方差为0的序列结果为nan
+    x = x - x.mean(axis=0)
+    y = y - y.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = y.dot(x) / np.sqrt((x * x).sum(axis=0) * y.dot(y))
+    # 与np.corrcoef一样，截断数值误差超出[-1, 1]的部分
+    np.clip(corr, -1, 1, out=corr)
+    return pd.Series(corr, index=df.columns, name=ss.name)
+
+
 @ABuDTUtil.consume_time
 def rolling_corr(df, ss=None, window=g_rolling_corr_window):
     """
@@ -167,47 +222,77 @@ def rolling_corr(df, ss=None, window=g_rolling_corr_window):
         0.0044  0.0044  0.0044  0.0044  0.0044  0.0044  0.0044  0.0044  0.0045
         ........................................0.0045  0.0045  0.0045  0.0045]
     """
+    # 不修改外部传入的数据，拷贝后将np.inf修改为0
+    values = np.array(df.values, dtype=np.float64)
+    values[values == np.inf] = 0
     corr = 0
     if ss is None:
-        # 如果不使用pd_rolling_corr，需要copy，保证df == np.inf的会修改
-        df = df.copy()
-        df[df == np.inf] = 0
         # 迭代rolling_window下的时间窗口，使用np.corrcoef，比使用pd_rolling_corr效果高很多
         for (s, e) in rolling_window:
-            # eg. rolling_window第一个即为np.corrcoef(df.iloc[0:60].T)
-            window_corr = np.corrcoef(df.iloc[s:e].T)
+            # eg. rolling_window第一个即为np.corrcoef(values[0:60].T)
+            window_corr = np.corrcoef(values[s:e].T)
             window_corr[np.isinf(window_corr) | np.isnan(window_corr)] = 0
             # 当前窗口下的相关系数乘以权重, window_corr * weights[s]为df.shape[1]大小的相关系数二维方阵
             corr += window_corr * weights[s]
     else:
-        # 针对两个输入序列使用pd_rolling_corr
-        window_corr = pd_rolling_corr(df, ss, window=window)
-        window_corr.dropna(inplace=True, how='all')
-        """
-            pd_rolling_corr返回的window_corr形如, 即每一个子窗口corr:
-
-            59     0.234309
-            60     0.237821
-            61     0.244905
-            62     0.242731
-            63     0.249227
-            ...............
-            499    0.154148
-            500    0.138837
-            501    0.133806
-            502    0.135788
-            503    0.138762
-        """
-        window_corr[window_corr == np.inf] = 0
-        for ind in np.arange(window_corr.shape[0]):
-            # 对应天的相关系数 ＊ 对应天的系统权重，长度为df.shape[1]的相关系数一维数组
-            corr += window_corr.iloc[ind] * weights[ind]
+        y = np.array(ss.values if isinstance(ss, pd.Series) else ss, dtype=np.float64)
+        y[y == np.inf] = 0
+        x = values.reshape(values.shape[0], -1)
+        # 针对一个目标序列，按列分批使用窗口累计和一次计算所有窗口的相关系数，长度为df.shape[1]的相关系数一维数组
+        corr = np.concatenate([weights.dot(_rolling_corr_windows(x[:, st:st + g_rolling_corr_batch_cols], y, window))
+                               for st in np.arange(0, x.shape[1], g_rolling_corr_batch_cols)])
+        if isinstance(df, pd.DataFrame):
+            corr = pd.Series(corr, index=df.columns)
+        elif corr.shape[0] == 1:
+            # 两个pd.Series对象计算时返回相关系数值
+            corr = corr[0]
     return corr
 
 
+def _window_sum(a, window):
+    """使用累计和计算a沿着axis=0的所有长度为window的窗口和，即第i行为a[i:i + window].sum(axis=0)"""
+    cum = np.cumsum(a, axis=0)
+    return np.concatenate([cum[window - 1:window], cum[window:] - cum[:-window]])
+
+
+def _window_change_cnt(a, window):
+    """计算a沿着axis=0的所有长度为window的窗口内，前后两个值不相等的次数"""
+    change = np.zeros(a.shape)
+    change[1:] = np.diff(a, axis=0) != 0
+    return _window_sum(change, window) - change[:a.shape[0] - window + 1]
+
+
+def _rolling_corr_windows(x, y, window):
+    """
+    使用x，y，x²，y²，xy的窗口累计和一次计算y与x每一列在所有窗口下的皮尔逊相关系数，时间复杂度O(N·T)，
+    与np.corrcoef(x[s:e].T)逐个窗口计算的结果一致，窗口内方差为0的序列相关系数为0
+    :param x: 二维np.array，行为时间，列为序列
+    :param y: 一维np.array，长度与x.shape[0]一样
+    :param window: 窗口大小
+    :return: 二维np.array，行为窗口，列为x的列，即第i行为y[i:i + window]与x[i:i + window]每一列的相关系数
+    """
+    # 窗口内的序列为常数时方差为0，使用窗口内序列值变化的次数判断，不使用累计和相减的结果，避免精度误差
+    x_const = _window_change_cnt(x, window) == 0
+    y_const = _window_change_cnt(y, window) == 0
+    # 相关系数不受平移影响，先减去均值，减小累计和的数值，降低窗口和相减时的精度损失
+    x = x - x.mean(axis=0)
+    y = y - y.mean()
+    sx = _window_sum(x, window)
+    sy = _window_sum(y, window)[:, np.newaxis]
+    x_var = _window_sum(x * x, window) - sx * sx / window
+    y_var = _window_sum(y * y, window)[:, np.newaxis] - sy * sy / window
+    xy_cov = _window_sum(x * y[:, np.newaxis], window) - sx * sy / window
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        window_corr = xy_cov / np.sqrt(x_var * y_var)
+    window_corr[x_const | y_const[:, np.newaxis] | ~np.isfinite(window_corr)] = 0
+    np.clip(window_corr, -1, 1, out=window_corr)
+    return window_corr
+
+
 def spearmanr(a, b=None, axis=0, p_value=False):
     """
-    如果需要计算p_value使用stats.spearmanr计算，否则使用rankdata配合使用np.apply_along_axis，
+    如果需要计算p_value使用stats.spearmanr计算，否则使用rank_along_axis一次计算所有序列的秩，
     进行spearmanr相关计算，因为计算p_value耗时
     :param a: 可迭代序列a
     :param b: 可迭代序列b
@@ -220,17 +305,86 @@ def spearmanr(a, b=None, axis=0, p_value=False):
         # 需要计算p_value使用stats.spearmanr计算
         return stats.spearmanr(a=a, b=b, axis=axis)
     else:
-        # 使用rankdata配合使用np.apply_along_axis
+        # 使用rank_along_axis一次计算所有序列的秩
         a, outaxis = _chk_asarray(a, axis)
-        ar = np.apply_along_axis(rankdata, outaxis, a)
+        ar = rank_along_axis(a, outaxis)
         br = None
         if b is not None:
             b, axisout = _chk_asarray(b, axis)
-            br = np.apply_along_axis(rankdata, axisout, b)
+            br = rank_along_axis(b, axisout)
         # 返回 np.array 的二维方阵
         return np.corrcoef(ar, br, rowvar=outaxis)
 
 
+def rank_along_axis(a, axis=0):
+    """
+    使用argsort一次计算a沿着axis方向每一个序列的秩，相同值使用平均秩，
+    没有nan的序列与np.apply_along_axis(rankdata, axis, a)结果一致，nan排在最后且互不相同，
+    与scipy 1.10之前的rankdata一致，scipy 1.10之后的rankdata对有nan的序列返回全部nan
+    :param a: np.array对象，一维或者二维
+    :param axis: 秩计算作用轴方向
+    :return: 与a形状一样的秩矩阵，np.float64
+    """
+    a = np.asarray(a, dtype=np.float64)
+    if a.ndim == 1:
+        return rank_along_axis(a[:, np.newaxis])[:, 0]
+    if axis == 1:
+        return rank_along_axis(a.T).T
+
+    row_cnt, col_cnt = a.shape
+    cols = np.arange(col_cnt)
+    sorter = np.argsort(a, axis=0, kind='mergesort')
+    sorted_a = a[sorter, cols]
+    pos = np.arange(row_cnt)[:, np.newaxis]
+    # 排序后每一段相同值的开始位置，结束位置，nan与rankdata一样排在最后，且互不相同
+    group_head = np.ones(a.shape, dtype=bool)
+    group_head[1:] = sorted_a[1:] != sorted_a[:-1]
+    group_tail = np.ones(a.shape, dtype=bool)
+    group_tail[:-1] = group_head[1:]
+    start = np.maximum.accumulate(np.where(group_head, pos, 0), axis=0)
+    end = np.minimum.accumulate(np.where(group_tail, pos, row_cnt - 1)[::-1], axis=0)[::-1]
+    ranks = np.empty(a.shape, dtype=np.float64)
+    # 相同值的平均秩即开始位置与结束位置的平均值＋1
+    ranks[sorter, cols] = (start + end) / 2 + 1
+    return ranks
+
+
+def rank_df_cache(df):
+    """
+    计算pd.DataFrame对象df每一列的秩，即列方向的秩矩阵，g_enable_rank_cache开启时，
+    相同列名称，index，数值的涨跌幅矩阵重复计算时直接返回缓存的秩矩阵，
+    即一次会话中对同一个全市场涨跌幅矩阵进行多次斯皮尔曼相关计算只计算一次秩
+    :param df: pd.DataFrame对象
+    :return: 列方向的秩矩阵，np.array对象，不要修改返回的矩阵
+    """
+    if not g_enable_rank_cache or df.shape[0] == 0:
+        return rank_along_axis(df.values, 0)
+
+    values = np.ascontiguousarray(df.values, dtype=np.float64)
+    cache_key = _rank_df_hash(df, values)
+    ranks = _g_rank_cache.pop(cache_key, None)
+    if ranks is None:
+        ranks = rank_along_axis(values, 0)
+        while len(_g_rank_cache) >= g_rank_cache_cnt > 0:
+            _g_rank_cache.popitem(last=False)
+    if g_rank_cache_cnt > 0:
+        # 重新放在最后，即最近使用
+        _g_rank_cache[cache_key] = ranks
+    return ranks
+
+
+def _rank_df_hash(df, values):
+    """秩矩阵缓存的标识，列名称，index，数值的md5，计算量远小于计算秩"""
+    md5 = hashlib.md5()
+    md5.update(str(values.shape).encode('utf-8'))
+    md5.update(str(list(df.columns)).encode('utf-8'))
+    index = np.asarray(df.index.values)
+    # object类型的index，eg：str，tobytes只是对象地址，使用字符串
+    md5.update(str(index.tolist()).encode('utf-8') if index.dtype.kind == 'O' else index.tobytes())
+    md5.update(values.tobytes())
+    return md5.hexdigest()
+
+
 def _chk_asarray(a, axis):
     """内部函数，为spearmanr下不需要计算p_value的情况下，为apply_along_axis转换数据"""
     if axis is None:
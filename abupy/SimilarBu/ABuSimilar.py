@@ -13,9 +13,11 @@ import math
 import operator
 import os
 
+import numpy as np
 import pandas as pd
 
 from . import ABuCorrcoef
+from . import ABuSimilarCache
 from . import ABuSimilarDrawing
 from .ABuCorrcoef import ECoreCorrType
 from ..TradeBu import AbuBenchmark
@@ -35,6 +37,13 @@ from ..UtilBu import ABuProgress
 """进行相似度数据收集并行进程数，IO操作偏多，所以分配多个，默认=cpu个数＊2, windows还是..."""
 g_process_panel_cnt = ABuEnv.g_cpu_cnt * 2 if ABuEnv.g_is_mac_os else ABuEnv.g_cpu_cnt
 
+"""
+    是否使用本地持久化的全市场涨跌幅矩阵缓存，开启后_all_market_cg优先从缓存中memmap读取标尺时间范围内的涨跌幅，
+    缓存中没有的新交易日只收集新交易日的数据后扩展缓存，全市场symbol集合在缓存首次构建时确定，
+    需要重新确定时使用ABuSimilarCache.clear_market_change删除对应市场的缓存
+"""
+g_enable_market_change_cache = True
+
 
 def from_local(func):
     """
@@ -228,18 +237,20 @@ def _make_benchmark_cg_df(symbol, benchmark):
     return net_cg_df
 
 
-def _net_cg_df_create(symbol, benchmark):
+def _net_cg_df_create(symbol, benchmark, choice_symbols=None):
     """
     获取env中全市场symbol，切分分配子进程，委托子进程_make_symbols_cg_df函数，
     将子进程返回的金融时间序列涨跌幅度pd.DataFrame对象再次进行连接，组合成为全市场
     symbol涨跌幅度pd.DataFrame对象
-    :param symbol: 标尺对象symbol，str对象
+    :param symbol: 标尺对象symbol，str对象，None即不单独组装标尺的涨跌幅
     :param benchmark: 进行数据收集使用的标尺对象，数据时间范围确定使用，AbuBenchmark实例对象
+    :param choice_symbols: 进行数据收集的symbol序列，默认None即env中设置的市场的所有symbol
     :return: 全市场symbol涨跌幅度pd.DataFrame对象
     """
 
-    # 获取全市场symbol，没有指定市场参数，即根据env中设置的市场来获取所有市场symbol
-    choice_symbols = all_symbol()
+    if choice_symbols is None:
+        # 获取全市场symbol，没有指定市场参数，即根据env中设置的市场来获取所有市场symbol
+        choice_symbols = all_symbol()
     # 通过split_k_market将市场symbol切割为子进程需要完成的任务数量
     process_symbols = split_k_market(g_process_panel_cnt, market_symbols=choice_symbols)
     # 因为切割会有余数，所以将原始设置的进程数切换为分割好的个数, 即32 -> 33 16 -> 17
@@ -262,7 +273,7 @@ def _net_cg_df_create(symbol, benchmark):
         传人的symbol是a股市场中的一支股票，即目的是想从整个港股市场中分析与这支a股股票的相关系数，这时即会
         触发_make_benchmark_cg_df的使用
     """
-    change_df_concat = None if symbol in choice_symbols else _make_benchmark_cg_df(symbol, benchmark)
+    change_df_concat = None if symbol is None or symbol in choice_symbols else _make_benchmark_cg_df(symbol, benchmark)
     for change_df in change_df_array:
         if change_df is not None:
             # 将所有子进程返回的金融时间序列涨跌幅度pd.DataFrame对象再次进行连接
@@ -303,7 +314,87 @@ def _all_market_cg(symbol, cmp_cnt=None, n_folds=2, start=None, end=None):
         # 再次根据对比多少个交易日这个参数，对齐时间序列
         benchmark.kl_pd = benchmark.kl_pd.iloc[-cmp_cnt:]
     # 有了symbol和benchmark，即可开始获取全市场symbol涨跌幅度pd.DataFrame对象all_market_change_df
-    all_market_change_df = _net_cg_df_create(symbol, benchmark)
+    if g_enable_market_change_cache:
+        all_market_change_df = _cache_market_cg(symbol, benchmark)
+    else:
+        all_market_change_df = _net_cg_df_create(symbol, benchmark)
+    return all_market_change_df
+
+
+def _refresh_market_cg(benchmark, refresh_index, columns):
+    """
+    只针对缓存中没有的新交易日refresh_index收集缓存中symbol的涨跌幅，返回涨跌幅二维矩阵
+    :param benchmark: 进行数据收集使用的标尺对象，AbuBenchmark实例对象
+    :param refresh_index: 需要收集的新交易日序列，pd.DatetimeIndex对象
+    :param columns: 缓存中的symbol序列
+    :return: 涨跌幅二维矩阵，行为refresh_index，列为columns，没有数据的symbol涨跌幅为0
+    """
+    refresh_kl_pd = benchmark.kl_pd.loc[refresh_index]
+    refresh_kl_pd.name = benchmark.kl_pd.name
+    # 标尺只保留新交易日，即只对新交易日进行标尺切割
+    refresh_benchmark = AbuBenchmark(benchmark_kl_pd=refresh_kl_pd)
+    change_df = _net_cg_df_create(None, refresh_benchmark, choice_symbols=columns)
+    if change_df is None:
+        return np.zeros((refresh_index.shape[0], len(columns)))
+    return change_df.reindex(index=refresh_index, columns=columns).fillna(value=0).values
+
+
+def _cache_market_cg(symbol, benchmark):
+    """
+    从本地持久化的全市场涨跌幅矩阵缓存中获取标尺时间范围内的全市场symbol涨跌幅度pd.DataFrame对象，
+    缓存由市场以及缓存矩阵开始日期确定，使用开始日期不晚于标尺开始日期的缓存中最晚开始的一个，即矩阵最小的缓存:
+        1. 没有可用缓存或者缓存时间范围内的交易日与标尺对不上，以标尺的时间范围重新构建缓存
+        2. 标尺中有缓存结束日期之后的新交易日，只收集新交易日的涨跌幅扩展缓存
+    :param symbol: 标尺对象symbol，str对象
+    :param benchmark: 进行数据收集使用的标尺对象，数据时间范围确定使用，AbuBenchmark实例对象
+    :return: 全市场symbol涨跌幅度pd.DataFrame对象
+    """
+    market = ABuEnv.g_market_target.value
+    kl_index = benchmark.kl_pd.index
+    bm_index = kl_index.values.astype('datetime64[ns]')
+    start_date = int(kl_index[0].strftime('%Y%m%d'))
+
+    cache_key = None
+    cache = None
+    for cache_start, key in ABuSimilarCache.market_change_keys(market):
+        if cache_start <= start_date:
+            cache_key = key
+            cache = ABuSimilarCache.load_market_change(key)
+            break
+
+    if cache is not None:
+        cache_index, columns, values = cache
+        # 缓存结束日期之前的标尺交易日必须都在缓存中，否则缓存与标尺的交易日对不上，重新构建
+        in_cache = bm_index <= cache_index[-1]
+        if not np.in1d(bm_index[in_cache], cache_index).all():
+            cache = None
+        elif not in_cache.all():
+            # 标尺中有缓存结束日期之后的新交易日，只收集新交易日的涨跌幅扩展缓存
+            refresh_index = kl_index[~in_cache]
+            refresh_values = _refresh_market_cg(benchmark, refresh_index, columns)
+            cache_index = np.concatenate([cache_index, bm_index[~in_cache]])
+            values = np.concatenate([values, refresh_values])
+            ABuSimilarCache.dump_market_change(cache_key, cache_index, columns, values)
+            logging.info('market change cache {} refresh {} days'.format(cache_key, refresh_index.shape[0]))
+
+    if cache is None:
+        # 以标尺的时间范围构建缓存，不单独组装标尺的涨跌幅，缓存中只有市场中的symbol
+        change_df = _net_cg_df_create(None, benchmark)
+        if change_df is None:
+            return None
+        cache_key = ABuSimilarCache.market_change_key(market, start_date)
+        cache_index = bm_index
+        columns = change_df.columns.tolist()
+        values = change_df.reindex(index=kl_index).fillna(value=0).values
+        ABuSimilarCache.dump_market_change(cache_key, cache_index, columns, values)
+        logging.info('market change cache {} create'.format(cache_key))
+
+    # 只读取标尺时间范围内的交易日
+    all_market_change_df = pd.DataFrame(np.asarray(values[cache_index.searchsorted(bm_index)]),
+                                        index=kl_index, columns=columns)
+    if symbol not in all_market_change_df.columns:
+        # 标尺不在缓存中，eg. 非env中设置的市场的symbol，单独组装标尺的涨跌幅
+        all_market_change_df = pd.concat([all_market_change_df, _make_benchmark_cg_df(symbol, benchmark)], axis=1)
     return all_market_change_df
 
 
@@ -332,8 +423,8 @@ def _handle_market_change_df(market_change_df, cmp_cnt, benchmark_df, show_cnt,
         corr_ret = ABuCorrcoef.rolling_corr(market_change_df, benchmark_df)
         corr_ret = pd.Series(corr_ret, index=market_change_df.columns, name=benchmark_df.name)
     else:
-        # 其它加权计算统一使用corr_df计算，即统一使用大矩阵计算相关系数后再拿出benchmark_df对应的相关系数列
-        corr_ret = ABuCorrcoef.corr_matrix(market_change_df, corr_type)[benchmark_df.name]
+        # 其它加权计算统一使用corr_vector计算，即只计算benchmark_df与全市场的1×N相关系数，不计算N×N大矩阵
+        corr_ret = ABuCorrcoef.corr_vector(market_change_df, benchmark_df, corr_type)
     # 对结果进行zip排序，按照相关系统由正相关到负相关排序
     sorted_ret = sorted(zip(corr_ret.index, corr_ret), key=operator.itemgetter(1), reverse=True)
     """
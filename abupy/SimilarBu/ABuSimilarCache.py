@@ -4,6 +4,7 @@ from __future__ import division
 
 import os
 
+import numpy as np
 import pandas as pd
 
 from ..CoreBu import ABuEnv
@@ -11,6 +12,13 @@ from ..UtilBu import ABuFileUtil
 
 SIMILAR_CACHE_PATH = os.path.join(ABuEnv.g_project_cache_dir, 'similar.hdf5')
 
+"""全市场涨跌幅矩阵缓存文件夹，每一个缓存由市场以及缓存矩阵的开始日期确定"""
+MARKET_CHANGE_CACHE_DIR = os.path.join(ABuEnv.g_project_cache_dir, 'market_change')
+"""全市场涨跌幅矩阵缓存中的交易日序列，symbol序列，涨跌幅二维矩阵文件名称"""
+K_MC_INDEX_FN = 'index.npy'
+K_MC_COLUMNS_FN = 'columns.npy'
+K_MC_VALUES_FN = 'values.npy'
+
 
 def similar_key(symbol, cmp_cnt=None, n_folds=None, start=None, end=None, corr_type=None):
     return '{}_{}_{}_{}_{}_{}'.format(symbol, cmp_cnt, n_folds, start, end, corr_type)
@@ -34,3 +42,73 @@ def clear_cache(key=None):
         ABuFileUtil.del_hdf5(SIMILAR_CACHE_PATH, key)
     else:
         ABuFileUtil.del_file(SIMILAR_CACHE_PATH)
+
+
+def market_change_key(market, start_date):
+    """
+    全市场涨跌幅矩阵缓存key，由市场以及缓存矩阵的开始日期组成，有新的交易日时只向后扩展矩阵，key不变
+    :param market: 市场类型字符串，即EMarketTargetType.value
+    :param start_date: 缓存矩阵的开始日期，int对象，eg: 20150727
+    """
+    return '{}_{}'.format(market, start_date)
+
+
+def market_change_keys(market):
+    """
+    市场对应的所有全市场涨跌幅矩阵缓存，按照缓存矩阵的开始日期由晚到早排序
+    :param market: 市场类型字符串，即EMarketTargetType.value
+    :return: [(开始日期int, key), ...]
+    """
+    if not ABuFileUtil.file_exist(MARKET_CHANGE_CACHE_DIR):
+        return []
+    prefix = '{}_'.format(market)
+    keys = [(int(key[len(prefix):]), key) for key in os.listdir(MARKET_CHANGE_CACHE_DIR)
+            if key.startswith(prefix) and key[len(prefix):].isdigit()]
+    return sorted(keys, reverse=True)
+
+
+def dump_market_change(key, index, columns, values):
+    """
+    将全市场涨跌幅矩阵保存为定长类型的npy文件，先写入临时文件夹，全部写入完成后替换key对应的文件夹，
+    即其它进程不会读取到写入一半的数据
+    :param key: market_change_key生成的缓存key
+    :param index: 交易日序列，np.datetime64[ns]序列
+    :param columns: symbol序列
+    :param values: 涨跌幅二维矩阵，行为交易日，列为symbol
+    """
+    dir_name = os.path.join(MARKET_CHANGE_CACHE_DIR, key)
+    tmp_dir = '{}.tmp{}'.format(dir_name, os.getpid())
+    ABuFileUtil.del_file(tmp_dir)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, K_MC_INDEX_FN), np.asarray(index, dtype='datetime64[ns]'))
+    np.save(os.path.join(tmp_dir, K_MC_COLUMNS_FN), np.array([str(col) for col in columns], dtype=np.unicode_))
+    np.save(os.path.join(tmp_dir, K_MC_VALUES_FN), np.asarray(values, dtype=np.float64))
+    ABuFileUtil.replace_dir(tmp_dir, dir_name)
+
+
+def load_market_change(key, mmap_mode='r'):
+    """
+    读取dump_market_change保存的全市场涨跌幅矩阵，默认只读memmap方式读取涨跌幅二维矩阵，只有使用到的交易日会被读取
+    :param key: market_change_key生成的缓存key
+    :param mmap_mode: np.load中的mmap_mode参数，默认'r'，None即全部读取到内存
+    :return: (交易日序列, symbol序列, 涨跌幅二维矩阵)，缓存不存在返回None
+    """
+    dir_name = os.path.join(MARKET_CHANGE_CACHE_DIR, key)
+    if not ABuFileUtil.file_exist(dir_name):
+        return None
+    index = np.load(os.path.join(dir_name, K_MC_INDEX_FN))
+    columns = np.load(os.path.join(dir_name, K_MC_COLUMNS_FN)).tolist()
+    values = np.load(os.path.join(dir_name, K_MC_VALUES_FN), mmap_mode=mmap_mode)
+    return index, columns, values
+
+
+def clear_market_change(market=None):
+    """
+    删除全市场涨跌幅矩阵缓存
+    :param market: 市场类型字符串，即EMarketTargetType.value，None即删除所有市场的缓存
+    """
+    if market is None:
+        ABuFileUtil.del_file(MARKET_CHANGE_CACHE_DIR)
+        return
+    for _, key in market_change_keys(market):
+        ABuFileUtil.del_file(os.path.join(MARKET_CHANGE_CACHE_DIR, key))
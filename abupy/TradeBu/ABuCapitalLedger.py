@@ -0,0 +1,238 @@
+# -*- encoding:utf-8 -*-
+"""
+    资金账本模块，使用（交易日 × symbol）的二维np.array记录持仓变动，一维np.array记录现金变动，
+    通过累计现金流，累计持仓量计算生成与之前宽表形式一致的时序资金对象capital_pd
+"""
+
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+__author__ = '阿布'
+__weixin__ = 'abu_quant'
+
+
+class AbuCapitalLedger(object):
+    """资金账本类，AbuCapital内部使用，记录每一笔成交对现金以及持仓量的变动"""
+
+    def __init__(self, init_cash, kl_pd):
+        """
+        :param init_cash: 初始资金值
+        :param kl_pd: 资金回测时间标尺，即基准的金融时间序列，pd.DataFrame对象
+        """
+        self.init_cash = init_cash
+        # 时间标尺上的index, atr21, date做为capital_pd的基础列
+        self.index = kl_pd.index
+        self.atr21 = kl_pd['atr21'].values
+        self.dates = kl_pd['date'].values.astype(int)
+        # 交易日int -> 行序号，替代capital_pd.index.tolist().index(...)的查询
+        self.date_index = {date: row for row, date in enumerate(self.dates)}
+
+        # 每一个交易日的现金变动
+        self.cash_flow = np.zeros(self.dates.shape[0])
+        # 现金变动的累计，即变动全部发生后的现金值，只要查询的交易日不早于最后一次变动发生的交易日，可直接使用
+        self._cash = init_cash
+        self._cash_row = 0
+
+        self.symbols = list()
+        # symbol -> 二维序列中的列序号
+        self.symbol_index = dict()
+        # 买涨，买跌每一个交易日上的持仓变动，（交易日 × symbol）
+        self.call_flow = np.zeros((self.dates.shape[0], 0))
+        self.put_flow = np.zeros((self.dates.shape[0], 0))
+        # 买涨，买跌每一个交易日上的市场价值，通过mark_to_market生成，（交易日 × symbol）
+        self.call_worth = np.zeros((self.dates.shape[0], 0))
+        self.put_worth = np.zeros((self.dates.shape[0], 0))
+        # 持仓变动的累计以及最后一次变动发生的交易日，作用同self._cash
+        self._call_keep = np.zeros(0)
+        self._put_keep = np.zeros(0)
+        self._call_row = np.zeros(0, dtype=int)
+        self._put_row = np.zeros(0, dtype=int)
+        # 是否发生过持仓变动，是否已经进行过市场价值计算
+        self.touched = np.zeros(0, dtype=bool)
+        self.marked = np.zeros(0, dtype=bool)
+        # 是否已经完成结算，完成结算后capital_pd中才有capital_blance列
+        self.settled = False
+
+    def __len__(self):
+        """对象长度：交易日数量"""
+        return self.dates.shape[0]
+
+    def init_symbols(self, symbols):
+        """
+        批量为交易对象分配二维序列中的列，已经存在的symbol忽略，需要批量添加，避免逐个扩展二维序列
+        :param symbols: symbol序列
+        """
+        new_symbols = [symbol for symbol in symbols if symbol not in self.symbol_index]
+        # 去掉序列中的重复symbol，保持顺序
+        new_symbols = sorted(set(new_symbols), key=new_symbols.index)
+        if len(new_symbols) == 0:
+            return
+
+        for symbol in new_symbols:
+            self.symbol_index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+
+        def _extend_2d(arr, fill):
+            return np.hstack([arr, np.full((self.dates.shape[0], len(new_symbols)), fill)])
+
+        def _extend_1d(arr, fill):
+            return np.concatenate([arr, np.full(len(new_symbols), fill, dtype=arr.dtype)])
+
+        self.call_flow = _extend_2d(self.call_flow, 0.)
+        self.put_flow = _extend_2d(self.put_flow, 0.)
+        self.call_worth = _extend_2d(self.call_worth, np.nan)
+        self.put_worth = _extend_2d(self.put_worth, np.nan)
+        self._call_keep = _extend_1d(self._call_keep, 0)
+        self._put_keep = _extend_1d(self._put_keep, 0)
+        self._call_row = _extend_1d(self._call_row, 0)
+        self._put_row = _extend_1d(self._put_row, 0)
+        self.touched = _extend_1d(self.touched, False)
+        self.marked = _extend_1d(self.marked, False)
+
+    def date_row(self, date):
+        """
+        交易日对应的行序号
+        :param date: int交易日，eg：20160105
+        """
+        return self.date_index[int(date)]
+
+    def cash_at(self, row):
+        """
+        交易日row上的现金值，即row之前（包括row）所有现金变动累计后的值
+        :param row: 交易日行序号
+        """
+        if row >= self._cash_row:
+            # 按照时间顺序处理交易行为的情况下，直接使用累计值
+            return self._cash
+        return self.init_cash + self.cash_flow[:row + 1].sum()
+
+    def add_cash(self, row, cash_flow):
+        """
+        在交易日row上记录现金变动
+        :param row: 交易日行序号
+        :param cash_flow: 现金变动值，买入为负，卖出为正
+        """
+        self.cash_flow[row] += cash_flow
+        self._cash += cash_flow
+        self._cash_row = max(self._cash_row, row)
+
+    def _keep_items(self, expect_direction):
+        """根据expect_direction选择买涨或者买跌的持仓变动序列，持仓累计，最后变动交易日"""
+        if expect_direction == 1.0:
+            return self.call_flow, self._call_keep, self._call_row
+        return self.put_flow, self._put_keep, self._put_row
+
+    def keep_at(self, symbol, row, expect_direction):
+        """
+        交易日row上symbol的持仓量，没有分配列的symbol持仓量为0
+        :param symbol: symbol str对象
+        :param row: 交易日行序号
+        :param expect_direction: 交易的方向，1.0买涨，-1.0买跌
+        """
+        if symbol not in self.symbol_index:
+            return 0
+        col = self.symbol_index[symbol]
+        flow, keep, keep_row = self._keep_items(expect_direction)
+        if row >= keep_row[col]:
+            return keep[col]
+        return flow[:row + 1, col].sum()
+
+    def add_keep(self, symbol, row, expect_direction, cnt):
+        """
+        在交易日row上记录symbol的持仓变动
+        :param symbol: symbol str对象
+        :param row: 交易日行序号
+        :param expect_direction: 交易的方向，1.0买涨，-1.0买跌
+        :param cnt: 持仓变动量，买入为正，卖出为负
+        """
+        if symbol not in self.symbol_index:
+            self.init_symbols([symbol])
+        col = self.symbol_index[symbol]
+        flow, keep, keep_row = self._keep_items(expect_direction)
+        flow[row, col] += cnt
+        keep[col] += cnt
+        keep_row[col] = max(keep_row[col], row)
+        self.touched[col] = True
+
+    def cash_blance(self):
+        """累计现金流计算每一个交易日的现金余额"""
+        return self.init_cash + np.cumsum(self.cash_flow)
+
+    def keep_blance(self, expect_direction):
+        """累计持仓变动计算每一个交易日的持仓量，（交易日 × symbol）"""
+        flow, _, _ = self._keep_items(expect_direction)
+        return np.cumsum(flow, axis=0)
+
+    def mark_to_market(self, kl_pds):
+        """
+        根据持仓量以及金融时间序列中的收盘价格，一次性计算多个symbol每一个交易日的市场价值，
+        买跌的持仓以昨天的收盘价格为基础，将今天的涨跌反向映射为今天的收盘价格
+        :param kl_pds: 金融时间序列序列，序列中的对象为pd.DataFrame对象，kl_pd.name为symbol，
+                       也可直接传入一个pd.DataFrame对象
+        """
+        if isinstance(kl_pds, pd.DataFrame):
+            kl_pds = [kl_pds]
+        kl_pds = [kl_pd for kl_pd in kl_pds if kl_pd is not None]
+        if len(kl_pds) == 0:
+            return
+        self.init_symbols([kl_pd.name for kl_pd in kl_pds])
+        cols = np.array([self.symbol_index[kl_pd.name] for kl_pd in kl_pds])
+
+        # 将每一个金融时间序列的收盘价格对齐到时间标尺上，构成（交易日 × symbol）的价格序列
+        close = np.full((self.dates.shape[0], cols.shape[0]), np.nan)
+        yd_close = np.full((self.dates.shape[0], cols.shape[0]), np.nan)
+        has_kl = np.zeros((self.dates.shape[0], cols.shape[0]), dtype=bool)
+        for ind, kl_pd in enumerate(kl_pds):
+            # 金融时间序列中的交易日对齐到时间标尺上，-1代表金融时间序列中没有这个交易日
+            kl_row = pd.Index(kl_pd['date'].values.astype(int)).get_indexer(self.dates)
+            kl_close = kl_pd['close'].values
+            has_kl[:, ind] = kl_row >= 0
+            close[:, ind] = kl_close[kl_row]
+            # 昨天的收盘价格，第一个交易日没有昨天，反向映射后的价格即今天的收盘价格
+            yd_close[:, ind] = np.where(kl_row > 0, kl_close[kl_row - 1], kl_close[kl_row])
+        put_close = (close - yd_close) * -1 + yd_close
+
+        for flow, worth, td_close in ((self.call_flow, self.call_worth, close),
+                                      (self.put_flow, self.put_worth, put_close)):
+            keep = np.cumsum(flow[:, cols], axis=0)
+            # 当前交易日有对应的持仓，且金融时间序列中有这个交易日
+            symbol_worth = pd.DataFrame(np.where((keep > 0) & has_kl, np.round(td_close * keep, 3), np.nan))
+            # 没有对应交易日的使用之前的市场价值
+            symbol_worth = symbol_worth.fillna(method='pad').fillna(0).values
+            # 纠错处理把keep=0但是worth被pad的进行二次修正
+            symbol_worth[(keep == 0) & (symbol_worth > 0)] = 0
+            worth[:, cols] = symbol_worth
+        self.marked[cols] = True
+
+    def make_capital_pd(self):
+        """
+        生成时序资金对象capital_pd，列与宽表形式保持一致：atr21，cash_blance，date，stocks_blance，
+        每一个symbol的_call_keep，_put_keep，_call_worth，_put_worth，结算后添加capital_blance
+        """
+        capital_pd = pd.DataFrame({'atr21': self.atr21, 'cash_blance': self.cash_blance(), 'date': self.dates},
+                                  index=self.index, columns=['atr21', 'cash_blance', 'date'])
+        # 没有发生过持仓变动的symbol持仓量为nan，没有进行过市场价值计算的symbol市场价值为nan
+        call_keep = np.where(self.touched, self.keep_blance(1.0), np.nan)
+        put_keep = np.where(self.touched, self.keep_blance(-1.0), np.nan)
+        call_worth = np.where(self.marked, self.call_worth, np.nan)
+        put_worth = np.where(self.marked, self.put_worth, np.nan)
+
+        stocks_blance = np.nansum(np.hstack([call_worth, put_worth]), axis=1) if self.settled \
+            else np.zeros(self.dates.shape[0])
+        capital_pd['stocks_blance'] = stocks_blance
+
+        # 每一个symbol的四列连续排列：call keep，put keep，call worth，put worth
+        symbol_values = np.stack([call_keep, put_keep, call_worth, put_worth], axis=2).reshape(
+            self.dates.shape[0], -1)
+        symbol_columns = ['{}{}'.format(symbol, head) for symbol in self.symbols
+                          for head in ('_call_keep', '_put_keep', '_call_worth', '_put_worth')]
+        capital_pd = pd.concat([capital_pd, pd.DataFrame(symbol_values, index=self.index, columns=symbol_columns)],
+                               axis=1)
+        if self.settled:
+            # stocks_blance ＋ cash_blance（现金余额）＝ capital_blance（总资产价值）列
+            capital_pd['capital_blance'] = capital_pd['stocks_blance'] + capital_pd['cash_blance']
+        return capital_pd
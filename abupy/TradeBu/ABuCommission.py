@@ -148,8 +148,34 @@ class AbuCommission(object):
         self.commission_dict = commission_dict
         # 对象内部记录交易的pd.DataFrame对象，列设定
         self.df_columns = ['type', 'date', 'symbol', 'commission']
-        # 构建手续费记录pd.DataFrame对象commission_df
-        self.commission_df = pd.DataFrame(columns=self.df_columns)
+        # 手续费记录序列，commission_df由记录序列按需一次性生成，避免每一笔交易append一次pd.DataFrame
+        self.commission_records = list()
+        self._commission_df = None
+
+    def __setstate__(self, state):
+        """兼容没有手续费记录序列的序列化对象，直接使用其中保存的commission_df"""
+        self.__dict__.update(state)
+        if 'commission_df' in state:
+            self._commission_df = self.__dict__.pop('commission_df')
+            self.commission_records = self._commission_df.values.tolist()
+
+    @property
+    def commission_df(self):
+        """手续费记录pd.DataFrame对象commission_df，由手续费记录序列生成，生成后缓存，有新的记录后重新生成"""
+        if self._commission_df is None:
+            if len(self.commission_records) == 0:
+                self._commission_df = pd.DataFrame(columns=self.df_columns)
+            else:
+                # 与之前逐条append一致：所有记录转换为np.array中的字符串，index都为0
+                records = np.array(self.commission_records).reshape(-1, len(self.df_columns))
+                self._commission_df = pd.DataFrame(records, columns=self.df_columns,
+                                                   index=np.zeros(records.shape[0], dtype=int))
+        return self._commission_df
+
+    def _add_record(self, record):
+        """添加一条手续费记录，之前生成的commission_df失效"""
+        self.commission_records.append(record)
+        self._commission_df = None
 
     def __str__(self):
         """打印对象显示：如果有手续费记录，打印记录df，否则打印commission_df.info"""
@@ -215,10 +241,8 @@ class AbuCommission(object):
         # 如果有外部有append，说明需要记录手续费，且执行计算成功
         if len(commission_list) == 1:
             commission = commission_list[0]
-            # 将买单对象AbuOrder实例中的数据转换成交易记录需要的np.array对象
-            record = np.array(['buy', a_order.buy_date, a_order.buy_symbol, commission]).reshape(1, 4)
-            record_df = pd.DataFrame(record, columns=self.df_columns)
-            self.commission_df = self.commission_df.append(record_df)
+            # 将买单对象AbuOrder实例中的数据转换成交易记录
+            self._add_record(['buy', a_order.buy_date, a_order.buy_symbol, commission])
         else:
             logging.info('buy_commission_func calc error')
 
@@ -240,9 +264,7 @@ class AbuCommission(object):
 
         if len(commission_list) == 1:
             commission = commission_list[0]
-            # 将卖单对象AbuOrder实例中的数据转换成交易记录需要的np.array对象
-            record = np.array(['sell', a_order.sell_date, a_order.buy_symbol, commission]).reshape(1, 4)
-            record_df = pd.DataFrame(record, columns=self.df_columns)
-            self.commission_df = self.commission_df.append(record_df)
+            # 将卖单对象AbuOrder实例中的数据转换成交易记录
+            self._add_record(['sell', a_order.sell_date, a_order.buy_symbol, commission])
         else:
             logging.info('sell_commission_func calc error!!!')
@@ -8,6 +8,8 @@ from __future__ import absolute_import
 from __future__ import division
 
 import logging
+import os
+import tempfile
 
 from ..TradeBu import AbuBenchmark
 from ..UtilBu import ABuDateUtil
@@ -19,7 +21,8 @@ from ..CoreBu.ABuParallel import delayed, Parallel
 from ..CoreBu import ABuEnv
 from ..CoreBu.ABuEnv import EDataCacheType
 from ..UtilBu.ABuProgress import AbuMulPidProgress
-from ..UtilBu.ABuFileUtil import batch_h5s
+from ..UtilBu.ABuFileUtil import batch_h5s, dump_df_npy, load_df_npy, del_file
+from ..IndicatorBu.ABuNDCache import nd_cache
 # noinspection PyUnresolvedReferences
 from ..CoreBu.ABuFixes import filter
 
@@ -80,6 +83,11 @@ class AbuKLManager(object):
         pick_time_kl_pd_dict = dict()
         # 类字典pick_kl_pd_dict将选股和择时字典包起来
         self.pick_kl_pd_dict = {'pick_stock': pick_stock_kl_pd_dict, 'pick_time': pick_time_kl_pd_dict}
+        """
+            择时金融时间序列只读memmap池：(池文件夹路径，{symbol: 池中的npy文件夹名称或者None})，
+            详见dump_pick_time_pool，pool_sub_manager
+        """
+        self.pick_time_pool = None
 
     def __str__(self):
         """打印对象显示：pick_stock + pick_time keys, 即所有symbol信息"""
@@ -157,19 +165,97 @@ class AbuKLManager(object):
         return ABuSymbolPd.make_kl_df(target_symbol, data_mode=EMarketDataSplitMode.E_DATA_SPLIT_UNDO,
                                       benchmark=self.benchmark, n_folds=self.benchmark.n_folds)
 
+    def _load_pick_time_pool(self, target_symbol):
+        """
+        从择时金融时间序列memmap池中读取target_symbol对应的金融时间序列
+        :return: (是否在池中，金融时间序列)
+        """
+        if self.pick_time_pool is None:
+            return False, None
+        pool_dir, pool_keys = self.pick_time_pool
+        if target_symbol not in pool_keys:
+            return False, None
+        if pool_keys[target_symbol] is None:
+            # 主进程中获取的金融时间序列即为None，不再重新fetch
+            return True, None
+        return True, load_df_npy(os.path.join(pool_dir, pool_keys[target_symbol]))
+
     def get_pick_time_kl_pd(self, target_symbol):
-        """对外获取择时时段金融时间序列，首先在内部择时字典中寻找，没找到使用_fetch_pick_time_kl_pd获取，且保存择时字典"""
+        """
+        对外获取择时时段金融时间序列，首先在内部择时字典中寻找，其次在择时memmap池中寻找，
+        都没找到使用_fetch_pick_time_kl_pd获取，且保存择时字典
+        """
         if target_symbol in self.pick_kl_pd_dict['pick_time']:
             kl_pd = self.pick_kl_pd_dict['pick_time'][target_symbol]
             if kl_pd is not None:
                 # 因为在多进程的时候拷贝会丢失name信息
                 kl_pd.name = target_symbol
+                nd_cache(kl_pd)
             return kl_pd
-        # 字典中每找到，进行fetch，获取后保存在择时字典中
-        kl_pd = self._fetch_pick_time_kl_pd(target_symbol)
+        in_pool, kl_pd = self._load_pick_time_pool(target_symbol)
+        if not in_pool:
+            # 字典和池中都没找到，进行fetch，获取后保存在择时字典中
+            kl_pd = self._fetch_pick_time_kl_pd(target_symbol)
+        if kl_pd is not None:
+            kl_pd.name = target_symbol
+            # 附加技术指标缓存，择时因子通过calc_xxx_from_kl共享同一个symbol的技术指标计算结果
+            nd_cache(kl_pd)
         self.pick_kl_pd_dict['pick_time'][target_symbol] = kl_pd
         return kl_pd
 
+    def pick_time_kl_costs(self, choice_symbols):
+        """
+        择时字典中金融时间序列长度做为择时任务的代价提示，不在字典中或者为None的代价为1
+        :param choice_symbols: 支持迭代的symbol序列
+        :return: 代价序列
+        """
+        pick_time_dict = self.pick_kl_pd_dict['pick_time']
+        return [pick_time_dict[target_symbol].shape[0]
+                if pick_time_dict.get(target_symbol) is not None else 1 for target_symbol in choice_symbols]
+
+    def dump_pick_time_pool(self):
+        """
+        将择时字典中的所有金融时间序列一次性写入临时文件夹中的只读memmap池，每一个金融时间序列按列
+        存储为定长类型的npy文件，子进程通过pool_sub_manager得到的管理对象按照symbol读取，
+        多个子进程读取共享系统页缓存，进程间只需要传递池文件夹路径以及symbol对应的池中文件夹名称，
+        不再需要pickle传递所有金融时间序列
+        :return: 池文件夹路径
+        """
+        self.clear_pick_time_pool()
+        pool_dir = tempfile.mkdtemp(prefix='abu_kl_pool_')
+        pool_keys = dict()
+        for ind, (target_symbol, kl_pd) in enumerate(self.pick_kl_pd_dict['pick_time'].items()):
+            if kl_pd is None:
+                pool_keys[target_symbol] = None
+                continue
+            # 不直接使用symbol做为文件夹名称，避免symbol中的特殊字符
+            pool_key = 'kl_{}'.format(ind)
+            dump_df_npy(os.path.join(pool_dir, pool_key), kl_pd)
+            pool_keys[target_symbol] = pool_key
+        self.pick_time_pool = (pool_dir, pool_keys)
+        return pool_dir
+
+    def pool_sub_manager(self, choice_symbols):
+        """
+        生成只携带choice_symbols在memmap池中索引信息的金融时间序列管理对象，做为参数传递给择时子进程，
+        即进程间传递的数据量只与子进程自己负责的symbol数量相关，需要先使用dump_pick_time_pool
+        :param choice_symbols: 子进程负责的symbol序列
+        :return: AbuKLManager实例对象
+        """
+        if self.pick_time_pool is None:
+            raise RuntimeError('dump_pick_time_pool first!')
+        pool_dir, pool_keys = self.pick_time_pool
+        sub_manager = AbuKLManager(self.benchmark, self.capital)
+        sub_manager.pick_time_pool = (pool_dir, {target_symbol: pool_keys[target_symbol]
+                                                 for target_symbol in choice_symbols if target_symbol in pool_keys})
+        return sub_manager
+
+    def clear_pick_time_pool(self):
+        """删除dump_pick_time_pool生成的memmap池临时文件夹"""
+        if self.pick_time_pool is not None:
+            del_file(self.pick_time_pool[0])
+            self.pick_time_pool = None
+
     def filter_pick_time_choice_symbols(self, choice_symbols):
         """
         使用filter筛选出choice_symbols中的symbol对应的择时时间序列不在内部择时字典中的symbol序列
@@ -242,6 +328,7 @@ class AbuKLManager(object):
                 if kl_pd is not None:
                     # 因为在多进程的时候深拷贝会丢失name
                     kl_pd.name = target_symbol
+                    nd_cache(kl_pd)
                 return kl_pd
 
         # 字典中每找到，进行fetch
@@ -256,6 +343,8 @@ class AbuKLManager(object):
             # 如果时间序列有数据但是 < min_xd, 抛弃数据直接{xd: None}
             self.pick_kl_pd_dict['pick_stock'][target_symbol] = {xd: None}
             return None
+        # 附加技术指标缓存，选股因子通过calc_xxx_from_kl共享同一个symbol的技术指标计算结果
+        nd_cache(kl_pd)
         # 第三层字典{xd: kl_pd}
         self.pick_kl_pd_dict['pick_stock'][target_symbol] = {xd: kl_pd}
         return kl_pd
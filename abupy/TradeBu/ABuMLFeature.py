@@ -10,8 +10,10 @@ from __future__ import print_function
 import ast
 import datetime
 import os
+import weakref
 
 import numpy as np
+import pandas as pd
 
 from ..CoreBu import ABuEnv
 # noinspection PyUnresolvedReferences
@@ -38,6 +40,260 @@ g_wave_key_cnt = 3
 g_atr_xd = 42
 # 快照周期
 g_take_snap_shot_xd = 60
+# 是否使用特征矩阵，即金融时间序列第一次生成特征时一次性计算所有交易日的内置特征，之后的交易直接读取对应的行
+g_enable_feature_matrix = True
+
+"""
+    特征矩阵缓存，key为id(kl_pd)，value为(kl_pd弱引用，combine_kl_pd弱引用，{matrix_key: {特征后缀: np.array}})，
+    kl_pd被回收后通过弱引用回调清除
+"""
+_g_feature_matrix_cache = dict()
+
+
+def _window_ends(kl_pd, combine_kl_pd):
+    """kl_pd中每一个交易日在combine_kl_pd中的位置，即combine_kl_pd.loc[:kl_pd.index[day_ind]]的最后一行"""
+    return combine_kl_pd.index.searchsorted(kl_pd.index, side='right') - 1
+
+
+def _pick_windows(kl_values, combine_values, ends, wide, kernel):
+    """
+    与calc_feature中截取特征周期的规则一致，计算kl_pd中每一个交易日的特征值：
+        day_ind - wide >= 0: 使用kl_pd中截止day_ind的wide个交易日
+        其它: 使用combine_kl_pd中截止对应交易日的wide个交易日，不足wide个使用全部
+    :param kl_values: kl_pd中的特征计算序列，由kernel决定具体形式
+    :param combine_values: combine_kl_pd中的特征计算序列，与kl_values形式一致
+    :param ends: _window_ends的返回值
+    :param wide: 特征周期
+    :param kernel: 特征计算函数，参数为(values, ends, lengths)，返回每一个窗口[end - length + 1, end]的特征值
+    :return: np.array，kl_pd中每一个交易日的特征值
+    """
+    day_ind = np.arange(ends.shape[0])
+    use_kl = day_ind - wide >= 0
+    parts = []
+    if use_kl.any():
+        parts.append((use_kl, kernel(kl_values, day_ind[use_kl], np.full(use_kl.sum(), wide))))
+    if (~use_kl).any():
+        combine_ends = ends[~use_kl]
+        parts.append((~use_kl, kernel(combine_values, combine_ends, np.minimum(wide, combine_ends + 1))))
+    out = np.full((ends.shape[0],) + parts[0][1].shape[1:], np.nan)
+    for selected, part in parts:
+        out[selected] = part
+    return out
+
+
+def _window_matrix(values, ends, lengths, fill=np.nan):
+    """
+    将每一个窗口[end - length + 1, end]左对齐构成二维矩阵，长度不足最大窗口长度的使用fill填充
+    :return: (窗口矩阵，有效值mask)
+    """
+    width = lengths.max()
+    offset = np.arange(width)
+    mask = offset < lengths[:, np.newaxis]
+    ind = np.where(mask, (ends - lengths + 1)[:, np.newaxis] + offset, 0)
+    return np.where(mask, values[ind], fill), mask
+
+
+def _fill_nan(window, how):
+    """二维矩阵按行进行pad或者bfill填充nan"""
+    if how == 'bfill':
+        return _fill_nan(window[:, ::-1], 'pad')[:, ::-1]
+    ind = np.where(np.isnan(window), 0, np.arange(window.shape[1]))
+    ind = np.maximum.accumulate(ind, axis=1)
+    return window[np.arange(window.shape[0])[:, np.newaxis], ind]
+
+
+def _rolling_price_rank(values, ends, lengths):
+    """计算每一个窗口最后一个价格在窗口中的rank位置，与pd.Series.rank()[-1] / shape[0]一致，相同价格使用平均rank"""
+    values = values.astype(np.float64)
+    window, _ = _window_matrix(values, ends, lengths)
+    last = values[ends][:, np.newaxis]
+    rank = (window < last).sum(axis=1) + ((window == last).sum(axis=1) + 1) / 2
+    return rank / lengths
+
+
+def _rolling_tl_score(values, ends, lengths, xd):
+    """
+    计算每一个窗口的对数变化加权移动std技术线score，与ABuTLWave.calc_wave_std，ABuTLAtr.calc_atr_std一致：
+    窗口内计算log变化（窗口第一个为nan），pd_ewm_std(span=xd, min_periods=1, adjust=True) * sqrt(xd)，
+    bfill后构造AbuTLine，score = (close - low) / (high - low)，high，low为技术线mean±std
+    """
+    window, mask = _window_matrix(values.astype(np.float64), ends, lengths)
+    pre_window = np.concatenate((np.full((window.shape[0], 1), np.nan), window[:, :-1]), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(pre_window == 0, 0, np.log(window / pre_window))
+
+    var = _ewm_var_windows(change, mask, xd)
+    roll_std = np.sqrt(np.where(var < 0, 0, var)) * np.sqrt(xd)
+    # 窗口外的值不参与bfill，与calc_wave_std中fillna(method='bfill')一致
+    roll_std = _fill_nan(np.where(mask, roll_std, np.nan), 'bfill')
+    roll_std = np.where(mask, roll_std, 0)
+
+    n_window = roll_std.shape[0]
+    close = roll_std[np.arange(n_window), lengths - 1]
+    tl_mean = roll_std.sum(axis=1) / lengths
+    tl_std = np.sqrt((np.where(mask, roll_std - tl_mean[:, np.newaxis], 0) ** 2).sum(axis=1) / lengths)
+    high = tl_mean + tl_std
+    low = tl_mean - tl_std
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.where(high == low, np.where(close > low, 0.8, 0.2), (close - low) / (high - low))
+    # 技术线中存在nan的窗口score为nan
+    return np.where(np.isnan(tl_mean), np.nan, score)
+
+
+def _ewm_var_windows(change, mask, xd):
+    """
+    所有窗口同步按照pandas ewmcov的递推方式(adjust=True, ignore_na=False, bias=False)计算加权移动方差，
+    窗口内除第一个以外都是有效值的情况下，所有窗口的权重递推完全一致，只需要计算一次
+    :param change: 窗口矩阵，第一列为nan
+    :param mask: 窗口有效值mask
+    :param xd: ewm span
+    :return: 加权移动方差窗口矩阵
+    """
+    alpha = 1. / (1. + (xd - 1.) / 2.)
+    old_wt_factor = 1. - alpha
+    n_window, width = change.shape
+    var = np.full((n_window, width), np.nan)
+    if width < 2:
+        return var
+
+    inside = mask.copy()
+    inside[:, 0] = False
+    if not np.isnan(change[inside]).any():
+        # 窗口外的值不会被使用，填0后所有窗口权重递推一致
+        change = np.where(mask, change, 0.)
+        # 第一个有效值做为均值，权重保持1
+        mean_x = change[:, 1]
+        cov = np.zeros(n_window)
+        sum_wt = sum_wt2 = old_wt = 1.
+        for ind in range(2, width):
+            cur_x = change[:, ind]
+            sum_wt *= old_wt_factor
+            sum_wt2 *= (old_wt_factor * old_wt_factor)
+            old_wt *= old_wt_factor
+            old_mean_x = mean_x
+            mean_x = np.where(mean_x != cur_x, (old_wt * old_mean_x + cur_x) / (old_wt + 1.), mean_x)
+            cov = (old_wt * (cov + ((old_mean_x - mean_x) * (old_mean_x - mean_x))) +
+                   ((cur_x - mean_x) * (cur_x - mean_x))) / (old_wt + 1.)
+            sum_wt += 1.
+            sum_wt2 += 1.
+            old_wt += 1.
+            numerator = sum_wt * sum_wt
+            denominator = numerator - sum_wt2
+            if denominator > 0.:
+                var[:, ind] = numerator / denominator * cov
+        return var
+
+    # 窗口内存在nan，每一个窗口的权重独立递推
+    mean_x = change[:, 0].copy()
+    cov = np.zeros(n_window)
+    sum_wt = np.ones(n_window)
+    sum_wt2 = np.ones(n_window)
+    old_wt = np.ones(n_window)
+    nobs = (~np.isnan(mean_x)).astype(int)
+    for ind in range(1, width):
+        cur_x = change[:, ind]
+        is_obs = ~np.isnan(cur_x)
+        nobs += is_obs
+        has_mean = ~np.isnan(mean_x)
+        sum_wt = np.where(has_mean, sum_wt * old_wt_factor, sum_wt)
+        sum_wt2 = np.where(has_mean, sum_wt2 * (old_wt_factor * old_wt_factor), sum_wt2)
+        old_wt = np.where(has_mean, old_wt * old_wt_factor, old_wt)
+        update = has_mean & is_obs
+        old_mean_x = mean_x
+        mean_x = np.where(update & (mean_x != cur_x), (old_wt * old_mean_x + cur_x) / (old_wt + 1.), mean_x)
+        new_cov = (old_wt * (cov + ((old_mean_x - mean_x) * (old_mean_x - mean_x))) +
+                   ((cur_x - mean_x) * (cur_x - mean_x))) / (old_wt + 1.)
+        cov = np.where(update, new_cov, cov)
+        sum_wt = np.where(update, sum_wt + 1., sum_wt)
+        sum_wt2 = np.where(update, sum_wt2 + 1., sum_wt2)
+        old_wt = np.where(update, old_wt + 1., old_wt)
+        # 还没有均值的情况下，第一个有效值做为均值
+        mean_x = np.where(~has_mean & is_obs, cur_x, mean_x)
+
+        numerator = sum_wt * sum_wt
+        denominator = numerator - sum_wt2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var[:, ind] = np.where((nobs >= 1) & (denominator > 0.), numerator / denominator * cov, np.nan)
+    return var
+
+
+def _jump_values(kl_pd):
+    """_rolling_jump使用的金融时间序列数据：时间戳，日期天数，p_change，volume，pre_close，low，high"""
+    day_ns = 24 * 3600 * 10 ** 9
+    return (kl_pd.index.asi8, kl_pd.index.normalize().asi8 // day_ns, kl_pd.p_change.values.astype(np.float64),
+            kl_pd.volume.values.astype(np.float64), kl_pd.pre_close.values.astype(np.float64),
+            kl_pd.low.values.astype(np.float64), kl_pd.high.values.astype(np.float64))
+
+
+def _rolling_jump(values, ends, lengths):
+    """
+    计算每一个窗口中最后一次向下，向上跳空的能量以及距离窗口最后一个交易日的天数，
+    与ABuTLJump.calc_jump(jump_diff_factor=1)以及AbuFeatureJump.calc_feature一致：
+    日振幅平均值，窗口第一个交易日开始的21D重采样月振幅，月成交量三层判断跳空
+    :param values: _jump_values的返回值
+    :return: (窗口数 × 4)，jump_down_power，diff_down_days，jump_up_power，diff_up_days
+    """
+    dates, days, p_change, volume, pre_close, low, high = values
+    date_w, mask = _window_matrix(dates, ends, lengths, fill=0)
+    days_w = _window_matrix(days, ends, lengths, fill=0)[0]
+    p_change_w = _window_matrix(p_change, ends, lengths)[0]
+    volume_w = _window_matrix(volume, ends, lengths)[0]
+    pre_close_w = _window_matrix(pre_close, ends, lengths)[0]
+    low_w = _window_matrix(low, ends, lengths)[0]
+    high_w = _window_matrix(high, ends, lengths)[0]
+    abs_change = np.abs(p_change_w)
+    n_window, width = abs_change.shape
+
+    # 日振幅平均值
+    change_ratio_min = np.nansum(abs_change, axis=1) / (~np.isnan(abs_change)).sum(axis=1)
+
+    # 从窗口第一个交易日开始每21天一个重采样分类，分类的起始日期做为重采样结果的index
+    bin_ns = 21 * 24 * 3600 * 10 ** 9
+    offset = np.where(mask, date_w - date_w[:, :1], 0)
+    bins = offset // bin_ns
+    n_bins = bins.max() + 1
+    flat_bins = bins + np.arange(n_window)[:, np.newaxis] * n_bins
+    # 只有正好是分类起始日期的交易日有重采样结果，之后pad，bfill
+    label = mask & (offset % bin_ns == 0)
+
+    def _resample_mean(window):
+        valid = mask & ~np.isnan(window)
+        total = np.bincount(flat_bins[valid], weights=window[valid], minlength=n_window * n_bins)
+        cnt = np.bincount(flat_bins[valid], minlength=n_window * n_bins)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / cnt
+        return _fill_nan(_fill_nan(np.where(label, mean[flat_bins], np.nan), 'pad'), 'bfill')
+
+    change_mean = _resample_mean(abs_change)
+    volume_mean = _resample_mean(volume_w)
+
+    with np.errstate(invalid='ignore'):
+        # 第一层判断：跳空最起码要振幅超过日振幅平均值，第二层判断：跳空当日的成交量起码要超过当月平均值
+        judge = mask & ~(abs_change <= change_ratio_min[:, np.newaxis]) & ~(volume_w <= volume_mean)
+        jump_threshold = np.abs(change_mean)
+        judge &= ~((pre_close_w == 0) | (jump_threshold == 0))
+        jump_diff = pre_close_w * jump_threshold / 100
+        up = judge & (p_change_w > 0) & ((low_w - pre_close_w) > jump_diff)
+        down = judge & ~up & (p_change_w < 0) & ((pre_close_w - high_w) > jump_diff)
+    rows = np.arange(n_window)
+    end_days = days_w[rows, lengths - 1]
+
+    def _last_jump(jump, power, direction):
+        has_jump = jump.any(axis=1)
+        last = width - 1 - np.argmax(jump[:, ::-1], axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            jump_power = np.where(has_jump, power[rows, last] / jump_diff[rows, last] * direction, 0)
+        diff_days = np.where(has_jump, end_days - days_w[rows, last], 0)
+        return jump_power, diff_days
+
+    jump_down_power, diff_down_days = _last_jump(down, pre_close_w - high_w, -1)
+    jump_up_power, diff_up_days = _last_jump(up, low_w - pre_close_w, 1)
+    return np.stack([jump_down_power, diff_down_days, jump_up_power, diff_up_days], axis=1)
+
+
+def _round_feature(values):
+    """标准化特征值，nan为0，保留3位小数"""
+    return np.round(np.where(np.isnan(values), 0, values), 3)
 
 
 class BuyFeatureMixin(object):
@@ -128,6 +384,22 @@ class AbuFeatureBase(object):
         """
         raise NotImplementedError('NotImplementedError calc_feature!!!')
 
+    def matrix_key(self):
+        """
+        子类支持特征矩阵时实现的函数，返回特征计算参数构成的唯一key，做为特征矩阵缓存的key，
+        默认返回None，即不支持特征矩阵，每一个交易使用calc_feature构造特征
+        """
+        return None
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        子类支持特征矩阵时实现的函数，一次性计算kl_pd中所有交易日的特征，与calc_feature结果一致
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 特征字典，key为去掉买入卖出前缀的特征名称，value为kl_pd中每一个交易日的特征值np.array
+        """
+        raise NotImplementedError('NotImplementedError calc_feature_matrix!!!')
+
 
 class AbuFeatureDeg(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
     """角度特征，支持买入，卖出"""
@@ -180,6 +452,22 @@ class AbuFeatureDeg(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
             deg_dict['{}deg_ang{}'.format(self.feature_prefix(buy_feature=buy_feature), dk)] = ang
         return deg_dict
 
+    def matrix_key(self):
+        """角度特征矩阵的key：特征类名称，角度周期"""
+        return self.__class__.__name__, tuple(sorted(self.deg_keys))
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        使用前缀和一次性计算kl_pd中所有交易日的拟合角度特征
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 角度特征字典，eg: {'deg_ang21': np.array, 'deg_ang42': np.array....}
+        """
+        ends = _window_ends(kl_pd, combine_kl_pd)
+        return {'deg_ang{}'.format(dk): _round_feature(
+            _pick_windows(kl_pd.close.values, combine_kl_pd.close.values, ends, dk, ABuRegUtil.regress_deg_windows))
+            for dk in self.deg_keys}
+
 
 class AbuFeaturePrice(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
     """价格rank特征，支持买入，卖出"""
@@ -250,6 +538,22 @@ class AbuFeaturePrice(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
             price_rank_dict['{}price_rank{}'.format(self.feature_prefix(buy_feature=buy_feature), dk)] = price_rank
         return price_rank_dict
 
+    def matrix_key(self):
+        """价格rank特征矩阵的key：特征类名称，价格rank周期"""
+        return self.__class__.__name__, tuple(sorted(self.price_rank_keys))
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        一次性计算kl_pd中所有交易日的价格rank特征
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 价格rank特征字典，eg: {'price_rank60': np.array, 'price_rank90': np.array....}
+        """
+        ends = _window_ends(kl_pd, combine_kl_pd)
+        return {'price_rank{}'.format(dk): _round_feature(
+            _pick_windows(kl_pd.close.values, combine_kl_pd.close.values, ends, dk, _rolling_price_rank))
+            for dk in self.price_rank_keys}
+
 
 class AbuFeatureWave(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
     """波动特征，支持买入，卖出"""
@@ -304,6 +608,30 @@ class AbuFeatureWave(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
             wave_dict['{}wave_score{}'.format(self.feature_prefix(buy_feature=buy_feature), xd_ind)] = wave_score
         return wave_dict
 
+    def matrix_key(self):
+        """波动特征矩阵的key：特征类名称，波动周期，取样个数，一年的交易日数量"""
+        return self.__class__.__name__, self.wave_xd, self.wave_key_cnt, ABuEnv.g_market_trade_year
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        一次性计算kl_pd中所有交易日的波动特征
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 波动特征字典，eg: {'wave_score1': np.array, 'wave_score2': np.array, 'wave_score3': np.array}
+        """
+        ends = _window_ends(kl_pd, combine_kl_pd)
+        wave_dict = {}
+        for xd_ind in xrange(1, self.wave_key_cnt + 1):
+            xd = xd_ind * self.wave_xd
+
+            def _wave_kernel(values, p_ends, lengths):
+                return _rolling_tl_score(values, p_ends, lengths, xd)
+
+            wave_dict['wave_score{}'.format(xd_ind)] = _round_feature(
+                _pick_windows(kl_pd.close.values, combine_kl_pd.close.values, ends, ABuEnv.g_market_trade_year,
+                              _wave_kernel))
+        return wave_dict
+
 
 class AbuFeatureAtr(AbuFeatureBase, BuyFeatureMixin):
     """atr特征，支持买入"""
@@ -356,6 +684,26 @@ class AbuFeatureAtr(AbuFeatureBase, BuyFeatureMixin):
         atr_dict['{}{}'.format(self.feature_prefix(buy_feature=buy_feature), self.atr_key)] = atr_score
         return atr_dict
 
+    def matrix_key(self):
+        """atr特征矩阵的key：特征类名称，atr周期，一年的交易日数量"""
+        return self.__class__.__name__, self.atr_xd, ABuEnv.g_market_trade_year
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        一次性计算kl_pd中所有交易日的atr特征
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: atr特征字典，eg: {'atr_std': np.array}
+        """
+        ends = _window_ends(kl_pd, combine_kl_pd)
+
+        def _atr_kernel(values, p_ends, lengths):
+            return _rolling_tl_score(values, p_ends, lengths, self.atr_xd)
+
+        return {self.atr_key: _round_feature(
+            _pick_windows(kl_pd.atr21.values, combine_kl_pd.atr21.values, ends, ABuEnv.g_market_trade_year,
+                          _atr_kernel))}
+
 
 class AbuFeatureJump(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
     """跳空特征，支持买入，卖出"""
@@ -452,6 +800,23 @@ class AbuFeatureJump(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
 
         return jump_dict
 
+    def matrix_key(self):
+        """跳空特征矩阵的key：特征类名称，一年的交易日数量"""
+        return self.__class__.__name__, ABuEnv.g_market_trade_year
+
+    def calc_feature_matrix(self, kl_pd, combine_kl_pd):
+        """
+        一次性计算kl_pd中所有交易日的跳空特征
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 跳空特征字典，eg: {'jump_down_power': np.array, 'diff_down_days': np.array....}
+        """
+        ends = _window_ends(kl_pd, combine_kl_pd)
+        jumps = _pick_windows(_jump_values(kl_pd), _jump_values(combine_kl_pd), ends, ABuEnv.g_market_trade_year,
+                              _rolling_jump)
+        return {'jump_down_power': np.round(jumps[:, 0], 3), 'diff_down_days': jumps[:, 1].astype(int),
+                'jump_up_power': np.round(jumps[:, 2], 3), 'diff_up_days': jumps[:, 3].astype(int)}
+
 
 class AbuFeatureSnapshot(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
     """
@@ -579,10 +944,47 @@ class AbuMlFeature(object):
         features = list(
             filter(lambda f: f.support_buy_feature() if buy_feature else f.support_sell_feature(), self.features))
         for feature in features:
+            feature_matrix = self._feature_matrix(feature, kl_pd, combine_kl_pd)
+            if feature_matrix is not None:
+                # 支持特征矩阵的特征直接读取day_ind对应的行，加上买入卖出前缀
+                prefix = feature.feature_prefix(buy_feature=buy_feature)
+                ml_feature_dict.update({'{}{}'.format(prefix, key): values[day_ind].item()
+                                        for key, values in feature_matrix.items()})
+                continue
             # 迭代特征序列对象，特征对象统一使用calc_feature接口生成自己的特征，结果特征update到总特征字典ml_feature_dict中
             ml_feature_dict.update(feature.calc_feature(kl_pd, combine_kl_pd, day_ind, buy_feature))
         return ml_feature_dict
 
+    # noinspection PyMethodMayBeStatic
+    def _feature_matrix(self, feature, kl_pd, combine_kl_pd):
+        """
+        获取特征对象在kl_pd上的特征矩阵，没有缓存的情况下使用feature.calc_feature_matrix计算后缓存，
+        不支持特征矩阵或者g_enable_feature_matrix关闭的情况下返回None
+        :param feature: 特征对象，AbuFeatureBase子类实例
+        :param kl_pd: 择时阶段金融时间序列
+        :param combine_kl_pd: 合并择时阶段之前1年的金融时间序列
+        :return: 特征字典，key为去掉买入卖出前缀的特征名称，value为kl_pd中每一个交易日的特征值np.array
+        """
+        matrix_key = feature.matrix_key()
+        if not g_enable_feature_matrix or matrix_key is None or combine_kl_pd is None:
+            return None
+
+        cache_key = id(kl_pd)
+        cache = _g_feature_matrix_cache.get(cache_key)
+        if cache is None or cache[0]() is not kl_pd or cache[1]() is not combine_kl_pd:
+            def _clear(ref, p_key=cache_key):
+                # id可能已经被新的kl_pd复用，只清除自己的缓存
+                if p_key in _g_feature_matrix_cache and _g_feature_matrix_cache[p_key][0] is ref:
+                    _g_feature_matrix_cache.pop(p_key)
+
+            cache = (weakref.ref(kl_pd, _clear), weakref.ref(combine_kl_pd), dict())
+            _g_feature_matrix_cache[cache_key] = cache
+
+        matrices = cache[2]
+        if matrix_key not in matrices:
+            matrices[matrix_key] = feature.calc_feature_matrix(kl_pd, combine_kl_pd)
+        return matrices[matrix_key]
+
     def _get_unzip_feature_keys(self, buy_feature):
         """
         根据buy_feature，过滤出特征序列中支持的特征序列子集，迭代特征序列对象，
@@ -613,24 +1015,17 @@ class AbuMlFeature(object):
             # 收集卖出特征keys
             features_keys.extend(self._get_unzip_feature_keys(False))
 
-            # from ..UtilBu.ABuDTUtil import except_debug
-            # @except_debug
-            def map_str_dict(order, key):
-                if order.sell_type == 'keep' and key.startswith('sell_'):
-                    # 针对卖出特征值，如果单子keep状态，即没有特征值
-                    return np.nan
-
-                if not isinstance(order.ml_features, dict):
-                    # 低版本pandas dict对象取出来会成为str
-                    map_ast = ast.literal_eval(order.ml_features)[key]
-                else:
-                    map_ast = order.ml_features[key]
-
-                return map_ast
+            # 低版本pandas dict对象取出来会成为str，每一个单子的特征字典只解析一次
+            ml_features = [ml_feature if isinstance(ml_feature, dict) else ast.literal_eval(ml_feature)
+                           for ml_feature in orders_pd['ml_features'].values]
+            keep = (orders_pd['sell_type'] == 'keep').values
 
             for fk in features_keys:
-                # 迭代所有key，fk做为pd.DataFrame对象orders_pd的新列名，
-                orders_pd[fk] = orders_pd.apply(map_str_dict, axis=1, args=(fk,))
+                # 迭代所有key，fk做为pd.DataFrame对象orders_pd的新列名，针对卖出特征值，如果单子keep状态，即没有特征值
+                is_sell_key = fk.startswith('sell_')
+                orders_pd[fk] = pd.Series([np.nan if is_sell_key and order_keep else ml_feature[fk]
+                                           for ml_feature, order_keep in zip(ml_features, keep)],
+                                          index=orders_pd.index)
 
 
 class AbuFeatureDegExtend(AbuFeatureBase, BuyFeatureMixin, SellFeatureMixin):
@@ -2,6 +2,7 @@ from __future__ import absolute_import
 
 from .ABuBenchmark import AbuBenchmark
 from .ABuCapital import AbuCapital
+from .ABuCapitalLedger import AbuCapitalLedger
 from .ABuKLManager import AbuKLManager
 from .ABuOrder import AbuOrder
 
@@ -19,6 +20,7 @@ from . import ABuTradeProxy
 __all__ = [
     'AbuBenchmark',
     'AbuCapital',
+    'AbuCapitalLedger',
     'AbuKLManager',
     'AbuOrder',
     'AbuOrderPdProxy',
@@ -8,6 +8,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import functools
+import os
 import weakref
 from abc import ABCMeta, abstractmethod
 
@@ -43,6 +44,18 @@ class UmpDict(dict):
     pass
 
 
+def _ump_file_sig(name):
+    """
+    裁判本地文件的签名：(修改时间，文件大小，inode，状态改变时间)，文件不存在返回None，
+    文件系统修改时间精度不够或者同一时间精度内两次写入时只比较修改时间无法发现文件改变，一并比较文件大小等
+    """
+    if not ABuFileUtil.file_exist(name):
+        return None
+    stat = os.stat(name)
+    return (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size, stat.st_ino,
+            getattr(stat, 'st_ctime_ns', stat.st_ctime))
+
+
 class CachedUmpManager:
     """ump拦截缓存实体，分别在主裁和边裁类中"""
 
@@ -52,6 +65,10 @@ class CachedUmpManager:
     def __init__(self):
         """初始化_cache本体，根据s_use_weak决定使用WeakValueDictionary或者dict"""
         self._cache = weakref.WeakValueDictionary() if CachedUmpManager.s_use_weak else dict()
+        # 缓存的裁判本地文件签名，常驻进程池中的子进程长期持有缓存，本地文件被重新训练覆盖后需要重新load
+        self._cache_sig = dict()
+        # 由裁判决策数据编译生成的预测对象，value为(决策数据, 编译对象)，决策数据重新load后需要重新编译
+        self._compiled = dict()
 
     def get_ump(self, ump):
         """
@@ -73,7 +90,8 @@ class CachedUmpManager:
         """
         # dump_file_fn是每一个具体裁判需要复写的方法，声明自己缓存的存放路径
         name = ump.dump_file_fn()
-        if name not in self._cache:
+        file_sig = _ump_file_sig(name)
+        if name not in self._cache or self._cache_sig.get(name) != file_sig:
             # 不在缓存字典中load_pickle
             dump_clf = ABuFileUtil.load_pickle(name)
             if dump_clf is None:
@@ -84,14 +102,31 @@ class CachedUmpManager:
                 # 如果使用WeakValueDictionary模式，需要进一步使用UmpDict包一层
                 dump_clf = UmpDict(**dump_clf)
             self._cache[name] = dump_clf
+            self._cache_sig[name] = file_sig
         else:
             # 有缓存直接拿缓存
             dump_clf = self._cache[name]
         return dump_clf
 
+    def get_ump_compiled(self, ump, compile_func):
+        """
+        获取由裁判决策数据编译生成的预测对象，eg：边裁的训练集最近邻索引，主裁堆叠后的gmm参数，
+        编译对象与get_ump返回的决策数据一一对应，决策数据重新load后使用compile_func重新编译
+        :param ump: 具体裁判对象，AbuUmpBase对象
+        :param compile_func: 编译函数，参数为get_ump返回的决策数据，返回编译后的预测对象
+        :return: 编译后的预测对象
+        """
+        dump_clf = self.get_ump(ump)
+        name = ump.dump_file_fn()
+        if name not in self._compiled or self._compiled[name][0] is not dump_clf:
+            self._compiled[name] = (dump_clf, compile_func(dump_clf))
+        return self._compiled[name][1]
+
     def clear(self):
         """清除缓存中所有cache ump"""
         self._cache.clear()
+        self._cache_sig.clear()
+        self._compiled.clear()
 
 
 def ump_main_make_xy(func):
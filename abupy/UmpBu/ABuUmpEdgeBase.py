@@ -9,12 +9,15 @@ from __future__ import absolute_import
 
 import logging
 import os
+import time
 from abc import abstractmethod
 
 import numpy as np
+import pandas as pd
 import sklearn.preprocessing as preprocessing
 from enum import Enum
 from sklearn.metrics.pairwise import pairwise_distances
+from sklearn.neighbors import NearestNeighbors
 from ..CoreBu import ABuEnv
 from ..UtilBu import ABuFileUtil
 from ..SimilarBu.ABuCorrcoef import ECoreCorrType, corr_xy
@@ -67,6 +70,151 @@ class EEdgeType(Enum):
 g_similar_type = ECoreCorrType.E_CORE_TYPE_PEARS
 
 
+class AbuEdgeIndex(object):
+    """
+        边裁预测使用的训练集索引：dump_clf时固定的标准化参数，标准化后的训练集矩阵，最近邻索引，以及rk序列，
+        构造一次后缓存在CachedUmpManager中，之后的所有predict都不再需要对训练集重新标准化和计算全部距离
+    """
+
+    def __init__(self, df_x_dict):
+        """
+        :param df_x_dict: 边裁dump_clf序列化的字典对象，包括fiter_df，fiter_x，以及标准化参数scaler_mean，scaler_scale
+        """
+        fiter_df = df_x_dict['fiter_df']
+        fiter_x = np.asarray(df_x_dict['fiter_x'], dtype=np.float64)
+        # 从df_x_dict['fiter_df'].columns中筛选特征列
+        self.feature_columns = fiter_df.columns.drop(['profit', 'profit_cg', 'p_rk_cg', 'rk'])
+        self.rk = fiter_df['rk'].values
+
+        if 'scaler_mean' in df_x_dict and 'scaler_scale' in df_x_dict:
+            self.mean = df_x_dict['scaler_mean']
+            self.scale = df_x_dict['scaler_scale']
+        else:
+            # 旧版本dump_clf没有保存标准化参数，使用训练集重新fit
+            self.mean, self.scale = _fit_edge_scaler(fiter_x)
+        self.x_scaled = (fiter_x - self.mean) / self.scale
+
+        # 取前K_N_TOP_SEED个作为种子继续匹配相似度，训练集不足K_N_TOP_SEED的全部做为种子
+        self.n_top = K_N_TOP_SEED if self.x_scaled.shape[0] > K_N_TOP_SEED else self.x_scaled.shape[0]
+        # 特征维度低，algorithm='auto'下会选择kd_tree或者ball_tree
+        self.nn = NearestNeighbors(n_neighbors=self.n_top, metric='euclidean').fit(self.x_scaled)
+
+    def make_x(self, features):
+        """
+        将需要决策的交易特征转换为特征矩阵
+        :param features: pd.DataFrame对象，dict序列，或者列顺序与feature_columns一致的二维np.array
+        :return: 二维np.array，（交易 × 特征）
+        """
+        if isinstance(features, pd.DataFrame):
+            return features[self.feature_columns].values.astype(np.float64)
+        if isinstance(features, np.ndarray):
+            return features.reshape(-1, len(self.feature_columns)).astype(np.float64)
+        return np.array([[feature[col] for col in self.feature_columns] for feature in features], dtype=np.float64)
+
+    def similar(self, x_scaled, seeds):
+        """
+        第二轮的相似度匹配，一次计算所有交易与各自种子的相似度
+        :param x_scaled: 标准化后的特征矩阵，（交易 × 特征）
+        :param seeds: 标准化后的种子矩阵，（交易 × 种子 × 特征）
+        :return: 相似度矩阵，（交易 × 种子）
+        """
+        if g_similar_type not in (ECoreCorrType.E_CORE_TYPE_PEARS, ECoreCorrType.E_CORE_TYPE_SIGN):
+            # 皮尔逊以外的相似度使用corr_xy逐个计算
+            return np.array([[corr_xy(x, seed, g_similar_type) for seed in x_seeds]
+                             for x, x_seeds in zip(x_scaled, seeds)])
+
+        if g_similar_type == ECoreCorrType.E_CORE_TYPE_SIGN:
+            x_scaled = np.sign(x_scaled)
+            seeds = np.sign(seeds)
+        x_scaled = x_scaled[:, np.newaxis, :]
+        x_center = x_scaled - x_scaled.mean(axis=2, keepdims=True)
+        seed_center = seeds - seeds.mean(axis=2, keepdims=True)
+        x_std = np.sqrt((x_center ** 2).sum(axis=2))
+        seed_std = np.sqrt((seed_center ** 2).sum(axis=2))
+        # 全序列唯一的不能使用相关计算，与corr_xy一致使用相同的数和与总数的比例
+        constant = (x_std == 0) | (seed_std == 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similar = (x_center * seed_center).sum(axis=2) / (x_std * seed_std)
+        return np.where(constant, (x_scaled == seeds).mean(axis=2), similar)
+
+    def predict(self, features):
+        """
+        对多个交易特征一次性进行边裁决策，决策规则与AbuUmpEdgeBase.predict_refit一致
+        :param features: pd.DataFrame对象，dict序列，或者列顺序与feature_columns一致的二维np.array
+        :return: EEdgeType序列
+        """
+        x = self.make_x(features)
+        if x.shape[0] == 0:
+            return []
+        x_scaled = (x - self.mean) / self.scale
+        # 最近邻索引返回的距离已经由小到大排序，第一列即最小距离
+        distances, seed_ind = self.nn.kneighbors(x_scaled, n_neighbors=self.n_top)
+        similar = self.similar(x_scaled, self.x_scaled[seed_ind])
+
+        # 只取大于阀值相似度K_SIMILAR_THRESHOLD的做为最终有投票权利的
+        vote = similar > K_SIMILAR_THRESHOLD
+        seed_rk = self.rk[seed_ind]
+        top_loss_cluster_cnt = np.where(vote & (seed_rk == -1), similar, 0).sum(axis=1)
+        top_win_cluster_cnt = np.where(vote & (seed_rk == 1), similar, 0).sum(axis=1)
+
+        edges = []
+        for min_distance, vote_cnt, win_cnt, loss_cnt in zip(distances[:, 0], vote.sum(axis=1),
+                                                              top_win_cluster_cnt, top_loss_cluster_cnt):
+            if min_distance > K_DISTANCE_THRESHOLD or vote_cnt < int(self.n_top * 0.1):
+                # 最小距离大于阀值或者投票的太少，认为无效
+                edges.append(EEdgeType.E_EEdge_NORMAL)
+            elif int(win_cnt * K_EDGE_JUDGE_RATE) > loss_cnt:
+                edges.append(EEdgeType.E_STORE_TOP_WIN)
+            elif int(loss_cnt * K_EDGE_JUDGE_RATE) > win_cnt:
+                edges.append(EEdgeType.E_EEdge_TOP_LOSS)
+            else:
+                edges.append(EEdgeType.E_EEdge_NORMAL)
+        return edges
+
+
+def _fit_edge_scaler(fiter_x):
+    """
+    使用训练集矩阵fit标准化参数，与preprocessing.StandardScaler一致，方差为0的特征scale为1
+    :param fiter_x: 训练集特征矩阵
+    :return: (mean, scale)
+    """
+    scaler = preprocessing.StandardScaler().fit(np.asarray(fiter_x, dtype=np.float64))
+    scale = scaler.scale_.copy()
+    scale[scale == 0] = 1.0
+    return scaler.mean_, scale
+
+
+def bench_edge_predict(ump_edge, features):
+    """
+    对比逐个交易重新标准化的predict_refit，使用训练集索引的predict，以及批量predict_many三种方式的每秒决策交易数，
+    且三种方式的决策结果与predict_refit不一致的数量一并返回
+    :param ump_edge: AbuUmpEdgeBase子类对象，predict=True
+    :param features: pd.DataFrame对象，或者dict序列
+    :return: pd.DataFrame对象，index为refit，predict，predict_many，columns为orders_per_sec，mismatch
+    """
+    if isinstance(features, pd.DataFrame):
+        features = features.to_dict('records')
+
+    def _consume(func):
+        start = time.time()
+        edges = func()
+        return max(time.time() - start, 1e-9), edges
+
+    # 先进行一次predict，使训练集索引的构造不计算在耗时中
+    ump_edge.predict_many(features[:1])
+    refit_consume, refit_edges = _consume(lambda: [ump_edge.predict_refit(**feature) for feature in features])
+    predict_consume, predict_edges = _consume(lambda: [ump_edge.predict(**feature) for feature in features])
+    many_consume, many_edges = _consume(lambda: ump_edge.predict_many(features))
+
+    def _mismatch(edges):
+        return sum(edge != refit_edge for edge, refit_edge in zip(edges, refit_edges))
+
+    bench = [[len(features) / refit_consume, 0],
+             [len(features) / predict_consume, _mismatch(predict_edges)],
+             [len(features) / many_consume, _mismatch(many_edges)]]
+    return pd.DataFrame(bench, index=['refit', 'predict', 'predict_many'], columns=['orders_per_sec', 'mismatch'])
+
+
 class AbuUmpEdgeBase(AbuUmpBase):
     """边裁基类"""
 
@@ -286,9 +434,11 @@ class AbuUmpEdgeBase(AbuUmpBase):
         """
             边裁的本地序列化相对主裁的dump_clf也简单很多，
             将self.fiter.df和self.fiter.x打包成一个字典对象df_x_dict
-            通过ABuFileUtil.dump_pickle进行保存
+            通过ABuFileUtil.dump_pickle进行保存，同时保存训练集fit的标准化参数，predict时不再重新标准化
         """
-        df_x_dict = {'fiter_df': self.fiter.df, 'fiter_x': self.fiter.x}
+        scaler_mean, scaler_scale = _fit_edge_scaler(self.fiter.x)
+        df_x_dict = {'fiter_df': self.fiter.df, 'fiter_x': self.fiter.x,
+                     'scaler_mean': scaler_mean, 'scaler_scale': scaler_scale}
         """
             eg：df_x_dict
             array([[  3.378,   3.458,   3.458,   1.818],
@@ -314,9 +464,39 @@ class AbuUmpEdgeBase(AbuUmpBase):
         """
         ABuFileUtil.dump_pickle(df_x_dict, self.dump_file_fn(), how='zero')
 
+    def edge_index(self):
+        """
+        从CachedUmpManager中获取由缓存df_x_dict构造的AbuEdgeIndex对象，
+        本地文件被重新训练覆盖后CachedUmpManager重新load，AbuEdgeIndex随之重新构造
+        :return: AbuEdgeIndex对象
+        """
+        return AbuUmpBase.dump_clf_manager.get_ump_compiled(self, AbuEdgeIndex)
+
     def predict(self, **kwargs):
         """
-        边裁交易决策函数，从CachedUmpManager中获取缓存df_x_dict，对kwargs关键字参数所描述的交易特征进行拦截决策
+        边裁交易决策函数，对kwargs关键字参数所描述的交易特征进行拦截决策，决策规则与predict_refit一致，
+        区别在于使用dump_clf时固定的标准化参数，以及训练集的最近邻索引，不再对每一个交易重新标准化整个训练集
+
+        :param kwargs: 需要和子类对象实现的虚方法get_predict_col中获取特征列对应的
+                       关键字参数，eg: buy_deg_ang42=3.378, buy_deg_ang60=3.458
+                                     buy_deg_ang21=3.191, buy_deg_ang252=1.818
+        :return: EEdgeType: 不拦截: EEdgeType.E_EEdge_NORMAL or EEdgeType.E_STORE_TOP_WIN
+                            拦截: EEdgeType.E_EEdge_TOP_LOSS
+        """
+        return self.edge_index().predict([kwargs])[0]
+
+    def predict_many(self, features):
+        """
+        批量边裁交易决策函数，一次对多个交易特征进行拦截决策
+        :param features: pd.DataFrame对象，dict序列，或者列顺序与特征列一致的二维np.array
+        :return: EEdgeType序列，与features中的交易顺序一致
+        """
+        return self.edge_index().predict(features)
+
+    def predict_refit(self, **kwargs):
+        """
+        边裁交易决策函数，从CachedUmpManager中获取缓存df_x_dict，对kwargs关键字参数所描述的交易特征进行拦截决策，
+        每一个交易都和训练集一起重新标准化，保留做为predict的对比基准，见bench_edge_predict
         边裁的predict()实现相对主裁来说比较复杂，大致思路如下：
 
         1. 从输入的新交易中挑选需要的特征组成x
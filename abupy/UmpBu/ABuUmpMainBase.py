@@ -9,6 +9,8 @@ from __future__ import absolute_import
 
 import os
 import copy
+import hashlib
+import tempfile
 from abc import abstractmethod
 import math
 
@@ -28,7 +30,7 @@ from ..UtilBu.ABuProgress import AbuProgress
 from .ABuUmpBase import AbuUmpBase
 from ..CoreBu.ABuFixes import GMM
 from ..UtilBu.ABuProgress import AbuMulPidProgress
-from ..CoreBu.ABuParallel import delayed, Parallel
+from ..CoreBu.ABuParallel import delayed, Parallel, split_parallel_task, parallel_jobs
 from ..UtilBu.ABuDTUtil import plt_show
 
 __author__ = '阿布'
@@ -46,29 +48,104 @@ g_brust_min_step_cnt = 50
 """在不计算全局最优参数brust_min组合情况下的直接使用的默认参数摘取cprs形成llps"""
 g_brust_min_default = (0, 0, 0.65)
 
+"""brust_min是否使用向量化网格评估一次计算所有网格点的improved值，结果与sco.brute一致，设置False使用sco.brute"""
+g_enable_brust_grid = True
+
+"""向量化网格评估中每一批（网格点 × 分类簇）或者（llps × 交易）的元素数量上限，控制中间矩阵的内存占用"""
+g_brust_grid_batch_size = 4 * 1024 * 1024
+
 """代表在ump_main_clf_dump中show_order或者save_order为True的情况下最多绘制和保存的交易快照数量"""
 g_plot_order_max_cnt = 100
 
+"""AbuGMMStack批量计算时每一批中（交易 × gmm × 分类 × 特征）的元素数量上限，控制中间张量的内存占用"""
+g_gmm_stack_batch_size = 4 * 1024 * 1024
 
-def _do_gmm_cluster(sub_ncs, x, df, threshold):
+"""
+    主裁fit中是否缓存每一个分类数量的gmm拟合结果，缓存以训练集特征矩阵的hash做为标识，默认关闭：
+    相同训练集再次fit时直接复用拟合结果，只重新计算分类簇的失败率筛选，训练集变化时（eg：增加了一个月交易后重新训练）
+    使用缓存中相同分类数量之前的拟合结果做为初始参数增量拟合，拟合结果与冷启动不完全一致，依赖缓存文件是否存在
+"""
+g_enable_gmm_fit_cache = False
+
+"""
+    主裁fit中gmm是否使用相邻分类数量的拟合结果做为初始参数热启动，减少kmeans初始化以及em迭代次数，
+    拟合结果与冷启动不完全一致，默认关闭
+"""
+g_enable_gmm_warm_start = False
+
+
+def _gmm_warm_kwargs(prev_clf, component, x):
+    """
+    使用之前的gmm拟合结果prev_clf构造component个分类gmm的初始参数：
+        分类数量相同：直接使用prev_clf的权重，均值，精度矩阵
+        分类数量增加：保留prev_clf的分类，新增分类的中心使用prev_clf下对数似然最低的样本，权重，精度矩阵使用样本所属分类的
+        分类数量减少：保留prev_clf中权重最大的component个分类
+    :param prev_clf: 之前的GaussianMixture拟合结果，只支持full协方差
+    :param component: 分类数量
+    :param x: 主裁训练集特征x矩阵
+    :return: GMM构造参数dict，prev_clf不支持热启动时返回空dict
+    """
+    if getattr(prev_clf, 'covariance_type', None) != 'full' or not hasattr(prev_clf, 'precisions_') \
+            or prev_clf.means_.shape[1] != x.shape[1]:
+        return {}
+
+    weights, means, precisions = prev_clf.weights_, prev_clf.means_, prev_clf.precisions_
+    if component > prev_clf.n_components:
+        add_cnt = component - prev_clf.n_components
+        seed_ind = np.argsort(prev_clf.score_samples(x))[:add_cnt]
+        seed_label = prev_clf.predict(x[seed_ind])
+        weights = np.concatenate([weights, weights[seed_label]])
+        means = np.concatenate([means, x[seed_ind]])
+        precisions = np.concatenate([precisions, precisions[seed_label]])
+    elif component < prev_clf.n_components:
+        keep = np.sort(np.argsort(weights)[::-1][:component])
+        weights, means, precisions = weights[keep], means[keep], precisions[keep]
+    # 提供了全部初始参数，使用random初始化避免再进行一次kmeans
+    return {'weights_init': weights / weights.sum(), 'means_init': means, 'precisions_init': precisions,
+            'init_params': 'random'}
+
+
+def _do_gmm_sweep(sub_ncs, x, result, threshold, fit_cache=None):
     """
     在AbuUmpMainBase中fit并行启动的子进程执行的gmm cluster函数，进程函数，
     在子进程中迭代sub_ncs中的component值代入gmm，通过threshold对gmm cluster
-    结果进行筛选过滤
+    结果进行筛选过滤，进程间只传递特征矩阵以及交易结果序列，不再传递训练集特征pd.DataFrame对象
     :param sub_ncs: 子进程中gmm分类的范围, eg： [10, 11, 12, 13, 14, 15]
-    :param x: 主裁训练集特征x矩阵，numpy矩阵对象
-    :param df: 主裁训练集特征pd.DataFrame对象, 包括x，y
+    :param x: 主裁训练集特征x矩阵，numpy矩阵对象，或者只读npy文件路径，子进程中使用memmap读取
+    :param result: 主裁训练集交易结果序列，np.array对象
     :param threshold:  分类簇中失败率选择的阀值（默认0.65），即大于threshold值的gmm分类簇做为主裁学习目标分类簇
-    :return: clf_component_dict, cluster_df_dict
+    :param fit_cache: 之前的gmm拟合结果缓存，{component: (训练集特征hash, GaussianMixture对象)}，
+                      训练集特征hash相同的直接复用，不同的做为初始参数增量拟合
+    :return: clf_component_dict, cluster_ind_dict: {cluster_df_key: 分类簇中交易的序号序列}，
+             clf_fit_dict: {component: GaussianMixture对象}，即所有component的拟合结果，用来更新缓存
     """
-    clf_component_dict = {}
-    cluster_df_dict = {}
+    if isinstance(x, str):
+        x = np.load(x, mmap_mode='r')
+    x_hash = _gmm_x_hash(x)
+    fit_cache = {} if fit_cache is None else fit_cache
+    result = pd.Series(result, name='result')
 
+    clf_component_dict = {}
+    cluster_ind_dict = {}
+    clf_fit_dict = {}
+    prev_clf = None
     # 启动多进程进度显示AbuMulPidProgress
     with AbuMulPidProgress(len(sub_ncs), 'gmm fit') as progress:
         for epoch, component in enumerate(sub_ncs):
             progress.show(epoch + 1)
-            clf = GMM(component, random_state=3).fit(x)
+            cache_hash, cache_clf = fit_cache.get(component, (None, None))
+            if cache_hash == x_hash:
+                # 相同的训练集特征，直接复用之前的拟合结果
+                clf = cache_clf
+            else:
+                # 训练集变化，使用缓存中相同分类数量之前的拟合结果增量拟合，开启热启动时其次使用相邻分类数量的拟合结果
+                warm_clf = cache_clf
+                if warm_clf is None and g_enable_gmm_warm_start:
+                    warm_clf = prev_clf
+                warm_kwargs = {} if warm_clf is None else _gmm_warm_kwargs(warm_clf, component, x)
+                clf = GMM(component, random_state=3, **warm_kwargs).fit(x)
+            clf_fit_dict[component] = clf
+            prev_clf = clf
             cluster = clf.predict(x)
             """
                 eg：component=14, cluster形式如：
@@ -77,9 +154,7 @@ def _do_gmm_cluster(sub_ncs, x, df, threshold):
                         ....... 1,  1,  5,  7,  5,  7,  0,  8, 13, 10, 10,  2,  2,  7, 12,
                       12, 13,  7,  7, 13, 13]
             """
-            # 只是临时保存一下分类簇序号，因为要使用pd.crosstab，下一个迭代中新的cluster又会生成
-            df['cluster'] = cluster
-            xt = pd.crosstab(df['cluster'], df['result'])
+            xt = pd.crosstab(pd.Series(cluster, name='cluster'), result)
             """
                 xt形如: 即gmm分类簇中每一个子分类的失败交易和盈利交易的数量统计
                 result       0      1
@@ -90,7 +165,7 @@ def _do_gmm_cluster(sub_ncs, x, df, threshold):
                 .....................
             """
             # 进行一次cluster数量的淘汰，无法准确量化某一个分类数量少于多少为不正常，这里范定义总交易数的1/1000
-            xt = xt[xt.sum(axis=1) > (df.shape[0] / 1000)]
+            xt = xt[xt.sum(axis=1) > (result.shape[0] / 1000)]
 
             xt_pct = xt.div(xt.sum(1).astype(float), axis=0)
             """
@@ -128,33 +203,154 @@ def _do_gmm_cluster(sub_ncs, x, df, threshold):
                         Int64Index([7, 8, 9, 10], dtype='int64', name='cluster'))}
                 """
                 # component下的大于阀值的子分类cluster_ind进行迭代
-                for cluster in cluster_ind:
+                for cluster_label in cluster_ind:
                     # cluster_df_key = component + cluster, eg: '14_7'
-                    cluster_df_key = '{0}_{1}'.format(component, cluster)
-                    # 从df中取出cluster对于的子pd.DataFrame对象cluster_df
-                    cluster_df = df[df['cluster'] == cluster]
-                    """
-                        eg: cluster_df
-                                    result  buy_deg_ang42  buy_deg_ang252  buy_deg_ang60  \
-                        2014-11-11       1          8.341          -9.450          0.730
-                        2015-10-28       0          7.144          -9.818         -3.886
-                        2015-11-04       0         12.442         -10.353          3.313
-                        2016-03-30       0         13.121          -8.461          4.498
-                        2016-04-15       0          4.238         -13.247          4.693
-                        2016-04-15       0          4.238         -13.247          4.693
-
-                                    buy_deg_ang21  ind  cluster
-                        2014-11-11         12.397    7        7
-                        2015-10-28          6.955   39        7
-                        2015-11-04          7.840   41        7
-                        2016-03-30          4.070   49        7
-                        2016-04-15          1.162   53        7
-                        2016-04-15          1.162   54        7
-                    """
-                    # 以cluster_df_key做为key， value=cluster_df保存在cluster_df_dict中
-                    cluster_df_dict[cluster_df_key] = cluster_df
-
-    return clf_component_dict, cluster_df_dict
+                    cluster_df_key = '{0}_{1}'.format(component, cluster_label)
+                    # 只保存分类簇中交易的序号，在主进程中通过序号从训练集特征中取出cluster_df
+                    cluster_ind_dict[cluster_df_key] = (cluster_label, np.flatnonzero(cluster == cluster_label))
+
+    return clf_component_dict, cluster_ind_dict, clf_fit_dict
+
+
+def _make_cluster_df_dict(df, cluster_ind_dict):
+    """
+    通过_do_gmm_sweep返回的分类簇交易序号，从训练集特征df中取出每一个分类簇的子pd.DataFrame对象cluster_df
+    :param df: 主裁训练集特征pd.DataFrame对象, 包括x，y
+    :param cluster_ind_dict: {cluster_df_key: (分类簇序号, 分类簇中交易的序号序列)}
+    :return: cluster_df_dict
+    """
+    cluster_df_dict = {}
+    for cluster_df_key, (cluster_label, ind) in cluster_ind_dict.items():
+        cluster_df = df.iloc[ind].assign(cluster=cluster_label)
+        """
+            eg: cluster_df
+                        result  buy_deg_ang42  buy_deg_ang252  buy_deg_ang60  \
+            2014-11-11       1          8.341          -9.450          0.730
+            2015-10-28       0          7.144          -9.818         -3.886
+            2015-11-04       0         12.442         -10.353          3.313
+            2016-03-30       0         13.121          -8.461          4.498
+            2016-04-15       0          4.238         -13.247          4.693
+            2016-04-15       0          4.238         -13.247          4.693
+
+                        buy_deg_ang21  ind  cluster
+            2014-11-11         12.397    7        7
+            2015-10-28          6.955   39        7
+            2015-11-04          7.840   41        7
+            2016-03-30          4.070   49        7
+            2016-04-15          1.162   53        7
+            2016-04-15          1.162   54        7
+        """
+        # 以cluster_df_key做为key， value=cluster_df保存在cluster_df_dict中
+        cluster_df_dict[cluster_df_key] = cluster_df
+    return cluster_df_dict
+
+
+def _do_gmm_cluster(sub_ncs, x, df, threshold):
+    """
+    在子进程中迭代sub_ncs中的component值代入gmm，通过threshold对gmm cluster结果进行筛选过滤，
+    封装_do_gmm_sweep，返回cluster_df_dict
+    :param sub_ncs: 子进程中gmm分类的范围, eg： [10, 11, 12, 13, 14, 15]
+    :param x: 主裁训练集特征x矩阵，numpy矩阵对象
+    :param df: 主裁训练集特征pd.DataFrame对象, 包括x，y
+    :param threshold:  分类簇中失败率选择的阀值（默认0.65），即大于threshold值的gmm分类簇做为主裁学习目标分类簇
+    :return: clf_component_dict, cluster_df_dict
+    """
+    clf_component_dict, cluster_ind_dict, _ = _do_gmm_sweep(sub_ncs, x, df['result'].values, threshold)
+    return clf_component_dict, _make_cluster_df_dict(df, cluster_ind_dict)
+
+
+def _gmm_x_hash(x):
+    """训练集特征矩阵的hash，做为gmm拟合结果缓存的标识，热启动开关不同拟合结果不同，一并计算"""
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    md5 = hashlib.md5()
+    md5.update(str(x.shape).encode('utf-8'))
+    md5.update(x.tobytes())
+    md5.update(str(g_enable_gmm_warm_start).encode('utf-8'))
+    return md5.hexdigest()
+
+
+class AbuGMMStack(object):
+    """
+        主裁clf_cluster_dict中的所有gmm堆叠为均值，precision cholesky，权重张量，一次计算多个交易特征在所有gmm上的分类，
+        clf_cluster_dict中多个(clf, cluster)共享同一个gmm对象，每一个gmm只计算一次，之后通过cluster映射为命中统计
+    """
+
+    def __init__(self, clf_cluster_dict):
+        """
+        :param clf_cluster_dict: 主裁dump_clf序列化的字典对象，value为(GaussianMixture对象，cluster)
+        """
+        clfs = []
+        clf_ind = dict()
+        entry_clf = []
+        entry_cluster = []
+        for clf, cluster in clf_cluster_dict.values():
+            if id(clf) not in clf_ind:
+                clf_ind[id(clf)] = len(clfs)
+                clfs.append(clf)
+            entry_clf.append(clf_ind[id(clf)])
+            entry_cluster.append(cluster)
+        self.clfs = clfs
+        # 每一个(clf, cluster)对应的gmm序号以及cluster
+        self.entry_clf = np.array(entry_clf, dtype=int)
+        self.entry_cluster = np.array(entry_cluster, dtype=int)
+
+        # 只有full covariance的GaussianMixture进行堆叠，其它的gmm使用clf.predict
+        self.stack_ind = [ind for ind, clf in enumerate(clfs) if getattr(clf, 'covariance_type', None) == 'full'
+                          and hasattr(clf, 'precisions_cholesky_')]
+        self.other_ind = [ind for ind in range(len(clfs)) if ind not in set(self.stack_ind)]
+        if len(self.stack_ind) > 0:
+            self._stack([clfs[ind] for ind in self.stack_ind])
+
+    def _stack(self, clfs):
+        """将full covariance的gmm的参数堆叠为（gmm × 分类 × ...）的张量，分类数不足的使用权重为0的分类补齐"""
+        n_features = clfs[0].means_.shape[1]
+        k_max = max(clf.means_.shape[0] for clf in clfs)
+        self.precisions_chol = np.tile(np.eye(n_features), (len(clfs), k_max, 1, 1))
+        means = np.zeros((len(clfs), k_max, n_features))
+        log_det = np.zeros((len(clfs), k_max))
+        log_weights = np.full((len(clfs), k_max), -np.inf)
+        for ind, clf in enumerate(clfs):
+            n_components = clf.means_.shape[0]
+            means[ind, :n_components] = clf.means_
+            self.precisions_chol[ind, :n_components] = clf.precisions_cholesky_
+            log_det[ind, :n_components] = np.log(np.diagonal(clf.precisions_cholesky_, axis1=1, axis2=2)).sum(axis=1)
+            log_weights[ind, :n_components] = np.log(clf.weights_)
+        self.means_prec = np.einsum('mkd,mkde->mke', means, self.precisions_chol)
+        self.log_const = log_det + log_weights - 0.5 * n_features * np.log(2 * np.pi)
+
+    def _stack_predict(self, x):
+        """与GaussianMixture.predict一致，分类为加权对数概率最大的分类，返回（交易 × gmm）的分类矩阵"""
+        n_gmm, k_max, n_features = self.means_prec.shape
+        batch = max(1, g_gmm_stack_batch_size // (n_gmm * k_max * n_features))
+        labels = []
+        for start in range(0, x.shape[0], batch):
+            y = np.einsum('nd,mkde->nmke', x[start:start + batch], self.precisions_chol) - self.means_prec
+            log_prob = self.log_const - 0.5 * (y ** 2).sum(axis=3)
+            labels.append(log_prob.argmax(axis=2))
+        return np.concatenate(labels, axis=0)
+
+    def predict(self, x):
+        """
+        计算交易特征在每一个gmm上的分类
+        :param x: 交易特征矩阵，（交易 × 特征）
+        :return: （交易 × gmm）的分类矩阵
+        """
+        labels = np.zeros((x.shape[0], len(self.clfs)), dtype=int)
+        if len(self.stack_ind) > 0:
+            labels[:, self.stack_ind] = self._stack_predict(x)
+        for ind in self.other_ind:
+            labels[:, ind] = self.clfs[ind].predict(x)
+        return labels
+
+    def hit_cnt(self, x):
+        """
+        交易特征分类簇命中统计，即使用clf对x进行predict结果和(clf, cluster)中存储的cluster一致的数量
+        :param x: 交易特征矩阵，（交易 × 特征）
+        :return: 每一个交易的命中数量，一维np.array
+        """
+        if x.shape[0] == 0 or self.entry_clf.shape[0] == 0:
+            return np.zeros(x.shape[0], dtype=int)
+        return (self.predict(x)[:, self.entry_clf] == self.entry_cluster).sum(axis=1)
 
 
 # noinspection PyAttributeOutsideInit
@@ -406,26 +602,43 @@ class AbuUmpMainBase(AbuUmpBase):
             2014-10-29          7.046    4
         """
         clf_component_dict = {}
-        cluster_df_dict = {}
+        cluster_ind_dict = {}
+        clf_fit_dict = {}
+        x = np.asarray(self.fiter().x, dtype=np.float64)
+        result = df['result'].values
+        fit_cache = self._load_gmm_fit_cache()
 
         if self.fiter().df.shape[0] < 1000:
             # 交易单总数小于1000个，单进程
-            clf_component_dict, cluster_df_dict = _do_gmm_cluster(ncs, self.fiter().x, df, threshold)
+            clf_component_dict, cluster_ind_dict, clf_fit_dict = _do_gmm_sweep(ncs, x, result, threshold,
+                                                                               fit_cache)
         else:
             n_jobs = ABuEnv.g_cpu_cnt
-            # 根据进程数切割ncs为n_jobs个子ncs形成ncs_group
-            ncs_group = self._sub_ncs_split(ncs, n_jobs)
-            parallel = Parallel(
-                n_jobs=len(ncs_group), verbose=0, pre_dispatch='2*n_jobs')
-            out = parallel(delayed(_do_gmm_cluster)(sub_ncs, self.fiter().x, df, threshold) for sub_ncs in ncs_group)
+            # 分类数量越大拟合代价越大，以分类数量做为代价提示切割ncs形成ncs_group
+            ncs_group = split_parallel_task(n_jobs, list(ncs), costs=list(ncs))
+            # 训练集特征矩阵只写入一次只读npy文件，子进程通过memmap共享读取，不再pickle传递
+            x_dir = tempfile.mkdtemp(prefix='abu_ump_x_')
+            x_fn = os.path.join(x_dir, 'x.npy')
+            np.save(x_fn, x)
+            try:
+                parallel = Parallel(
+                    n_jobs=parallel_jobs(n_jobs, ncs_group), verbose=0, pre_dispatch='2*n_jobs')
+                out = parallel(delayed(_do_gmm_sweep)(sub_ncs, x_fn, result, threshold,
+                                                      {component: fit_cache[component] for component in sub_ncs
+                                                       if component in fit_cache})
+                               for sub_ncs in ncs_group)
+            finally:
+                ABuFileUtil.del_file(x_dir)
 
             for sub_out in out:
                 # 将每一个进程返回的结果进行合并
                 clf_component_dict.update(sub_out[0])
-                cluster_df_dict.update(sub_out[1])
+                cluster_ind_dict.update(sub_out[1])
+                clf_fit_dict.update(sub_out[2])
 
+        self._dump_gmm_fit_cache(fit_cache, _gmm_x_hash(x), clf_fit_dict)
         self.rts = clf_component_dict
-        self.nts = cluster_df_dict
+        self.nts = _make_cluster_df_dict(df, cluster_ind_dict)
         self.cprs = self._fit_cprs(show=show)
         """
          eg: self.cprs形式如
@@ -448,6 +661,36 @@ class AbuUmpMainBase(AbuUmpBase):
         # noinspection PyTypeChecker
         self._fit_brust_min(brust_min)
 
+    def gmm_fit_cache_fn(self):
+        """
+            主裁gmm拟合结果缓存的存储路径规则：
+            ABuEnv.g_project_cache_dir ＋ 'ump_gmm_fit_' ＋ market_name + self.class_unique_id()
+        """
+        return os.path.join(ABuEnv.g_project_cache_dir,
+                            'ump_gmm_fit_{}_{}'.format(self.market_name, self.class_unique_id()))
+
+    def _load_gmm_fit_cache(self):
+        """读取gmm拟合结果缓存，{component: (训练集特征hash, GaussianMixture对象)}，未开启缓存返回空dict"""
+        if not g_enable_gmm_fit_cache or not ABuFileUtil.file_exist(self.gmm_fit_cache_fn()):
+            return {}
+        fit_cache = ABuFileUtil.load_pickle(self.gmm_fit_cache_fn())
+        return fit_cache if isinstance(fit_cache, dict) else {}
+
+    def _dump_gmm_fit_cache(self, fit_cache, x_hash, clf_fit_dict):
+        """
+        使用本次所有分类数量的拟合结果更新缓存，每一个分类数量只保留最近一次的拟合结果
+        :param fit_cache: _load_gmm_fit_cache读取的缓存
+        :param x_hash: 本次训练集特征矩阵的hash
+        :param clf_fit_dict: {component: GaussianMixture对象}
+        """
+        if not g_enable_gmm_fit_cache or len(clf_fit_dict) == 0:
+            return
+        if all(fit_cache.get(component, (None, None))[0] == x_hash for component in clf_fit_dict):
+            # 全部命中缓存，不需要重新写入
+            return
+        fit_cache.update({component: (x_hash, clf) for component, clf in clf_fit_dict.items()})
+        ABuFileUtil.dump_pickle(fit_cache, self.gmm_fit_cache_fn())
+
     def _fit_cprs(self, show):
         """
         通过self.nts，eg: self.nts字典对象形式如下所示：
@@ -721,16 +964,86 @@ class AbuUmpMainBase(AbuUmpBase):
                         -1.75,  -1.25,  -0.75,  -0.25])
         """
 
+        # 为提高运行效率，不用每次都使用_calc_llps_improved计算
+        self.brust_cache = dict()
+        if g_enable_brust_grid:
+            # 向量化网格评估，一次计算所有网格点
+            return self._brust_grid_min(bnds)
+
         progress = 1
         for bnds_pos in (0, 1, 2):
             progress *= len(np.arange(bnds[bnds_pos].start, bnds[bnds_pos].stop, bnds[bnds_pos].step))
         # 进行最优时使用的进度条
         self.brust_progress = AbuProgress(progress, 0, '{}: brute min progress'.format(self.__class__.__name__))
-        # 为提高运行效率，不用每次都使用_calc_llps_improved计算
-        self.brust_cache = dict()
         brust_result = sco.brute(self.min_func_improved, bnds, full_output=False, finish=None)
         return brust_result
 
+    def _brust_grid_min(self, bnds):
+        """
+        向量化计算sco.brute(self.min_func_improved, bnds, full_output=False, finish=None)，结果与sco.brute一致：
+            1. 与sco.brute一样使用np.mgrid展开bnds形成(lps, lms, lrs)三维网格
+            2. 预先计算每一个分类簇中包含哪些训练集交易，形成（分类簇 × 交易）的成员矩阵
+            3. 分批计算每一个网格点选中的分类簇，即llps，相同的llps只计算一次
+            4. 通过llps与成员矩阵的乘积得到每一个llps下所有可能被拦截的交易（去除重复），计算effect_num，loss_rate，
+               与_calc_llps_improved一样计算improved
+            5. 与sco.brute一样取-improved最小的第一个网格点
+        :param bnds: brust_min中构造的(slice(lps_min, 0, lps_step), slice(lms_min, 0, lms_step),
+                                        slice(lrs_min, lrs_max, lrs_step))
+        :return: 最优参数组合，np.array，eg：array([-0.45, -0.11, 0.77])
+        """
+        grid = np.mgrid[tuple(bnds)]
+        grid_points = grid.reshape(grid.shape[0], -1).T
+
+        # 分类簇成员矩阵：成员矩阵[分类簇序号, 交易序号]
+        cprs_keys = self.cprs.index
+        order_cnt = self.fiter().df.shape[0]
+        member = np.zeros((cprs_keys.shape[0], order_cnt), dtype=np.float32)
+        result = np.zeros(order_cnt)
+        for cluster_pos, component_cluster in enumerate(cprs_keys):
+            cluster_df = self.nts[component_cluster]
+            member[cluster_pos, cluster_df.ind.values] = 1
+            result[cluster_df.ind.values] = cluster_df.result.values
+        loss = (result == 0).astype(np.float32)
+
+        lps = self.cprs['lps'].values
+        lms = self.cprs['lms'].values
+        lrs = self.cprs['lrs'].values
+        # 每一个网格点选中的分类簇，以字节形式做为key，相同的llps只计算一次
+        llps_ind = dict()
+        llps_packed = []
+        grid_llps = np.zeros(grid_points.shape[0], dtype=int)
+        batch_cnt = max(1, g_brust_grid_batch_size // max(cprs_keys.shape[0], 1))
+        for start in np.arange(0, grid_points.shape[0], batch_cnt):
+            batch = grid_points[start:start + batch_cnt]
+            selected = (lps <= batch[:, 0:1]) & (lms <= batch[:, 1:2]) & (lrs >= batch[:, 2:3])
+            packed = np.packbits(selected, axis=1)
+            for pos, row in enumerate(packed):
+                key = row.tobytes()
+                if key not in llps_ind:
+                    llps_ind[key] = len(llps_packed)
+                    llps_packed.append(row)
+                grid_llps[start + pos] = llps_ind[key]
+
+        llps_packed = np.array(llps_packed)
+        improved = np.full(llps_packed.shape[0], -np.inf)
+        batch_cnt = max(1, g_brust_grid_batch_size // max(order_cnt, cprs_keys.shape[0]))
+        for start in np.arange(0, llps_packed.shape[0], batch_cnt):
+            llps_selected = np.unpackbits(llps_packed[start:start + batch_cnt], axis=1)[:, :cprs_keys.shape[0]]
+            # llps下所有可能被拦截的交易，即多个分类簇中的交易去除重复
+            effect = np.dot(llps_selected.astype(np.float32), member) > 0
+            effect_num = effect.sum(axis=1)
+            loss_num = np.dot(effect, loss)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                loss_rate = loss_num / effect_num
+                win_rate = 1 - loss_rate
+                batch_improved = (effect_num / self.fiter.order_has_ret.shape[0]) * (loss_rate - win_rate)
+            # 空的llps对整体效果没有提高，与min_func一致使用-np.inf
+            improved[start:start + batch_cnt] = np.where(effect_num > 0, batch_improved, -np.inf)
+
+        # 与sco.brute一致，-improved最小的第一个网格点
+        best = np.argmin(-improved[grid_llps])
+        return grid_points[best]
+
     def min_func(self, l_pmr):
         """
         使用lps，lms，lrs的特点组合值获取crps的子pd.DataFrame对象：
@@ -979,56 +1292,70 @@ class AbuUmpMainBase(AbuUmpBase):
         # 通过ABuFileUtil.dump_pickle将clf_cluster_dict进行序列化
         ABuFileUtil.dump_pickle(clf_cluster_dict, self.dump_file_fn(), how='zero')
 
+    def gmm_stack(self):
+        """
+        从CachedUmpManager中获取由缓存clf_cluster_dict构造的AbuGMMStack对象，
+        本地文件被重新训练覆盖后CachedUmpManager重新load，AbuGMMStack随之重新构造
+        :return: AbuGMMStack对象
+        """
+        return AbuUmpBase.dump_clf_manager.get_ump_compiled(self, AbuGMMStack)
+
     def predict(self, x, need_hit_cnt=1):
         """
-        主交易决策函数，从CachedUmpManager中获取缓存clf_cluster_dict，迭代ump字典对象，
-        对交易特征形成的x使用字典中元素(clf, cluster)中的clf进行predict
-        结果和 (clf, cluster)中存储的cluster一致的情况下代表hit，最终对交易
+        主交易决策函数，使用AbuGMMStack计算交易特征在clf_cluster_dict中所有(clf, cluster)上的命中数量，
+        使用clf对x进行predict结果和(clf, cluster)中存储的cluster一致的情况下代表hit，最终对交易
         做出决策
 
         :param x: 交易特征形成的x eg: array([[  8.341,  -9.45 ,   0.73 ,  12.397]])
         :param need_hit_cnt: 对交易特征形成的x使用字典中元素(clf, cluster)中的clf进行predict结果和
                             (clf, cluster)中存储的cluster一致的情况下代表hit一次：count_hit += 1
-                            只有当need_hit_cnt == count_hit才最终做出决策对交易进行拦截
+                            只有当count_hit达到need_hit_cnt才最终做出决策对交易进行拦截
 
         :return: 最终做出决策对交易是否进行拦截，拦截即返回1，放行即返回0
         """
+        return int(self.predict_many(x, need_hit_cnt)[0])
 
-        # 统一从CachedUmpManager中获取缓存ump，没有缓存的情况下load_pickle
-        clf_cluster_dict = AbuUmpMainBase.dump_clf_manager.get_ump(self)
+    def predict_many(self, x, need_hit_cnt=1):
         """
-            eg: clf_cluster_dict
-                {
-                '14_7': (GaussianMixture(covariance_type='full', init_params='kmeans', max_iter=100,
-                                        means_init=None, n_components=14, n_init=1, precisions_init=None,
-                                        random_state=3, reg_covar=1e-06, tol=0.001, verbose=0,
-                                        verbose_interval=10, warm_start=False, weights_init=None), 7),
-                '14_8': (GaussianMixture(covariance_type='full', init_params='kmeans', max_iter=100,
-                                        means_init=None, n_components=14, n_init=1, precisions_init=None,
-                                        random_state=3, reg_covar=1e-06, tol=0.001, verbose=0,
-                                        verbose_interval=10, warm_start=False, weights_init=None), 8)
-                ....................................................................................................
-                }
+        批量主交易决策函数，一次对多个交易特征进行拦截决策
+        :param x: 交易特征矩阵，（交易 × 特征）
+        :param need_hit_cnt: 命中数量达到need_hit_cnt才对交易进行拦截
+        :return: 一维np.array，拦截即1，放行即0，与x中的交易顺序一致
         """
-        count_hit = 0
-        # if need_hit_cnt > 1 and len(clf_cluster_dict) < 50:
-        #     need_hit_cnt = 1
-        for clf, cluster in clf_cluster_dict.values():
-            """
-                eg: (clf, cluster)
-                    (GaussianMixture(covariance_type='full', init_params='kmeans', max_iter=100,
-                                        means_init=None, n_components=14, n_init=1, precisions_init=None,
-                                        random_state=3, reg_covar=1e-06, tol=0.001, verbose=0,
-                                        verbose_interval=10, warm_start=False, weights_init=None), 7)
-            """
-            predict_cluster = clf.predict(x)
-            if predict_cluster == cluster:
-                # 即使用clf对x进行predict结果和 (clf, cluster)中存储的cluster一致的情况下代表hit
-                count_hit += 1
-                if need_hit_cnt == count_hit:
-                    # 只有当need_hit_cnt == count_hit才最终做出决策对交易进行拦截，即返回1
-                    return 1
-        return 0
+        hit_cnt = self.hit_cnt_many(x)
+        if need_hit_cnt < 1:
+            # 命中数量从1开始计数，need_hit_cnt < 1永远不会拦截
+            return np.zeros(hit_cnt.shape[0], dtype=int)
+        return (hit_cnt >= need_hit_cnt).astype(int)
+
+    def make_x(self, features, w_col=None):
+        """
+        将交易特征转换为特征矩阵
+        :param features: pd.DataFrame对象，或者交易特征字典序列
+        :param w_col: 自定义特征列，一般不会使用，正常情况从子类对象必须实现的虚方法get_predict_col中获取特征列
+        :return: 二维np.array，（交易 × 特征）
+        """
+        if w_col is None:
+            w_col = self.get_predict_col()
+        if isinstance(features, pd.DataFrame):
+            return features[w_col].values.astype(np.float64)
+        for feature in features:
+            for col in w_col:
+                if col not in feature:
+                    # 如果交易特征中没有某一个特征值，raise ValueError
+                    raise ValueError('col not in kwargs!')
+        return np.array([[feature[col] for col in w_col] for feature in features],
+                        dtype=np.float64).reshape(-1, len(w_col))
+
+    def predict_kwargs_many(self, features, w_col=None, need_hit_cnt=1):
+        """
+        批量主裁交易决策函数，features中每一个交易特征的决策结果与predict_kwargs一致
+        :param features: pd.DataFrame对象，或者交易特征字典序列
+        :param w_col: 自定义特征列，一般不会使用，正常情况从子类对象必须实现的虚方法get_predict_col中获取特征列
+        :param need_hit_cnt: 透传给self.predict_many中need_hit_cnt参数，做为分类簇匹配拦截阀值
+        :return: 一维np.array，拦截即1，放行即0
+        """
+        return self.predict_many(self.make_x(features, w_col), need_hit_cnt)
 
     def predict_kwargs(self, w_col=None, need_hit_cnt=1, **kwargs):
         """
@@ -1264,31 +1591,24 @@ class AbuUmpMainBase(AbuUmpBase):
 
     def hit_cnt(self, x):
         """
-        辅助统计工具函数，从CachedUmpManager中获取缓存clf_cluster_dict，迭代ump字典对象，
-        对交易特征形成的x使用字典中元素(clf, cluster)中的clf进行predict
-        结果和 (clf, cluster)中存储的cluster一致的情况下代表hit
+        辅助统计工具函数，使用AbuGMMStack对交易特征形成的x在clf_cluster_dict中所有(clf, cluster)上进行分类，
+        clf对x进行predict结果和 (clf, cluster)中存储的cluster一致的情况下代表hit
 
         :param x: 交易特征形成的x eg: array([[  8.341,  -9.45 ,   0.73 ,  12.397]])
         :return: kwargs关键字参数所描述的交易特征进行分类簇命中统计，返回int值
         """
+        return int(self.hit_cnt_many(x)[0])
 
-        # 统一从CachedUmpManager中获取缓存ump，没有缓存的情况下load_pickle
-        clf_cluster_dict = AbuUmpBase.dump_clf_manager.get_ump(self)
-        hit_cnt = 0
-        for clf, cluster in clf_cluster_dict.values():
-            """
-                eg: (clf, cluster)
-                    (GaussianMixture(covariance_type='full', init_params='kmeans', max_iter=100,
-                                        means_init=None, n_components=14, n_init=1, precisions_init=None,
-                                        random_state=3, reg_covar=1e-06, tol=0.001, verbose=0,
-                                        verbose_interval=10, warm_start=False, weights_init=None), 7)
-            """
-            predict_cluster = clf.predict(x)
-            if predict_cluster == cluster:
-                # 即使用clf对x进行predict结果和 (clf, cluster)中存储的cluster一致的情况下代表hit
-                hit_cnt += 1
-        # 最终返回交易特征进行分类簇命中统计结果，int值
-        return hit_cnt
+    def hit_cnt_many(self, x):
+        """
+        批量分类簇命中统计
+        :param x: 交易特征矩阵，（交易 × 特征）
+        :return: 一维np.array，每一个交易的命中数量
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x.reshape(1, -1)
+        return self.gmm_stack().hit_cnt(x)
 
     def predict_hit_kwargs(self, w_col=None, **kwargs):
         """
@@ -6,6 +6,8 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import absolute_import
 
+import numpy as np
+
 from ..UtilBu.ABuLazyUtil import LazyFunc
 from ..UtilBu.ABuFileUtil import file_exist
 from ..UtilBu.ABuDelegateUtil import first_delegate_has_method, replace_word_delegate_has_method
@@ -252,7 +254,8 @@ class AbuUmpManager(object):
     def ump_block(self, ml_feature_dict):
         """
         在买入或者卖出因子中make_ump_block_decision方法中使用，决策特定交易是否被拦截，
-        ump_block中首先使用内置ump进行拦截决策，如果不被拦截，使用外部定义的ump进行拦截决策
+        通过ump_block_many使用所有启用的内置ump以及外部定义的ump一起进行拦截决策，主裁使用编译好的
+        AbuGMMStack一次计算全部分类簇的命中数量，决策结果与builtin_ump_block，extend_ump_block依次决策一致
 
         :param ml_feature_dict: 交易所形成的特征字典
                 eg: ml_feature_dict
@@ -265,14 +268,7 @@ class AbuUmpManager(object):
                     'buy_diff_up_days': 2}
         :return: bool, 对ml_feature_dict所描述的交易特征是否进行拦截
         """
-        # 内置ump进行拦截决策
-        if self.builtin_ump_block(ml_feature_dict):
-            return True
-
-        # 外部定义的ump进行拦截决策
-        if self.extend_ump_block(ml_feature_dict):
-            return True
-        return False
+        return bool(self.ump_block_many([ml_feature_dict])[0])
 
     def extend_ump_block(self, ml_feature_dict):
         """
@@ -296,6 +292,20 @@ class AbuUmpManager(object):
             'buy_diff_up_days': 2}
         :return: bool, 对ml_feature_dict所描述的交易特征是否进行拦截
         """
+        for extend_ump, hit_cnt in self._iter_extend_umps():
+            if hit_cnt is not None:
+                if extend_ump.predict_kwargs(need_hit_cnt=hit_cnt, **ml_feature_dict):
+                    return True
+            else:
+                if extend_ump.predict(**ml_feature_dict) == EEdgeType.E_EEdge_TOP_LOSS:
+                    return True
+        return False
+
+    def _iter_extend_umps(self):
+        """
+        迭代外部用户设置的ump，class类型的ump进行实例构造，且将实例的ump对象缓存在类变量中
+        :return: 生成器，元素为(ump对象, hit_cnt)，主裁hit_cnt为predict_kwargs的need_hit_cnt值，边裁hit_cnt为None
+        """
         for extend_ump in self.extend_ump_list:
             class_unique_id = extend_ump.class_unique_id()
             # 由于对外添加ump的接口append_user_ump中参数ump可以是ump class类型，也可以是实例化后的ump object
@@ -327,12 +337,9 @@ class AbuUmpManager(object):
                 except:
                     # 忽略用户自定义factor中关于hit_cnt的任何错误
                     hit_cnt = self.ump_main_user_hit_cnt()
-                if extend_ump.predict_kwargs(need_hit_cnt=hit_cnt, **ml_feature_dict):
-                    return True
+                yield extend_ump, hit_cnt
             else:
-                if extend_ump.predict(**ml_feature_dict) == EEdgeType.E_EEdge_TOP_LOSS:
-                    return True
-        return False
+                yield extend_ump, None
 
     def builtin_ump_block(self, ml_feature_dict):
         """
@@ -391,3 +398,47 @@ class AbuUmpManager(object):
             return True
 
         return False
+
+    def _iter_builtin_umps(self):
+        """
+        迭代通过ABuEnv中的拦截设置启用，且与因子的买入卖出类型匹配的内置ump
+        :return: 生成器，元素为(ump对象, hit_cnt)，主裁hit_cnt为predict_kwargs的need_hit_cnt值，边裁hit_cnt为None
+        """
+        if ABuEnv.g_enable_ump_main_deg_block and self.is_buy_factor == self.ump_main_deg.is_buy_ump():
+            yield self.ump_main_deg, self.ump_main_deg_hit_cnt()
+        if ABuEnv.g_enable_ump_main_jump_block and self.is_buy_factor == self.ump_main_jump.is_buy_ump():
+            yield self.ump_main_jump, self.ump_main_jump_hit_cnt()
+        if ABuEnv.g_enable_ump_main_price_block and self.is_buy_factor == self.ump_main_price.is_buy_ump():
+            yield self.ump_main_price, self.ump_main_price_hit_cnt()
+        if ABuEnv.g_enable_ump_main_wave_block and self.is_buy_factor == self.ump_main_wave.is_buy_ump():
+            yield self.ump_main_wave, self.ump_main_wave_hit_cnt()
+
+        if ABuEnv.g_enable_ump_edge_deg_block and self.is_buy_factor == self.ump_edge_deg.is_buy_ump():
+            yield self.ump_edge_deg, None
+        if ABuEnv.g_enable_ump_edge_price_block and self.is_buy_factor == self.ump_edge_price.is_buy_ump():
+            yield self.ump_edge_price, None
+        if ABuEnv.g_enable_ump_edge_wave_block and self.is_buy_factor == self.ump_edge_wave.is_buy_ump():
+            yield self.ump_edge_wave, None
+        if ABuEnv.g_enable_ump_edge_full_block and self.is_buy_factor == self.ump_edge_full.is_buy_ump():
+            yield self.ump_edge_full, None
+
+    def ump_block_many(self, ml_feature_dicts):
+        """
+        批量拦截决策，所有启用的内置ump以及外部定义的ump，每一个ump一次性对全部交易进行决策，
+        主裁使用predict_kwargs_many，边裁使用predict_many，每一个交易的决策结果与ump_block一致
+
+        :param ml_feature_dicts: 交易所形成的特征字典序列，或者特征列构成的pd.DataFrame对象
+        :return: 一维bool np.array，对每一个交易特征是否进行拦截
+        """
+        block = np.zeros(len(ml_feature_dicts), dtype=bool)
+        if len(ml_feature_dicts) == 0:
+            return block
+
+        for umps in (self._iter_builtin_umps(), self._iter_extend_umps()):
+            for ump, hit_cnt in umps:
+                if hit_cnt is not None:
+                    block |= ump.predict_kwargs_many(ml_feature_dicts, need_hit_cnt=hit_cnt).astype(bool)
+                else:
+                    block |= np.array([edge == EEdgeType.E_EEdge_TOP_LOSS
+                                       for edge in ump.predict_many(ml_feature_dicts)], dtype=bool)
+        return block
@@ -11,6 +11,8 @@ import datetime
 import time
 from datetime import datetime as dt
 
+import numpy as np
+
 from ..CoreBu.ABuFixes import six
 # noinspection PyUnresolvedReferences
 from ..CoreBu.ABuFixes import filter
@@ -211,6 +213,54 @@ def diff(start_date, end_date, check_order=True):
     return (ed - sd).days
 
 
+def date_int_to_datetime64(date_ints):
+    """
+    将int日期序列如20160101批量转换为np.datetime64[D]序列，不使用时间api逐个转换，直接通过年月日的整数运算构造
+    :param date_ints: int日期序列，np.array或者pd.Series等可迭代序列
+    :return: np.datetime64[D]类型的np.array对象
+    """
+    date_ints = np.asarray(date_ints).astype(np.int64)
+    years = date_ints // 10000
+    months = date_ints // 100 % 100
+    days = date_ints % 100
+    month_dt = (years - 1970).astype('datetime64[Y]') + (months - 1).astype('timedelta64[M]')
+    return month_dt.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+
+
+def diff_days(start_dates, end_dates):
+    """
+    diff的批量版本，对两个int日期序列逐个元素计算间隔的天数，与diff(check_order=True)一致，
+    即参数顺序放置不正常的结果也为正数
+    :param start_dates: int日期序列，np.array或者pd.Series等可迭代序列
+    :param end_dates: int日期序列，长度与start_dates一致
+    :return: 间隔天数的np.array对象
+    """
+    delta = date_int_to_datetime64(end_dates) - date_int_to_datetime64(start_dates)
+    return np.abs(delta.astype(np.int64))
+
+
+def datetime64_to_date_int(dts):
+    """
+    date_int_to_datetime64的逆运算，将时间序列批量转换为int日期序列如20160101，不使用strftime逐个转换
+    :param dts: pd.DatetimeIndex或者np.datetime64类型的np.array对象
+    :return: int日期序列，np.int64类型的np.array对象
+    """
+    days = np.asarray(dts).astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    return (years.astype(np.int64) + 1970) * 10000 + ((months - years).astype(np.int64) + 1) * 100 + \
+        (days - months).astype(np.int64) + 1
+
+
+def week_of_date_int(date_ints):
+    """
+    week_of_date的批量版本，输入int日期序列如20160101，通过距离1970-01-01（周四）的天数计算星期几
+    :param date_ints: int日期序列，np.array或者pd.Series等可迭代序列
+    :return: 返回0-6分别代表周一到周日的np.array对象
+    """
+    return (date_int_to_datetime64(date_ints).astype(np.int64) + 3) % 7
+
+
 def current_date_int():
     """
     获取当前时间日期 int值
@@ -12,8 +12,15 @@ import shutil
 from contextlib import contextmanager
 
 import functools
+import numpy as np
 import pandas as pd
 
+try:
+    # 使用memmap的数据块直接构造pd.DataFrame，不进行拷贝
+    from pandas.core.internals import BlockManager, make_block
+except ImportError:
+    BlockManager = make_block = None
+
 from .ABuDTUtil import warnings_filter
 # noinspection PyUnresolvedReferences
 from ..CoreBu.ABuFixes import pickle, Pickler, Unpickler, as_bytes
@@ -28,6 +35,18 @@ K_SET_PICKLE_HIGHEST_PROTOCOL = False
 """HDF5内部存贮依然会使用pickle，即python版本切换，本地文件会有协议冲突：python2, python3协议兼容模式，使用protocol=0"""
 K_SET_PICKLE_ZERO_PROTOCOL = False
 
+"""npy列存储文件夹中保存index的文件名称"""
+K_NPY_INDEX_FN = '_index.npy'
+"""npy列存储文件夹中保存index名称以及freq的文件名称"""
+K_NPY_INDEX_META_FN = '_index_meta.npy'
+"""npy列存储文件夹中保存列名称的文件名称"""
+K_NPY_COLUMNS_FN = '_columns.npy'
+"""
+    npy列存储文件夹中保存每一列所在数据块序号的文件名称，相同类型的列合并为一个二维数据块，
+    按数据块序号命名，eg：b0.npy，数据块中的列按照列序号排列
+"""
+K_NPY_BLOCKS_FN = '_blocks.npy'
+
 
 def ensure_dir(a_path):
     """
@@ -369,6 +388,148 @@ def load_df_csv(file_name):
     return None
 
 
+def _fixed_dtype_values(values):
+    """object类型序列无法memmap读取，转换为定长的unicode类型序列"""
+    values = np.asarray(values)
+    if values.dtype == np.object_:
+        values = values.astype(np.unicode_)
+    return values
+
+
+def dump_df_npy(dir_name, df):
+    """
+    将pd.DataFrame对象的index以及相同类型的列合并后的数据块分别保存为定长类型的npy文件，dir_name文件夹下：
+    _index.npy，_index_meta.npy，_columns.npy，_blocks.npy，b0.npy，b1.npy...，先写入临时文件夹，全部写入完成后替换dir_name，
+    即其它进程不会读取到写入一半的数据
+    :param dir_name: 保存npy文件的文件夹名称
+    :param df: 需要保存的pd.DataFrame对象
+    """
+    if df is None:
+        return
+    tmp_dir = '{}.tmp{}'.format(dir_name, os.getpid())
+    del_file(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    index = df.index.values
+    if isinstance(df.index, pd.DatetimeIndex):
+        index = df.index.values.astype('datetime64[ns]')
+    np.save(os.path.join(tmp_dir, K_NPY_INDEX_FN), _fixed_dtype_values(index))
+    # index名称以及freq，读取时还原，与原始的pd.DataFrame对象保持一致
+    np.save(os.path.join(tmp_dir, K_NPY_INDEX_META_FN),
+            np.array([df.index.name, getattr(df.index, 'freqstr', None)], dtype=np.object_))
+    np.save(os.path.join(tmp_dir, K_NPY_COLUMNS_FN), np.array([str(col) for col in df.columns], dtype=np.unicode_))
+    col_values = [_fixed_dtype_values(df.iloc[:, ind].values) for ind in range(df.shape[1])]
+    # 按照类型第一次出现的顺序为每一列分配数据块序号
+    block_dtypes = []
+    for values in col_values:
+        if values.dtype not in block_dtypes:
+            block_dtypes.append(values.dtype)
+    col_blocks = np.array([block_dtypes.index(values.dtype) for values in col_values], dtype=np.int64)
+    np.save(os.path.join(tmp_dir, K_NPY_BLOCKS_FN), col_blocks)
+    for block_ind, dtype in enumerate(block_dtypes):
+        # 数据块形状为(列数量，行数量)，与pandas内部数据块一致，读取时可以直接做为pandas的数据块
+        block = np.vstack([col_values[ind] for ind in np.flatnonzero(col_blocks == block_ind)]).astype(dtype)
+        np.save(os.path.join(tmp_dir, 'b{}.npy'.format(block_ind)), block)
+
+    replace_dir(tmp_dir, dir_name)
+
+
+def replace_dir(src_dir, dst_dir):
+    """
+    使用写入完成的src_dir文件夹替换dst_dir文件夹：先将旧的dst_dir文件夹rename到一边，再将src_dir
+    rename为dst_dir，最后删除旧的文件夹，不直接删除dst_dir，其它进程读取时dst_dir不存在的时间窗口只有
+    两次rename之间，windows上rename的目标也不能存在，旧的文件夹中的文件可能正在被其它进程memmap读取，
+    删除失败时留给之后的替换删除
+    :param src_dir: 写入完成的临时文件夹
+    :param dst_dir: 需要替换的目标文件夹，可以不存在
+    """
+    old_dir = '{}.old{}'.format(dst_dir, os.getpid())
+    del_file(old_dir)
+    if file_exist(dst_dir):
+        os.rename(dst_dir, old_dir)
+    os.rename(src_dir, dst_dir)
+    try:
+        del_file(old_dir)
+    except (IOError, OSError):
+        logging.info('replace_dir del {} failed!'.format(old_dir))
+
+
+def load_npy_columns(dir_name, mmap_mode='r'):
+    """
+    读取dump_df_npy保存的index以及每一列数据，默认只读memmap方式读取，多个进程同时读取共享系统页缓存，不进行拷贝
+    :param dir_name: 保存npy文件的文件夹名称
+    :param mmap_mode: np.load中的mmap_mode参数，默认'r'，None即全部读取到内存
+    :return: (index序列, 列名称序列, 列数据序列)，文件夹不存在返回None
+    """
+    npy_blocks = _load_npy_blocks(dir_name, mmap_mode=mmap_mode)
+    if npy_blocks is None:
+        return None
+    index, columns, blocks = npy_blocks
+    values = [None] * len(columns)
+    for block, placement in blocks:
+        for row, ind in enumerate(placement):
+            # 数据块中的一行即一列数据，不进行拷贝
+            values[ind] = block[row]
+    return index, columns, values
+
+
+def _load_npy_blocks(dir_name, mmap_mode='r'):
+    """
+    读取dump_df_npy保存的index以及每一个数据块
+    :return: (index序列, 列名称序列, [(数据块，数据块中的列序号序列)...])，文件夹不存在返回None
+    """
+    if not file_exist(dir_name):
+        return None
+    index = np.load(os.path.join(dir_name, K_NPY_INDEX_FN), mmap_mode=mmap_mode)
+    columns = np.load(os.path.join(dir_name, K_NPY_COLUMNS_FN)).tolist()
+    col_blocks = np.load(os.path.join(dir_name, K_NPY_BLOCKS_FN))
+    blocks = [(np.load(os.path.join(dir_name, 'b{}.npy'.format(block_ind)), mmap_mode=mmap_mode),
+               np.flatnonzero(col_blocks == block_ind)) for block_ind in range(col_blocks.max() + 1)] \
+        if col_blocks.shape[0] > 0 else []
+    return index, columns, blocks
+
+
+def load_df_npy(dir_name):
+    """
+    从dump_df_npy保存的npy文件夹中实例化pd.DataFrame对象，数值列直接使用copy-on-write方式memmap的数据块
+    做为pd.DataFrame的数据块，不进行拷贝，多个进程读取共享系统页缓存，返回的pd.DataFrame可以正常修改，
+    修改时只有被写入的内存页拷贝为进程私有，不会写回npy文件，pandas内部接口不可用时退化为拷贝构造
+    :param dir_name: 保存npy文件的文件夹名称
+    :return: pd.DataFrame对象
+    """
+    npy_blocks = _load_npy_blocks(dir_name, mmap_mode='c')
+    if npy_blocks is None:
+        return None
+    index, columns, blocks = npy_blocks
+    index_name, index_freq = None, None
+    index_meta_fn = os.path.join(dir_name, K_NPY_INDEX_META_FN)
+    if file_exist(index_meta_fn):
+        index_name, index_freq = np.load(index_meta_fn, allow_pickle=True).tolist()
+    # index需要主动拷贝，只读的index在pandas的索引查询中会出错
+    if np.asarray(index).dtype.kind == 'M':
+        index = pd.DatetimeIndex(np.array(index), name=index_name, freq=index_freq)
+    else:
+        index = pd.Index(np.array(index), name=index_name)
+    if BlockManager is not None and make_block is not None:
+        try:
+            df_blocks = []
+            for block, placement in blocks:
+                if block.dtype.kind in ('U', 'S'):
+                    # 保存时object类型转换为定长unicode，还原为object类型需要拷贝
+                    block = block.astype(np.object_)
+                df_blocks.append(make_block(block, placement=placement))
+            return pd.DataFrame(BlockManager(df_blocks, [pd.Index(columns), index]))
+        except Exception as e:
+            # pandas内部接口改变时退化为拷贝构造
+            logging.debug('load_df_npy block manager error: {}'.format(e))
+
+    values = [None] * len(columns)
+    for block, placement in blocks:
+        for row, ind in enumerate(placement):
+            values[ind] = block[row]
+    return pd.DataFrame(dict(zip(columns, values)), index=index, columns=columns)
+
+
 def save_file(ct, file_name):
     """
     将内容ct保存文件
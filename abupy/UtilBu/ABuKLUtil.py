@@ -18,18 +18,25 @@ from __future__ import print_function
 from collections import Iterable
 
 import logging
+import weakref
 
 import numpy as np
 import pandas as pd
 
 from ..CoreBu import ABuEnv
-from ..CoreBu.ABuPdHelper import pd_resample
+from ..CoreBu.ABuPdHelper import pd_resample, pd_rolling_max, pd_rolling_min
 
 __author__ = '阿布'
 __weixin__ = 'abu_quant'
 
 log_func = logging.info if ABuEnv.g_is_ipython else print
 
+"""
+    滚动最值缓存，key为id(kl_pd)，value为(kl_pd弱引用，{(列名称，周期，max or min): np.array})，
+    kl_pd被回收后通过弱引用回调清除
+"""
+_g_rolling_extremum_cache = dict()
+
 
 def _df_dispatch(df, dispatch_func):
     """
@@ -378,3 +385,35 @@ def date_week_wave(df):
         return dww
 
     return _df_dispatch_concat(df, _date_week_wave)
+
+
+def rolling_extremum(kl_pd, xd, how='max', col='close'):
+    """
+    kl_pd中col列每一个交易日截止当天xd个交易日的最大值或者最小值，即第i个值与kl_pd[col][i - xd + 1:i + 1].max()一致，
+    i < xd - 1时为截止当天所有交易日的最值，相同的kl_pd，col，xd只计算一次，所有使用相同周期的因子共享同一个序列
+    :param kl_pd: 金融时间序列，pd.DataFrame对象
+    :param xd: 周期，int
+    :param how: 'max' or 'min'
+    :param col: 计算最值的列名称，默认'close'
+    :return: np.array对象，长度与kl_pd一样，不要修改返回的序列
+    """
+    if how not in ('max', 'min'):
+        raise ValueError('how must be max or min!')
+    cache_key = id(kl_pd)
+    cache = _g_rolling_extremum_cache.get(cache_key)
+    if cache is None or cache[0]() is not kl_pd:
+        def _clear(ref, p_key=cache_key):
+            # id可能已经被新的kl_pd复用，只清除自己的缓存
+            if p_key in _g_rolling_extremum_cache and _g_rolling_extremum_cache[p_key][0] is ref:
+                _g_rolling_extremum_cache.pop(p_key)
+
+        cache = (weakref.ref(kl_pd, _clear), dict())
+        _g_rolling_extremum_cache[cache_key] = cache
+
+    extremums = cache[1]
+    extremum_key = (col, xd, how)
+    if extremum_key not in extremums:
+        # min_periods=1与切片后max，min一样忽略nan
+        rolling_func = pd_rolling_max if how == 'max' else pd_rolling_min
+        extremums[extremum_key] = rolling_func(kl_pd[col], window=xd, min_periods=1).values
+    return extremums[extremum_key]
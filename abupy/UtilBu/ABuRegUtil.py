@@ -8,9 +8,11 @@ from __future__ import print_function
 from __future__ import absolute_import
 
 import math
+import time
 import logging
 
 import numpy as np
+import pandas as pd
 import seaborn as sns
 from matplotlib import pyplot as plt
 from statsmodels import api as sm, regression
@@ -24,6 +26,12 @@ from ..UtilBu.ABuStatsUtil import euclidean_distance_xy, manhattan_distances_xy,
 
 log_func = logging.info if ABuEnv.g_is_ipython else print
 
+"""
+    calc_regress_deg在不需要可视化的情况下是否使用前缀和闭式解计算拟合角度，
+    与statsmodels OLS拟合的结果一致，默认开启，设置False使用statsmodels OLS拟合
+"""
+g_enable_regress_deg_kernel = True
+
 
 def regress_xy(x, y, mode=True, zoom=False, show=False):
     """
@@ -96,6 +104,10 @@ def calc_regress_deg(y, show=True):
     :param show: 是否可视化结果
     :return: deg角度float值
     """
+    if not show and g_enable_regress_deg_kernel:
+        # 不需要可视化的情况下使用闭式解，不再构造statsmodels OLS模型
+        return _regress_deg_kernel(y)
+
     # 将y值 zoom到与x一个级别
     model, _ = regress_y(y, mode=True, zoom=True, show=show)
     rad = model.params[1]
@@ -104,6 +116,99 @@ def calc_regress_deg(y, show=True):
     return deg
 
 
+def _regress_deg_kernel(y):
+    """单个窗口使用闭式解计算拟合角度，与calc_regress_deg的statsmodels OLS拟合结果一致"""
+    y = np.asarray(y, dtype=np.float64)
+    n = y.shape[0]
+    if n < 2:
+        return np.nan
+    x = np.arange(n) - (n - 1) / 2
+    # 将y值zoom到与x一个级别，zoom_factor = x.max() / y.max()
+    slope = np.dot(x, y) / np.dot(x, x) * ((n - 1) / np.nanmax(y))
+    return np.rad2deg(slope)
+
+
+def regress_deg_windows(y, ends, lengths):
+    """
+    使用前缀和一次计算多个窗口[end - length + 1, end]的拟合角度，每一个窗口与calc_regress_deg一致：
+    x使用np.arange(0, length)，将y值zoom到与x一个级别(x.max() / y.max())，之后fit出的斜率转成角度，
+    线性拟合斜率的闭式解：slope = (sum(x * y) - x_mean * sum(y)) / sum((x - x_mean) ** 2)
+    :param y: np.array序列
+    :param ends: 每一个窗口最后一个元素的序号，np.array
+    :param lengths: 每一个窗口的长度，np.array，窗口长度需要一致，或者不一致的窗口都从序列开始，
+                    eg：rolling min_periods的情况
+    :return: 每一个窗口的拟合角度，np.array，长度小于2的窗口角度为nan
+    """
+    y = np.asarray(y, dtype=np.float64)
+    cum_y = np.concatenate(([0.], np.cumsum(y)))
+    cum_ky = np.concatenate(([0.], np.cumsum(np.arange(y.shape[0]) * y)))
+    starts = ends - lengths + 1
+    n = lengths.astype(np.float64)
+    sum_y = cum_y[ends + 1] - cum_y[starts]
+    # 窗口内x从0开始，sum(x * y) = sum(k * y) - start * sum(y)
+    sum_xy = cum_ky[ends + 1] - cum_ky[starts] - starts * sum_y
+    x_mean = (n - 1) / 2
+    sxx = n * (n * n - 1) / 12
+    # zoom_factor = x.max() / y.max()
+    y_max = pd.Series(y).rolling(window=lengths.max(), min_periods=1).max().values[ends]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (sum_xy - x_mean * sum_y) / sxx * ((n - 1) / y_max)
+    return np.rad2deg(np.where(n > 1, slope, np.nan))
+
+
+def calc_regress_deg_rolling(y, window, min_periods=None):
+    """
+    一次计算序列y上所有rolling窗口的拟合角度，每一个窗口的结果与calc_regress_deg(y[end - window + 1: end + 1])一致
+    :param y: 可迭代序列
+    :param window: 拟合窗口大小，int
+    :param min_periods: 窗口最少需要的元素数量，默认None即等于window，元素数量不足的窗口使用从序列开始的全部元素
+    :return: 与y长度一致的np.array，元素数量不足min_periods的位置为nan
+    """
+    y = np.asarray(y, dtype=np.float64)
+    min_periods = window if min_periods is None else min_periods
+    ends = np.arange(y.shape[0])
+    lengths = np.minimum(window, ends + 1)
+    deg = np.full(y.shape[0], np.nan)
+    valid = lengths >= min_periods
+    if valid.any():
+        deg[valid] = regress_deg_windows(y, ends[valid], lengths[valid])
+    return deg
+
+
+def bench_regress_deg(y, window, loop=3):
+    """
+    对比statsmodels OLS拟合，单窗口闭式解，rolling闭式解计算y上所有rolling窗口拟合角度的耗时以及结果差异
+    :param y: 可迭代序列
+    :param window: 拟合窗口大小，int
+    :param loop: 每一种方式重复执行的次数，耗时取最小值
+    :return: pd.DataFrame对象，index为ols，kernel，rolling，columns为windows_per_sec，max_diff
+    """
+    y = np.asarray(y, dtype=np.float64)
+    windows = [y[end - window + 1: end + 1] for end in np.arange(window - 1, y.shape[0])]
+
+    def _ols():
+        return np.array([np.rad2deg(regress_y(w, mode=True, zoom=True, show=False)[0].params[1]) for w in windows])
+
+    def _kernel():
+        return np.array([_regress_deg_kernel(w) for w in windows])
+
+    def _rolling():
+        return calc_regress_deg_rolling(y, window)[window - 1:]
+
+    bench = []
+    base_deg = None
+    for name, func in (('ols', _ols), ('kernel', _kernel), ('rolling', _rolling)):
+        consume = np.inf
+        for _ in np.arange(loop):
+            start = time.time()
+            deg = func()
+            consume = min(consume, time.time() - start)
+        base_deg = deg if base_deg is None else base_deg
+        bench.append([name, len(windows) / consume if consume > 0 else np.inf,
+                      np.abs(deg - base_deg).max() if len(windows) > 0 else 0])
+    return pd.DataFrame(bench, columns=['name', 'windows_per_sec', 'max_diff']).set_index('name')
+
+
 def regress_xy_polynomial(x, y, poly=1, zoom=False, show=False):
     """
     多项式拟合, 根据参数poly决定，返回拟合后的y_fit
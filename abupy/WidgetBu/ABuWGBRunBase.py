@@ -23,7 +23,7 @@ class WidgetEnvSetMixin(object):
         便于上层widgte使用self去获取设置，统一上层使用
         混入类：基础env设置：
         1. 沙盒模式与实时
-        2. csv模式与hdf5模式
+        2. csv模式，hdf5模式与npy模式
         3. 数据获取模式
         4. 数据源切换
     """
@@ -43,11 +43,12 @@ class WidgetEnvSetMixin(object):
         set_mode_label_tip = widgets.Label(u'缓存模式|联网模式|数据源只在开放数据模式下生效：',
                                            layout=widgets.Layout(width='300px', align_items='stretch'))
 
-        """csv模式与hdf5模式模式切换"""
+        """csv模式，hdf5模式与npy模式模式切换"""
         self.store_mode_dict = {EDataCacheType.E_DATA_CACHE_CSV.value: u'csv模式(推荐)',
-                                EDataCacheType.E_DATA_CACHE_HDF5.value: u'hdf5模式'}
+                                EDataCacheType.E_DATA_CACHE_HDF5.value: u'hdf5模式',
+                                EDataCacheType.E_DATA_CACHE_NPY.value: u'npy模式'}
         self.store_mode = widgets.RadioButtons(
-            options=[u'csv模式(推荐)', u'hdf5模式'],
+            options=[u'csv模式(推荐)', u'hdf5模式', u'npy模式'],
             value=self.store_mode_dict[ABuEnv.g_data_cache_type.value],
             description=u'缓存模式:',
             disabled=False